@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Product listing serialization benchmark
+Times GET /api/products?per_page=100 with the listing cache cleared before
+every request, so each response is built and encoded from scratch, under:
+  stdlib      - the json module (Flask's default encoder), to_dict() per product
+  orjson      - the fast provider, to_dict() per product
+  fragments   - the fast provider with warm per-product encoded fragments
+
+Usage: python scripts/bench-json.py [--products 2000] [--requests 300]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from app import create_app, db  # noqa: E402
+from cache import get_catalog_cache  # noqa: E402
+from models import Product  # noqa: E402
+
+
+def build_app(database, backend):
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{database}',
+        'JSON_BACKEND': backend,
+        'METRICS_ENABLED': False,
+        'QUERY_INSPECTION_ENABLED': False,
+    })
+    return app
+
+
+def seed(app, products):
+    with app.app_context():
+        db.create_all()
+        db.session.execute(Product.__table__.insert(), [
+            {
+                'name': f'Product {i}',
+                'description': 'A reasonably detailed benchmark product description ' * 3,
+                'price': 9.99 + i,
+                'category': f'category-{i % 10}',
+                'image_url': f'https://example.com/images/{i}.jpg',
+                'stock_quantity': 100,
+            }
+            for i in range(products)
+        ])
+        db.session.commit()
+
+
+def run(app, requests, pages, keep_fragments):
+    client = app.test_client()
+    with app.app_context():
+        cache = get_catalog_cache()
+
+    timings = []
+    for i in range(requests):
+        cache.listings.clear()
+        if not keep_fragments:
+            cache.fragments.clear()
+        started = time.perf_counter()
+        response = client.get(f'/api/products?per_page=100&page={i % pages + 1}')
+        timings.append(time.perf_counter() - started)
+        assert response.status_code == 200
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Product listing serialization benchmark')
+    parser.add_argument('--products', type=int, default=2000)
+    parser.add_argument('--requests', type=int, default=300)
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='quickcart-json-')
+    database = os.path.join(workdir, 'bench.db')
+    seed(build_app(database, 'stdlib'), args.products)
+    pages = max(1, args.products // 100)
+
+    modes = [
+        ('stdlib', build_app(database, 'stdlib'), False),
+        ('orjson', build_app(database, 'orjson'), False),
+        ('fragments', build_app(database, 'orjson'), True),
+    ]
+    print(f"{'mode':<12}{'req/s':>10}{'mean ms':>10}{'p50 ms':>10}{'p95 ms':>10}")
+    baseline = None
+    for name, app, keep_fragments in modes:
+        run(app, pages, pages, keep_fragments)  # warm up
+        timings = sorted(run(app, args.requests, pages, keep_fragments))
+        mean = statistics.mean(timings)
+        baseline = baseline or mean
+        print(f'{name:<12}{1 / mean:>10.1f}{mean * 1000:>10.2f}'
+              f'{timings[len(timings) // 2] * 1000:>10.2f}{timings[int(len(timings) * 0.95)] * 1000:>10.2f}'
+              f'   {baseline / mean:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+"""
+Password hashing micro-benchmark
+Measures hashes per second for each method, inline on one core and through
+the PasswordHasher process pool, to pick PASSWORD_HASH_METHOD and
+PASSWORD_HASH_WORKERS for a given machine.
+
+Usage: python scripts/bench-password-hash.py [--seconds 3] [--workers 2]
+       [--method pbkdf2:sha256:600000 --method scrypt:32768:8:1]
+"""
+
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from werkzeug.security import generate_password_hash  # noqa: E402
+
+from passwords import PasswordHasher  # noqa: E402
+
+DEFAULT_METHODS = [
+    'pbkdf2:sha256:600000',
+    'pbkdf2:sha256:260000',
+    'scrypt:32768:8:1',
+]
+
+
+def inline_rate(method, seconds):
+    """Hashes per second on the calling thread"""
+    count, started = 0, time.perf_counter()
+    while time.perf_counter() - started < seconds:
+        generate_password_hash('benchmark-password', method)
+        count += 1
+    return count / (time.perf_counter() - started)
+
+
+def pool_rate(method, workers, seconds):
+    """Hashes per second through the pool with one caller per worker"""
+    hasher = PasswordHasher(method=method, workers=workers, max_pending=workers * 2)
+    hasher.hash('warm-up')
+    counts = [0] * workers
+    stop_at = time.perf_counter() + seconds
+
+    def caller(index):
+        while time.perf_counter() < stop_at:
+            hasher.hash('benchmark-password')
+            counts[index] += 1
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=caller, args=(i,)) for i in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    hasher.shutdown()
+    return sum(counts) / elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Password hashing throughput')
+    parser.add_argument('--method', action='append', help='hash method (repeatable)')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--seconds', type=float, default=3)
+    args = parser.parse_args()
+
+    cores = os.cpu_count()
+    print(f'{cores} CPU(s), pool of {args.workers} worker(s)\n')
+    print(f"{'method':<24}{'ms/hash':>10}{'inline/s':>10}{'pool/s':>10}{'pool/s/core':>13}")
+    for method in args.method or DEFAULT_METHODS:
+        inline = inline_rate(method, args.seconds)
+        pooled = pool_rate(method, args.workers, args.seconds)
+        per_core = pooled / min(args.workers, cores)
+        print(f'{method:<24}{1000 / inline:>10.1f}{inline:>10.1f}{pooled:>10.1f}{per_core:>13.1f}')
+
+
+if __name__ == '__main__':
+    main()
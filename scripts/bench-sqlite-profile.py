@@ -0,0 +1,164 @@
+#!/usr/bin/env python3
+"""
+Compare SQLite engine profiles under concurrent reads and writes
+Reader processes run category listing queries while writer processes run
+short stock-update transactions, mimicking catalog browsing during checkouts.
+
+Usage: python scripts/bench-sqlite-profile.py [--products 20000] [--seconds 5]
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server'))
+
+from sqlalchemy import text  # noqa: E402
+from sqlalchemy.exc import OperationalError  # noqa: E402
+
+from database import create_database_engine  # noqa: E402
+
+
+def build_catalog(engine, products):
+    """Create a products table with ``products`` rows"""
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE TABLE products (id INTEGER PRIMARY KEY, name TEXT, description TEXT, "
+            "price REAL, category TEXT, stock_quantity INTEGER)"
+        ))
+        conn.execute(
+            text("INSERT INTO products (name, description, price, category, stock_quantity) "
+                 "VALUES (:name, :description, :price, :category, :stock)"),
+            [
+                {
+                    'name': f'Product {i}',
+                    'description': 'Benchmark product ' * 8,
+                    'price': 9.99,
+                    'category': f'category-{i % 20}',
+                    'stock': 1000000,
+                }
+                for i in range(products)
+            ]
+        )
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def reader(url, profile, args, stop, results):
+    os.environ['DATABASE_URL'] = url
+    engine = create_database_engine(profile)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        category = f'category-{random.randint(0, 19)}'
+        started = time.perf_counter()
+        try:
+            with engine.connect() as conn:
+                # A category listing page with its total, like /api/products
+                conn.execute(text("SELECT count(*) FROM products WHERE category = :c"),
+                             {'c': category}).scalar()
+                conn.execute(text("SELECT * FROM products WHERE category = :c LIMIT 20"),
+                             {'c': category}).all()
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    results.put(('read', latencies, errors))
+
+
+def writer(url, profile, args, stop, results):
+    os.environ['DATABASE_URL'] = url
+    engine = create_database_engine(profile)
+    latencies, errors = [], 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        try:
+            with engine.begin() as conn:
+                for _ in range(args.rows_per_write):
+                    conn.execute(
+                        text("UPDATE products SET stock_quantity = stock_quantity - 1 WHERE id = :id"),
+                        {'id': random.randint(1, args.products)}
+                    )
+                # Work done while the write transaction is open
+                time.sleep(args.write_hold_ms / 1000)
+            latencies.append(time.perf_counter() - started)
+        except OperationalError:
+            errors += 1
+    results.put(('write', latencies, errors))
+
+
+def run_profile(profile, args):
+    """Run the mixed workload against a fresh database with ``profile``
+
+    Every reader and writer is its own process, as with multiple server
+    workers, so the numbers reflect SQLite locking rather than the GIL.
+    """
+    workdir = tempfile.mkdtemp(prefix=f'bench-{profile}-')
+    url = f"sqlite:///{os.path.join(workdir, 'bench.db')}"
+    os.environ['DATABASE_URL'] = url
+    engine = create_database_engine(profile)
+    build_catalog(engine, args.products)
+    engine.dispose()
+
+    stop = multiprocessing.Event()
+    results = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=reader, args=(url, profile, args, stop, results))
+               for _ in range(args.readers)]
+    workers += [multiprocessing.Process(target=writer, args=(url, profile, args, stop, results))
+                for _ in range(args.writers)]
+    for worker in workers:
+        worker.start()
+    time.sleep(args.seconds)
+    stop.set()
+
+    reads, writes, errors = [], [], 0
+    for _ in workers:
+        kind, latencies, worker_errors = results.get()
+        (reads if kind == 'read' else writes).extend(latencies)
+        errors += worker_errors
+    for worker in workers:
+        worker.join()
+
+    return {
+        'profile': profile,
+        'reads_per_sec': len(reads) / args.seconds,
+        'read_p50_ms': percentile(reads, 50) * 1000,
+        'read_p99_ms': percentile(reads, 99) * 1000,
+        'writes_per_sec': len(writes) / args.seconds,
+        'write_p99_ms': percentile(writes, 99) * 1000,
+        'errors': errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--products', type=int, default=20000)
+    parser.add_argument('--seconds', type=float, default=5)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    parser.add_argument('--rows-per-write', type=int, default=5)
+    parser.add_argument('--write-hold-ms', type=float, default=5)
+    args = parser.parse_args()
+
+    print(f"SQLite profile benchmark: {args.products} products, {args.readers} readers, "
+          f"{args.writers} writers, {args.seconds}s per profile")
+    print()
+    print(f"{'profile':<12} {'reads/s':>9} {'read p50':>9} {'read p99':>9} "
+          f"{'writes/s':>9} {'write p99':>10} {'errors':>7}")
+    for profile in ('development', 'production'):
+        result = run_profile(profile, args)
+        print(f"{result['profile']:<12} {result['reads_per_sec']:>9.0f} {result['read_p50_ms']:>7.2f}ms "
+              f"{result['read_p99_ms']:>7.2f}ms {result['writes_per_sec']:>9.1f} "
+              f"{result['write_p99_ms']:>8.2f}ms {result['errors']:>7}")
+    return 0
+
+
+if __name__ == "__main__":
+    exit(main())
@@ -0,0 +1,617 @@
+#!/usr/bin/env python3
+"""
+Mixed-workload load test for the QuickCart API
+Generates a catalog of products, users and orders, boots the API against it
+(or targets a running server), drives a weighted mix of browse, search,
+product detail, cart validation, login and checkout traffic from concurrent
+keep-alive clients, and reports throughput and latency percentiles per
+endpoint. Results are saved as JSON and can be compared between runs.
+
+Usage:
+  python scripts/load-test.py generate --database /tmp/bench.db --products 100000
+  python scripts/load-test.py run --database /tmp/bench.db --concurrency 16 \\
+      --duration 30 --output results/baseline.json
+  python scripts/load-test.py compare results/baseline.json results/candidate.json
+"""
+
+import argparse
+import http.client
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter, defaultdict
+from datetime import datetime, timedelta
+from urllib.parse import urlencode, urlsplit
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'server')
+sys.path.insert(0, SERVER_DIR)
+
+CATEGORIES = ['electronics', 'home', 'sports', 'office', 'toys', 'garden',
+              'kitchen', 'books', 'beauty', 'outdoors', 'music', 'pets']
+ADJECTIVES = ['wireless', 'compact', 'premium', 'ergonomic', 'portable', 'classic',
+              'smart', 'organic', 'vintage', 'rugged', 'deluxe', 'eco']
+NOUNS = ['headphones', 'mug', 'notebook', 'backpack', 'lamp', 'speaker', 'bottle',
+         'jacket', 'charger', 'blender', 'keyboard', 'tent', 'camera', 'chair']
+
+BENCH_PASSWORD = 'benchmark-password'
+BATCH_SIZE = 10000
+
+DEFAULT_MIX = {
+    'browse': 35,
+    'search': 20,
+    'product': 25,
+    'cart_validate': 10,
+    'login': 5,
+    'checkout': 5,
+}
+
+
+def sqlite_url(path):
+    return f'sqlite:///{os.path.abspath(path)}'
+
+
+# ---------------------------------------------------------------------------
+# Catalog generation
+# ---------------------------------------------------------------------------
+
+def _insert_batches(session, table, rows):
+    """Insert an iterable of row dicts with one executemany per batch"""
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) == BATCH_SIZE:
+            session.execute(table.insert(), batch)
+            batch = []
+    if batch:
+        session.execute(table.insert(), batch)
+
+
+def generate_catalog(database, products, users, orders, seed=42):
+    """Create a database with the requested number of rows"""
+    from werkzeug.security import generate_password_hash
+    from app import create_app, db
+    from models import Product, User, Order, OrderItem, InventoryMovement
+
+    if os.path.exists(database):
+        raise SystemExit(f'{database} already exists; remove it or pick another path')
+
+    rng = random.Random(seed)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': sqlite_url(database),
+        'DATABASE_PROFILE': 'production',
+    })
+    started = time.perf_counter()
+
+    with app.app_context():
+        db.create_all()
+        now = datetime.utcnow()
+        stock = 1000000
+
+        _insert_batches(db.session, Product.__table__, (
+            {
+                'id': i,
+                'name': f'{rng.choice(ADJECTIVES).title()} {rng.choice(NOUNS).title()} {i}',
+                'description': ' '.join(rng.choice(ADJECTIVES + NOUNS) for _ in range(12)),
+                'price': round(rng.uniform(2, 500), 2),
+                'category': CATEGORIES[i % len(CATEGORIES)],
+                'image_url': None,
+                'stock_quantity': stock,
+                'created_at': now,
+            }
+            for i in range(1, products + 1)
+        ))
+        # Core inserts bypass the ORM ledger hook, so open each product's
+        # ledger explicitly to keep `inventory audit` balanced
+        _insert_batches(db.session, InventoryMovement.__table__, (
+            {'product_id': i, 'delta': stock, 'reason': 'opening', 'created_at': now}
+            for i in range(1, products + 1)
+        ))
+
+        # Hashing is deliberately slow, so every user shares one hash
+        password_hash = generate_password_hash(BENCH_PASSWORD)
+        _insert_batches(db.session, User.__table__, (
+            {
+                'id': i,
+                'email': f'user{i}@bench.test',
+                'password_hash': password_hash,
+                'first_name': 'Bench',
+                'last_name': f'User {i}',
+                'created_at': now,
+            }
+            for i in range(1, users + 1)
+        ))
+
+        prices = {}
+        order_rows, item_rows = [], []
+        for order_id in range(1, orders + 1):
+            lines = [(rng.randint(1, products), rng.randint(1, 3)) for _ in range(rng.randint(1, 3))]
+            total = 0.0
+            for product_id, quantity in lines:
+                price = prices.setdefault(product_id, round(rng.uniform(2, 500), 2))
+                total += price * quantity
+                item_rows.append({'order_id': order_id, 'product_id': product_id,
+                                  'quantity': quantity, 'price': price})
+            order_rows.append({
+                'id': order_id,
+                'order_number': str(uuid.UUID(int=rng.getrandbits(128))),
+                'user_id': rng.randint(1, users) if users else None,
+                'total_amount': round(total, 2),
+                'status': 'confirmed',
+                'created_at': now - timedelta(minutes=rng.randint(0, 525600)),
+            })
+            if len(order_rows) == BATCH_SIZE:
+                db.session.execute(Order.__table__.insert(), order_rows)
+                db.session.execute(OrderItem.__table__.insert(), item_rows)
+                order_rows, item_rows = [], []
+        if order_rows:
+            db.session.execute(Order.__table__.insert(), order_rows)
+            db.session.execute(OrderItem.__table__.insert(), item_rows)
+
+        db.session.commit()
+        db.session.execute(db.text('ANALYZE'))
+        db.session.commit()
+        db.engine.dispose()
+
+    elapsed = time.perf_counter() - started
+    print(f'Generated {products} products, {users} users and {orders} orders '
+          f'in {database} ({elapsed:.1f}s)')
+
+
+def dataset_counts(database):
+    import sqlite3
+    conn = sqlite3.connect(database)
+    try:
+        return {
+            table: conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('products', 'users', 'orders', 'order_items')
+        }
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Server management
+# ---------------------------------------------------------------------------
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _serve_werkzeug(database, port):
+    from werkzeug.serving import make_server
+    from app import create_app
+
+    logging.getLogger('werkzeug').setLevel(logging.ERROR)
+    app = create_app({
+        'SQLALCHEMY_DATABASE_URI': sqlite_url(database),
+        'DATABASE_PROFILE': 'production',
+        # Every simulated client shares one address
+        'RATE_LIMIT_ENABLED': False,
+        # This process is daemonic and so cannot start a password hashing pool
+        'PASSWORD_HASH_WORKERS': 0,
+    })
+    make_server('127.0.0.1', port, app, threaded=True).serve_forever()
+
+
+def start_server(kind, database):
+    """Boot the API in a separate process; returns (base_url, stop)"""
+    port = _free_port()
+
+    if kind == 'werkzeug':
+        process = multiprocessing.Process(target=_serve_werkzeug, args=(database, port), daemon=True)
+        process.start()
+        stop = process.terminate
+    else:
+        env = dict(os.environ, PORT=str(port), DATABASE_URL=sqlite_url(database),
+                   DATABASE_PROFILE='production', FLASK_ENV='production',
+                   RATE_LIMIT_ENABLED='false')
+        process = subprocess.Popen(
+            [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'wsgi:app'],
+            cwd=SERVER_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        stop = process.terminate
+
+    base_url = f'http://127.0.0.1:{port}'
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            conn = http.client.HTTPConnection('127.0.0.1', port, timeout=2)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return base_url, stop
+        except OSError:
+            time.sleep(0.2)
+    stop()
+    raise SystemExit(f'{kind} server did not become healthy on port {port}')
+
+
+# ---------------------------------------------------------------------------
+# Workload
+# ---------------------------------------------------------------------------
+
+class Client:
+    """One simulated shopper with its own keep-alive connection"""
+
+    def __init__(self, base_url, dataset, rng):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.prefix = parts.path.rstrip('/')
+        self.dataset = dataset
+        self.rng = rng
+        self.token = None
+        self.conn = None
+
+    def request(self, method, path, body=None, headers=None):
+        headers = dict(headers or {})
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        if self.token:
+            headers['Authorization'] = f'Bearer {self.token}'
+
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=30)
+            try:
+                self.conn.request(method, self.prefix + path, payload, headers)
+                response = self.conn.getresponse()
+                return response.status, response.read()
+            except (http.client.HTTPException, OSError):
+                # The server may close idle or recycled keep-alive connections
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+
+    def product_id(self):
+        # Most traffic lands on a small set of popular products
+        products = self.dataset['products']
+        if self.rng.random() < 0.8:
+            return self.rng.randint(1, max(1, products // 100))
+        return self.rng.randint(1, products)
+
+    def cart_items(self, lines):
+        return [{'product_id': self.product_id(), 'quantity': self.rng.randint(1, 2)}
+                for _ in range(lines)]
+
+    def browse(self):
+        params = {'category': self.rng.choice(CATEGORIES), 'per_page': 20}
+        if self.rng.random() < 0.5:
+            params['page'] = self.rng.randint(1, 5)
+        return self.request('GET', '/api/products?' + urlencode(params))
+
+    def search(self):
+        term = self.rng.choice(ADJECTIVES + NOUNS)
+        if self.rng.random() < 0.3:
+            term = f'{term} {self.rng.choice(NOUNS)}'
+        return self.request('GET', '/api/products?' + urlencode({'search': term, 'per_page': 20}))
+
+    def product(self):
+        return self.request('GET', f'/api/products/{self.product_id()}')
+
+    def cart_validate(self):
+        return self.request('POST', '/api/cart/validate',
+                            {'items': self.cart_items(self.rng.randint(1, 4))})
+
+    def login(self):
+        if not self.dataset['users']:
+            return self.request('GET', '/api/health')
+        email = f"user{self.rng.randint(1, self.dataset['users'])}@bench.test"
+        status, body = self.request('POST', '/api/auth/login',
+                                    {'email': email, 'password': BENCH_PASSWORD})
+        if status == 200:
+            self.token = json.loads(body)['token']
+        return status, body
+
+    def checkout(self):
+        return self.request('POST', '/api/checkout', {
+            'items': self.cart_items(self.rng.randint(1, 2)),
+            'payment_method': 'stripe',
+            'shipping_info': {'address': '1 Bench St', 'city': 'Load', 'state': 'TS', 'zip': '00000'},
+        })
+
+
+def parse_mix(text):
+    mix = dict(DEFAULT_MIX)
+    if text:
+        mix = {}
+        for part in text.split(','):
+            name, _, weight = part.partition('=')
+            if name not in DEFAULT_MIX:
+                raise SystemExit(f'Unknown operation {name!r}; choose from {", ".join(DEFAULT_MIX)}')
+            mix[name] = float(weight)
+    return {name: weight for name, weight in mix.items() if weight > 0}
+
+
+def run_workload(base_url, dataset, mix, concurrency, duration, warmup, seed):
+    """Drive the mix from ``concurrency`` closed-loop clients"""
+    samples = defaultdict(list)
+    statuses = defaultdict(Counter)
+    errors = Counter()
+    lock = threading.Lock()
+    names, weights = list(mix), list(mix.values())
+
+    start = time.perf_counter()
+    measure_from = start + warmup
+    stop_at = measure_from + duration
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        client = Client(base_url, dataset, rng)
+        local_samples = defaultdict(list)
+        local_statuses = defaultdict(Counter)
+        local_errors = Counter()
+
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            name = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                status, _ = getattr(client, name)()
+            except (http.client.HTTPException, OSError):
+                status = 'connection_error'
+            elapsed = time.perf_counter() - began
+            if began < measure_from:
+                continue
+            local_statuses[name][str(status)] += 1
+            # Failures, 429s included, answer fast without doing the work, so
+            # they are counted as errors and kept out of the latencies
+            if status == 'connection_error' or status == 429 or status >= 500:
+                local_errors[name] += 1
+            else:
+                local_samples[name].append(elapsed)
+
+        with lock:
+            for name, counts in local_statuses.items():
+                samples[name].extend(local_samples[name])
+                statuses[name].update(counts)
+            errors.update(local_errors)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    return summarize(samples, statuses, errors, duration)
+
+
+def percentile(samples, pct):
+    if not samples:
+        return 0.0
+    return samples[min(len(samples) - 1, int(len(samples) * pct / 100))]
+
+
+def _summary(values, errors, duration):
+    """Attempts and error rate of all requests; throughput and latency of successful ones"""
+    values = sorted(values)
+    attempts = len(values) + errors
+    return {
+        'requests': attempts,
+        'errors': errors,
+        'error_rate': round(errors / attempts * 100, 2) if attempts else 0.0,
+        'throughput_rps': round(len(values) / duration, 2),
+        'latency_ms': {
+            'mean': round(sum(values) / len(values) * 1000, 2) if values else 0.0,
+            'p50': round(percentile(values, 50) * 1000, 2),
+            'p95': round(percentile(values, 95) * 1000, 2),
+            'p99': round(percentile(values, 99) * 1000, 2),
+            'max': round(values[-1] * 1000, 2) if values else 0.0,
+        },
+    }
+
+
+def summarize(samples, statuses, errors, duration):
+    endpoints = {}
+    for name in sorted(statuses):
+        endpoints[name] = _summary(samples[name], errors[name], duration)
+        endpoints[name]['status_codes'] = dict(statuses[name])
+
+    overall = _summary([v for values in samples.values() for v in values],
+                       sum(errors.values()), duration)
+    return {'overall': overall, 'endpoints': endpoints}
+
+
+# ---------------------------------------------------------------------------
+# Reporting
+# ---------------------------------------------------------------------------
+
+def print_report(results):
+    header = f"{'endpoint':<15}{'requests':>10}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'errors':>8}"
+    print(header)
+    print('-' * len(header))
+    rows = list(results['endpoints'].items()) + [('overall', results['overall'])]
+    for name, stats in rows:
+        latency = stats['latency_ms']
+        print(f"{name:<15}{stats['requests']:>10}{stats['throughput_rps']:>10.1f}"
+              f"{latency['p50']:>10.1f}{latency['p95']:>10.1f}{latency['p99']:>10.1f}{stats['errors']:>8}")
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       cwd=SERVER_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _pct_change(old, new):
+    if not old:
+        return 0.0
+    return (new - old) / old * 100
+
+
+def _error_rate(stats):
+    # From the counts, which results saved before error_rate existed also have
+    return stats['errors'] / stats['requests'] * 100 if stats['requests'] else 0.0
+
+
+def compare_results(baseline, candidate, threshold, error_threshold):
+    """Print per-endpoint deltas; returns the list of regressions
+
+    Latency and throughput changes are relative, in percent; error rate
+    changes are absolute, in percentage points.
+    """
+    regressions = []
+    header = (f"{'endpoint':<15}{'req/s':>18}{'p50 ms':>18}{'p95 ms':>18}{'p99 ms':>18}"
+              f"{'errors %':>18}")
+    print(header)
+    print('-' * len(header))
+
+    old_rows = dict(baseline['endpoints'], overall=baseline['overall'])
+    new_rows = dict(candidate['endpoints'], overall=candidate['overall'])
+    for name in [n for n in old_rows if n in new_rows]:
+        old, new = old_rows[name], new_rows[name]
+        cells = []
+        rps_change = _pct_change(old['throughput_rps'], new['throughput_rps'])
+        cells.append(f"{new['throughput_rps']:.1f} ({rps_change:+.0f}%)")
+        if rps_change < -threshold:
+            regressions.append(f'{name} throughput {rps_change:+.1f}%')
+        for key in ('p50', 'p95', 'p99'):
+            change = _pct_change(old['latency_ms'][key], new['latency_ms'][key])
+            cells.append(f"{new['latency_ms'][key]:.1f} ({change:+.0f}%)")
+            if key == 'p95' and change > threshold:
+                regressions.append(f'{name} p95 latency {change:+.1f}%')
+        old_errors, new_errors = _error_rate(old), _error_rate(new)
+        cells.append(f'{new_errors:.1f} ({new_errors - old_errors:+.1f})')
+        if new_errors - old_errors > error_threshold:
+            regressions.append(f'{name} error rate {old_errors:.1f}% -> {new_errors:.1f}%')
+        print(f'{name:<15}' + ''.join(f'{cell:>18}' for cell in cells))
+
+    return regressions
+
+
+# ---------------------------------------------------------------------------
+# Commands
+# ---------------------------------------------------------------------------
+
+def add_dataset_arguments(parser):
+    parser.add_argument('--products', type=int, default=10000)
+    parser.add_argument('--users', type=int, default=1000)
+    parser.add_argument('--orders', type=int, default=10000)
+    parser.add_argument('--seed', type=int, default=42)
+
+
+def command_generate(args):
+    generate_catalog(args.database, args.products, args.users, args.orders, args.seed)
+
+
+def command_run(args):
+    mix = parse_mix(args.mix)
+    workdir = None
+    database = args.database
+
+    if args.url:
+        if not database:
+            raise SystemExit('--url needs --database pointing at the data the server uses')
+    elif not database:
+        workdir = tempfile.mkdtemp(prefix='quickcart-load-')
+        database = os.path.join(workdir, 'bench.db')
+    if not args.url and not os.path.exists(database):
+        generate_catalog(database, args.products, args.users, args.orders, args.seed)
+
+    dataset = dataset_counts(database)
+    stop = None
+    base_url = args.url
+    if not base_url:
+        base_url, stop = start_server(args.server, database)
+
+    print(f"Running {args.duration}s at concurrency {args.concurrency} against {base_url} "
+          f"({dataset['products']} products, {dataset['users']} users, {dataset['orders']} orders)")
+    try:
+        results = run_workload(base_url, dataset, mix, args.concurrency,
+                               args.duration, args.warmup, args.seed)
+    finally:
+        if stop:
+            stop()
+
+    results['meta'] = {
+        'timestamp': datetime.utcnow().isoformat() + 'Z',
+        'git_commit': _git_commit(),
+        'python': platform.python_version(),
+        'cpus': os.cpu_count(),
+        'server': 'external' if args.url else args.server,
+        'concurrency': args.concurrency,
+        'duration_s': args.duration,
+        'warmup_s': args.warmup,
+        'mix': mix,
+        'dataset': dataset,
+    }
+    print_report(results)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f'Saved results to {args.output}')
+
+
+def command_compare(args):
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+
+    regressions = compare_results(baseline, candidate, args.threshold, args.error_threshold)
+    limits = f'{args.threshold:.0f}% or {args.error_threshold:g} error-rate points'
+    if regressions:
+        print(f'\nRegressions beyond {limits}:')
+        for regression in regressions:
+            print(f'  {regression}')
+        sys.exit(1)
+    print(f'\nNo regressions beyond {limits}')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='create a benchmark database')
+    generate.add_argument('--database', required=True)
+    add_dataset_arguments(generate)
+    generate.set_defaults(func=command_generate)
+
+    run = commands.add_parser('run', help='run the mixed workload')
+    run.add_argument('--database', help='existing or to-be-generated database (default: temporary)')
+    run.add_argument('--url', help='target an already running server instead of booting one')
+    run.add_argument('--server', choices=['werkzeug', 'gunicorn'], default='gunicorn')
+    run.add_argument('--concurrency', type=int, default=16)
+    run.add_argument('--duration', type=float, default=30)
+    run.add_argument('--warmup', type=float, default=5)
+    run.add_argument('--mix', help='weights, e.g. browse=35,search=20,product=25,'
+                                   'cart_validate=10,login=5,checkout=5')
+    run.add_argument('--output', help='write results as JSON')
+    add_dataset_arguments(run)
+    run.set_defaults(func=command_run)
+
+    compare = commands.add_parser('compare', help='compare two result files')
+    compare.add_argument('baseline')
+    compare.add_argument('candidate')
+    compare.add_argument('--threshold', type=float, default=10,
+                         help='percent change in p95 or throughput reported as a regression')
+    compare.add_argument('--error-threshold', type=float, default=1,
+                         help='rise in error rate, in percentage points, reported as a regression')
+    compare.set_defaults(func=command_compare)
+
+    args = parser.parse_args()
+    args.func(args)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,230 @@
+"""Admission control: per-client token buckets.
+
+Every API request takes a token from the bucket for its route class and
+client, identified by the signed-in user or else the client IP. An empty
+bucket is answered with a 429 and Retry-After before the view does any
+work. Concurrency is bounded by gunicorn's worker and thread counts:
+requests beyond them wait in gunicorn's queue, which the app never sees.
+"""
+from __future__ import annotations
+
+import math
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Union
+
+from flask import Flask, Response, jsonify, request
+
+from auth import bearer_user_id
+from cache import LRUCache
+
+# Endpoints limited more tightly than the 'default' class: password checks
+# and checkout's write lock and payment call are the expensive ones
+ROUTE_CLASSES = {
+    'login': 'auth',
+    'register': 'auth',
+    'checkout': 'checkout',
+}
+
+# Never limited, so health checks and metric scrapes see an overloaded server
+EXEMPT_ENDPOINTS = frozenset({'health_check', 'metrics', 'static'})
+
+PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+
+
+@dataclass(frozen=True)
+class Limit:
+    """A token bucket holding ``burst`` tokens, refilled at ``rate`` per second."""
+    burst: int
+    rate: float
+
+    @classmethod
+    def parse(cls, spec: str) -> 'Limit':
+        """Parse ``'10/minute'``: bursts of 10, refilled at 10 a minute."""
+        count, _, period = spec.partition('/')
+        if period not in PERIODS or int(count) < 1:
+            raise ValueError(f'Invalid rate limit: {spec!r}')
+        return cls(burst=int(count), rate=int(count) / PERIODS[period])
+
+    @property
+    def refill_seconds(self) -> float:
+        """How long an unused bucket takes to fill up completely."""
+        return self.burst / self.rate
+
+
+class MemoryBuckets:
+    """Token buckets in this process only, bounded to ``max_keys`` clients.
+
+    A bucket untouched for its refill time is full again, so it expires
+    from the LRU instead of being kept.
+    """
+
+    def __init__(self, max_keys: int, clock: Callable[[], float] = time.monotonic):
+        self._clock = clock
+        self._buckets = LRUCache(max_keys, ttl=0, clock=clock)
+        self._lock = threading.Lock()
+
+    def take(self, key: str, limit: Limit) -> float:
+        """Take a token; return 0 if admitted, else seconds until one is available."""
+        now = self._clock()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (limit.burst, now))
+            tokens = min(limit.burst, tokens + (now - updated) * limit.rate)
+            admitted = tokens >= 1
+            if admitted:
+                tokens -= 1
+            self._buckets.set(key, (tokens, now), ttl=limit.refill_seconds)
+        return 0.0 if admitted else (1 - tokens) / limit.rate
+
+
+class SQLiteBuckets:
+    """Token buckets in a SQLite file shared by every worker process.
+
+    Each take is a single UPSERT, so concurrent workers never lose an
+    update. The state is disposable: it is written with synchronous=OFF,
+    and full buckets are pruned now and then.
+    """
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+            key TEXT PRIMARY KEY,
+            tokens REAL NOT NULL,
+            updated_at REAL NOT NULL,
+            expires_at REAL NOT NULL,
+            admitted INTEGER NOT NULL
+        )
+    """
+
+    # SET expressions all see the row as it was before the update
+    TAKE = """
+        INSERT INTO rate_limit_buckets (key, tokens, updated_at, expires_at, admitted)
+        VALUES (:key, :burst - 1, :now, :expires_at, 1)
+        ON CONFLICT (key) DO UPDATE SET
+            admitted = min(:burst, tokens + max(0, :now - updated_at) * :rate) >= 1,
+            tokens = min(:burst, tokens + max(0, :now - updated_at) * :rate)
+                     - (min(:burst, tokens + max(0, :now - updated_at) * :rate) >= 1),
+            updated_at = :now,
+            expires_at = :expires_at
+        RETURNING admitted, tokens
+    """
+
+    PRUNE_EVERY = 1000
+
+    def __init__(self, path: str, busy_timeout: float = 1.0,
+                 clock: Callable[[], float] = time.time):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self._clock = clock
+        self._local = threading.local()
+        self._takes = 0
+
+    def _connection(self) -> sqlite3.Connection:
+        # Connections are per thread, and reopened in a forked worker
+        connection = getattr(self._local, 'connection', None)
+        if connection is None or self._local.pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.busy_timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=OFF')
+            connection.execute(self.SCHEMA)
+            self._local.connection = connection
+            self._local.pid = os.getpid()
+        return connection
+
+    def take(self, key: str, limit: Limit) -> float:
+        """Take a token; return 0 if admitted, else seconds until one is available."""
+        now = self._clock()
+        connection = self._connection()
+        admitted, tokens = connection.execute(self.TAKE, {
+            'key': key, 'burst': limit.burst, 'rate': limit.rate, 'now': now,
+            'expires_at': now + limit.refill_seconds,
+        }).fetchone()
+
+        self._takes += 1
+        if self._takes % self.PRUNE_EVERY == 0:
+            connection.execute('DELETE FROM rate_limit_buckets WHERE expires_at < ?', (now,))
+        return 0.0 if admitted else (1 - tokens) / limit.rate
+
+
+@dataclass
+class AdmissionControl:
+    limits: Dict[str, Limit]
+    buckets: Union[MemoryBuckets, SQLiteBuckets]
+    proxy_count: int = 0
+
+
+def route_class() -> str:
+    """The rate limit class of the current request."""
+    if request.endpoint == 'get_products' and request.args.get('search'):
+        return 'search'
+    return ROUTE_CLASSES.get(request.endpoint, 'default')
+
+
+def client_ip(proxy_count: int) -> str:
+    """The client address, read from X-Forwarded-For behind ``proxy_count`` proxies.
+
+    Only the entries appended by our own proxies are trusted; anything to
+    their left was sent by the client and may be forged.
+    """
+    if proxy_count:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',')]
+        if len(forwarded) >= proxy_count and forwarded[-proxy_count]:
+            return forwarded[-proxy_count]
+    return request.remote_addr or 'unknown'
+
+
+def address_is_proxy(proxy_count: int) -> bool:
+    """Whether ``client_ip`` gives a proxy's address instead of the client's.
+
+    So it does when a proxy forwarded the request but ``proxy_count`` is
+    too low to read the client's address from X-Forwarded-For, such as
+    behind a load balancer with the count left at 0.
+    """
+    header = request.headers.get('X-Forwarded-For')
+    if not proxy_count:
+        return header is not None
+    forwarded = [part.strip() for part in (header or '').split(',')]
+    return len(forwarded) < proxy_count or not forwarded[-proxy_count]
+
+
+def client_key(proxy_count: int) -> str:
+    """The signed-in user if the request carries a valid token, else the client IP."""
+    user_id = bearer_user_id()
+    if user_id is not None:
+        return f'user:{user_id}'
+    return f'ip:{client_ip(proxy_count)}'
+
+
+def _refuse(message: str, status: int, retry_after: float) -> Response:
+    response = jsonify({'error': message})
+    response.status_code = status
+    response.headers['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def init_admission_control(app: Flask) -> None:
+    """Rate limit ``app``'s requests, unless disabled by configuration."""
+    if not app.config['RATE_LIMIT_ENABLED']:
+        return
+
+    limits = {name: Limit.parse(spec) for name, spec in app.config['RATE_LIMITS'].items()}
+    storage = app.config['RATE_LIMIT_STORAGE']
+    buckets = SQLiteBuckets(storage) if storage else MemoryBuckets(app.config['RATE_LIMIT_MAX_KEYS'])
+    control = AdmissionControl(limits, buckets, app.config['RATE_LIMIT_PROXY_COUNT'])
+    app.extensions['admission'] = control
+
+    @app.before_request
+    def admit_request() -> Optional[Response]:
+        if request.method == 'OPTIONS' or request.endpoint in EXEMPT_ENDPOINTS:
+            return None
+
+        name = route_class()
+        limit = control.limits.get(name) or control.limits.get('default')
+        if limit is not None:
+            wait = control.buckets.take(f'{name}:{client_key(control.proxy_count)}', limit)
+            if wait:
+                return _refuse('Too many requests, please slow down', 429, wait)
+        return None
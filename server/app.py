@@ -1,23 +1,53 @@
 from __future__ import annotations
 
+import io
 import os
 import re
 import time
 import uuid
 import random
-from typing import Dict, List, Any, Optional, Tuple
+from typing import Callable, Dict, List, Any, Optional, Tuple
 from dataclasses import dataclass
 from contextlib import contextmanager
 from functools import wraps
 import logging
+from datetime import datetime, timedelta
 
-from flask import Flask, request, jsonify, current_app
+from flask import Flask, Response, request, jsonify, current_app, stream_with_context
+import click
 from flask_cors import CORS
-from werkzeug.exceptions import BadRequest, NotFound, Conflict, Unauthorized
+from werkzeug.exceptions import BadRequest, NotFound, Conflict, Unauthorized, ServiceUnavailable
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
 
 from models import db, Product, Order, OrderItem, User
-from auth import generate_token, token_required, optional_token
-from database import get_database_url
+from auth import generate_token, token_required, optional_token, admin_required, init_auth_cache
+from database import (
+    get_database_url, get_database_profile, get_engine_options,
+    get_sqlite_pragmas, configure_sqlite_engine
+)
+from search import apply_search
+from facets import category_facets, rebuild_category_facets
+from pagination import encode_cursor, decode_cursor, keyset_page
+from cache import init_catalog_cache, get_catalog_cache
+from metrics import init_metrics, timed
+from query_inspection import init_query_inspection
+from passwords import init_password_hasher, get_password_hasher
+from serialization import FastJSONProvider, encode_json, encode_with_fragments, product_fragment
+from inventory import adjust_stock, current_stock, audit_stock, rebuild_stock, record_opening_balances
+from http_cache import (
+    CatalogPayload, Validators, catalog_validators, content_validators,
+    is_not_modified, not_modified, conditional_json, payload_response
+)
+from compression import init_compression
+from catalog_io import FORMATS, format_for, read_rows, import_products, export_products
+from migrations import upgrade, pending_migrations
+from idempotency import idempotent, purge_expired_keys
+from jobs import JobWorker, enqueue, job, job_counts, purge_finished_jobs
+from read_routing import init_read_routing, read_only
+from admission import init_admission_control
+from payments import PAYMENT_METHODS, GatewayTimeout, PaymentResult, get_payment_gateway, init_payment_gateways
+import tasks  # noqa: F401 - registers the background job handlers
 from dotenv import load_dotenv
 
 # Configure logging
@@ -27,15 +57,6 @@ logger = logging.getLogger(__name__)
 load_dotenv()
 
 
-@dataclass
-class PaymentResult:
-    """Data class for payment processing results."""
-    success: bool
-    payment_id: Optional[str] = None
-    method: Optional[str] = None
-    error: Optional[str] = None
-
-
 @dataclass
 class ValidationResult:
     """Data class for cart validation results."""
@@ -47,16 +68,25 @@ class ValidationResult:
 
 
 class PaymentProcessor:
-    """Payment processing service with mock implementations."""
+    """Payment processing through the configured gateways.
+    
+    Methods without a gateway URL are simulated in-process, with a delay
+    and random declines, so development needs no gateway at all.
+    """
     
     FAILURE_RATE = 0.05  # 5% chance of random failure
     
     @classmethod
-    def process_payment(cls, amount: float, method: str, payment_details: Dict[str, Any]) -> PaymentResult:
-        """Process payment using specified method."""
+    def process_payment(cls, amount: float, method: str, payment_details: Dict[str, Any],
+                        reference: Optional[str] = None) -> PaymentResult:
+        """Charge ``amount``; ``reference`` makes retries of the same charge safe."""
         if amount <= 0:
             return PaymentResult(success=False, error="Invalid amount")
         
+        gateway = get_payment_gateway(method)
+        if gateway is not None:
+            return gateway.charge(amount, method, payment_details, reference or uuid.uuid4().hex)
+        
         # Simulate processing delay
         time.sleep(0.5)
         
@@ -73,6 +103,17 @@ class PaymentProcessor:
         handler = payment_handlers.get(method, cls._process_default)
         return handler(amount, method)
     
+    @classmethod
+    def refund_payment(cls, payment_id: str, amount: float,
+                       method: Optional[str] = None) -> PaymentResult:
+        """Refund a captured payment."""
+        gateway = get_payment_gateway(method) if method else None
+        if gateway is not None:
+            return gateway.refund(payment_id, amount)
+        
+        logger.info("Refunding payment %s (%.2f)", payment_id, amount)
+        return PaymentResult(success=True, payment_id=payment_id, method='refund')
+    
     @staticmethod
     def _process_stripe(amount: float, method: str) -> PaymentResult:
         return PaymentResult(
@@ -106,30 +147,36 @@ class PaymentProcessor:
         )
 
 
+@job('refund_payment', max_attempts=10)
+def _refund_payment(payload: Dict[str, Any]) -> None:
+    """Refund a charge whose order could not be confirmed after all."""
+    result = PaymentProcessor.refund_payment(payload['payment_id'], payload['amount'],
+                                             payload['method'])
+    if not result.success:
+        raise RuntimeError(f"Refund of {payload['payment_id']} failed: {result.error}")
+
+
 class CartValidator:
     """Service for validating cart items."""
     
     @staticmethod
     def validate_cart_items(items: List[Dict[str, Any]]) -> Tuple[bool, List[ValidationResult]]:
-        """Validate cart items and return results."""
-        validation_results = []
-        all_valid = True
+        """Validate cart items and return one result per distinct product."""
+        quantities = _merge_cart_lines(items)
+        products = _load_products(quantities.keys())
         
-        for item in items:
-            result = CartValidator._validate_single_item(item)
-            validation_results.append(result)
-            if not result.valid:
-                all_valid = False
+        validation_results = [
+            CartValidator._validate_single_item(product_id, quantity, products.get(product_id))
+            for product_id, quantity in quantities.items()
+        ]
+        all_valid = all(result.valid for result in validation_results)
         
         return all_valid, validation_results
     
     @staticmethod
-    def _validate_single_item(item: Dict[str, Any]) -> ValidationResult:
-        """Validate a single cart item."""
-        product_id = item['product_id']
-        requested_qty = item['quantity']
-        
-        product = Product.query.get(product_id)
+    def _validate_single_item(product_id: int, requested_qty: int,
+                              product: Optional[Product]) -> ValidationResult:
+        """Validate a single cart item against its preloaded product."""
         if not product:
             return ValidationResult(
                 product_id=product_id,
@@ -152,6 +199,30 @@ class CartValidator:
         )
 
 
+# Stays well below SQLite's bound-parameter limit
+PRODUCT_LOOKUP_BATCH_SIZE = 500
+
+
+def _merge_cart_lines(items: List[Dict[str, Any]]) -> Dict[int, int]:
+    """Sum quantities of repeated products, keeping first-seen order."""
+    quantities: Dict[int, int] = {}
+    for item in items:
+        product_id = item['product_id']
+        quantities[product_id] = quantities.get(product_id, 0) + item['quantity']
+    return quantities
+
+
+def _load_products(product_ids) -> Dict[int, Product]:
+    """Load products by id with one IN query per batch instead of one per id."""
+    product_ids = list(product_ids)
+    products = {}
+    for start in range(0, len(product_ids), PRODUCT_LOOKUP_BATCH_SIZE):
+        batch = product_ids[start:start + PRODUCT_LOOKUP_BATCH_SIZE]
+        for product in Product.query.filter(Product.id.in_(batch)):
+            products[product.id] = product
+    return products
+
+
 def handle_api_errors(func):
     """Decorator to handle common API errors."""
     @wraps(func)
@@ -166,6 +237,12 @@ def handle_api_errors(func):
             return jsonify({'error': str(e)}), 409
         except Unauthorized as e:
             return jsonify({'error': str(e)}), 401
+        except ServiceUnavailable as e:
+            response = jsonify({'error': e.description})
+            response.status_code = 503
+            if e.retry_after:
+                response.headers['Retry-After'] = str(e.retry_after)
+            return response
         except Exception as e:
             logger.exception("Unexpected error in %s", func.__name__)
             db.session.rollback()
@@ -204,17 +281,134 @@ def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
         'SECRET_KEY': os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-production'),
         'SQLALCHEMY_DATABASE_URI': get_database_url(),
         'SQLALCHEMY_TRACK_MODIFICATIONS': False,
-        'SQLALCHEMY_ENGINE_OPTIONS': {
-            'pool_pre_ping': True,
-            'pool_recycle': 300,
-        }
+        'JSON_BACKEND': os.environ.get('JSON_BACKEND', 'auto'),
+        # Signed-in users with these addresses may use the /api/admin routes
+        'ADMIN_EMAILS': {
+            email.strip().lower()
+            for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()
+        },
+        'PRODUCT_IMPORT_BATCH_SIZE': int(os.environ.get('PRODUCT_IMPORT_BATCH_SIZE', 1000)),
+        # Responses of these types and at least this size are gzip/brotli
+        # encoded when the client accepts it
+        'COMPRESSION_ENABLED': os.environ.get('COMPRESSION_ENABLED', 'true').lower() == 'true',
+        'COMPRESSION_MIN_SIZE': int(os.environ.get('COMPRESSION_MIN_SIZE', 1024)),
+        'COMPRESSION_MIMETYPES': ['application/json', 'text/plain', 'text/csv'],
+        'COMPRESSION_GZIP_LEVEL': int(os.environ.get('COMPRESSION_GZIP_LEVEL', 6)),
+        'COMPRESSION_BROTLI_QUALITY': int(os.environ.get('COMPRESSION_BROTLI_QUALITY', 5)),
+        'DATABASE_PROFILE': get_database_profile(),
+        # Catalog and order reads use their own read-only engine: the same
+        # SQLite file opened mode=ro, or DATABASE_READ_URL if set. Reads from
+        # a replica go to the primary for READ_YOUR_WRITES_SECONDS after the
+        # client's last write
+        'DATABASE_READ_ROUTING': os.environ.get(
+            'DATABASE_READ_ROUTING', str(get_database_profile() == 'production')
+        ).lower() == 'true',
+        'DATABASE_READ_URL': os.environ.get('DATABASE_READ_URL'),
+        'READ_YOUR_WRITES_SECONDS': float(os.environ.get('READ_YOUR_WRITES_SECONDS', 5)),
+        'CATALOG_CACHE_ENABLED': os.environ.get('CATALOG_CACHE_ENABLED', 'true').lower() == 'true',
+        'CATALOG_CACHE_TTL': int(os.environ.get('CATALOG_CACHE_TTL', 60)),
+        'CATALOG_CACHE_MAX_PRODUCTS': int(os.environ.get('CATALOG_CACHE_MAX_PRODUCTS', 10000)),
+        'CATALOG_CACHE_MAX_LISTINGS': int(os.environ.get('CATALOG_CACHE_MAX_LISTINGS', 1000)),
+        # Verified JWT claims are cached until expiry; user rows briefly, as
+        # other workers' profile updates only reach this one on expiry
+        'AUTH_TOKEN_CACHE_SIZE': int(os.environ.get('AUTH_TOKEN_CACHE_SIZE', 10000)),
+        'AUTH_TOKEN_CACHE_TTL': int(os.environ.get('AUTH_TOKEN_CACHE_TTL', 3600)),
+        'AUTH_USER_CACHE_SIZE': int(os.environ.get('AUTH_USER_CACHE_SIZE', 10000)),
+        'AUTH_USER_CACHE_TTL': int(os.environ.get('AUTH_USER_CACHE_TTL', 30)),
+        # Checkout responses are replayed to retries with the same
+        # Idempotency-Key for IDEMPOTENCY_TTL_SECONDS; a claim whose request
+        # has not finished within IDEMPOTENCY_LOCK_SECONDS is abandoned
+        'IDEMPOTENCY_TTL_SECONDS': int(os.environ.get('IDEMPOTENCY_TTL_SECONDS', 86400)),
+        'IDEMPOTENCY_LOCK_SECONDS': int(os.environ.get('IDEMPOTENCY_LOCK_SECONDS', 60)),
+        'IDEMPOTENCY_WAIT_SECONDS': float(os.environ.get('IDEMPOTENCY_WAIT_SECONDS', 10)),
+        # Payment gateways per method, falling back to PAYMENT_GATEWAY_URL;
+        # methods without a URL are simulated in-process. Each worker process
+        # keeps at most PAYMENT_MAX_CONNECTIONS payments in flight per gateway
+        'PAYMENT_GATEWAYS': {
+            method: {
+                'url': os.environ.get(f'PAYMENT_{method.upper()}_URL',
+                                      os.environ.get('PAYMENT_GATEWAY_URL')),
+                'timeout': float(os.environ.get(f'PAYMENT_{method.upper()}_TIMEOUT',
+                                                os.environ.get('PAYMENT_TIMEOUT', 5))),
+            }
+            for method in PAYMENT_METHODS + ('default',)
+        },
+        'PAYMENT_TIMEOUT': float(os.environ.get('PAYMENT_TIMEOUT', 5)),
+        'PAYMENT_MAX_CONNECTIONS': int(os.environ.get('PAYMENT_MAX_CONNECTIONS', 32)),
+        'PAYMENT_ACQUIRE_TIMEOUT': float(os.environ.get('PAYMENT_ACQUIRE_TIMEOUT', 2)),
+        # Background jobs: gunicorn runs JOB_WORKER_THREADS in every worker
+        # process (0 leaves them to 'flask jobs worker'); a claimed job is
+        # retried if not finished within JOB_VISIBILITY_TIMEOUT seconds
+        'JOB_WORKER_THREADS': int(os.environ.get('JOB_WORKER_THREADS', 1)),
+        'JOB_POLL_INTERVAL': float(os.environ.get('JOB_POLL_INTERVAL', 1.0)),
+        'JOB_VISIBILITY_TIMEOUT': int(os.environ.get('JOB_VISIBILITY_TIMEOUT', 300)),
+        'JOB_RETRY_BASE_SECONDS': float(os.environ.get('JOB_RETRY_BASE_SECONDS', 5)),
+        'JOB_RETRY_MAX_SECONDS': float(os.environ.get('JOB_RETRY_MAX_SECONDS', 3600)),
+        'LOW_STOCK_THRESHOLD': int(os.environ.get('LOW_STOCK_THRESHOLD', 5)),
+        # Token buckets per route class and client (user, else IP) as
+        # 'count/period'; RATE_LIMIT_STORAGE is a SQLite file shared by all
+        # workers, otherwise each process limits on its own
+        'RATE_LIMIT_ENABLED': os.environ.get('RATE_LIMIT_ENABLED', 'true').lower() == 'true',
+        'RATE_LIMITS': {
+            'auth': os.environ.get('RATE_LIMIT_AUTH', '10/minute'),
+            'checkout': os.environ.get('RATE_LIMIT_CHECKOUT', '20/minute'),
+            'search': os.environ.get('RATE_LIMIT_SEARCH', '60/minute'),
+            'default': os.environ.get('RATE_LIMIT_DEFAULT', '600/minute'),
+        },
+        'RATE_LIMIT_STORAGE': os.environ.get('RATE_LIMIT_STORAGE'),
+        'RATE_LIMIT_MAX_KEYS': int(os.environ.get('RATE_LIMIT_MAX_KEYS', 100000)),
+        # Proxies in front of the app whose X-Forwarded-For entries are trusted
+        'RATE_LIMIT_PROXY_COUNT': int(os.environ.get('RATE_LIMIT_PROXY_COUNT', 0)),
+        # Pending orders older than this are assumed abandoned mid-checkout
+        'RESERVATION_TIMEOUT_MINUTES': int(os.environ.get('RESERVATION_TIMEOUT_MINUTES', 15)),
+        # Request timing; with several worker processes, METRICS_DIR lets any
+        # worker serve /api/metrics aggregated over all of them
+        'METRICS_ENABLED': os.environ.get('METRICS_ENABLED', 'true').lower() == 'true',
+        'METRICS_DIR': os.environ.get('METRICS_DIR'),
+        'METRICS_FLUSH_INTERVAL': float(os.environ.get('METRICS_FLUSH_INTERVAL', 1.0)),
+        # Queries slower than this are logged with their parameters; a SELECT
+        # repeated this often within one request is logged as a likely N+1
+        'QUERY_INSPECTION_ENABLED': os.environ.get('QUERY_INSPECTION_ENABLED', 'true').lower() == 'true',
+        'SLOW_QUERY_MS': float(os.environ.get('SLOW_QUERY_MS', 100)),
+        # Password hashing runs in a process pool; raising the cost upgrades
+        # stored hashes on each user's next login
+        'PASSWORD_HASH_METHOD': os.environ.get('PASSWORD_HASH_METHOD', 'pbkdf2:sha256:600000'),
+        'PASSWORD_HASH_WORKERS': int(os.environ.get('PASSWORD_HASH_WORKERS', 2)),
+        'PASSWORD_HASH_MAX_PENDING': int(os.environ.get('PASSWORD_HASH_MAX_PENDING', 32)),
+        'PASSWORD_HASH_TIMEOUT': float(os.environ.get('PASSWORD_HASH_TIMEOUT', 10)),
+        'N_PLUS_ONE_THRESHOLD': int(os.environ.get('N_PLUS_ONE_THRESHOLD', 5)),
+        # Cache-Control per endpoint; responses always carry validators, so
+        # no-cache still lets clients revalidate cheaply with a 304
+        'CACHE_CONTROL': {
+            'get_products': 'public, no-cache',
+            'get_product': 'public, no-cache',
+            'get_categories': 'public, max-age=60',
+            'get_order': 'private, no-cache',
+        },
     })
     
     if config:
         app.config.update(config)
     
+    app.json = FastJSONProvider(app)
+    
+    # Engine options follow the profile unless configured explicitly
+    profile = app.config['DATABASE_PROFILE']
+    app.config.setdefault('SQLALCHEMY_ENGINE_OPTIONS', get_engine_options(profile))
+    
     # Initialize extensions
     db.init_app(app)
+    with app.app_context():
+        configure_sqlite_engine(db.engine, get_sqlite_pragmas(profile))
+    init_read_routing(app)
+    init_catalog_cache(app)
+    init_auth_cache(app)
+    init_password_hasher(app)
+    init_metrics(app)
+    init_query_inspection(app)
+    init_compression(app)
+    init_admission_control(app)
+    init_payment_gateways(app)
     
     # CORS configuration
     frontend_url = os.environ.get('FRONTEND_URL', 'http://localhost:3000')
@@ -226,7 +420,9 @@ def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
     
     CORS(app, 
          origins=allowed_origins,
-         allow_headers=['Content-Type', 'Authorization'],
+         allow_headers=['Content-Type', 'Authorization', 'If-None-Match', 'If-Modified-Since',
+                        'Idempotency-Key'],
+         expose_headers=['ETag', 'Last-Modified', 'Idempotent-Replayed'],
          methods=['GET', 'POST', 'PUT', 'DELETE', 'OPTIONS'])
     
     # Register routes
@@ -235,9 +431,15 @@ def create_app(config: Optional[Dict[str, Any]] = None) -> Flask:
     _register_auth_routes(app)
     _register_user_routes(app)
     _register_utility_routes(app)
+    _register_admin_routes(app)
     
     # Register error handlers
     _register_error_handlers(app)
+    _register_cli_commands(app)
+    _register_inventory_commands(app)
+    _register_catalog_commands(app)
+    _register_schema_commands(app)
+    _register_job_commands(app)
     
     return app
 
@@ -246,46 +448,201 @@ def _register_product_routes(app: Flask) -> None:
     """Register product-related routes."""
     
     @app.route('/api/products', methods=['GET'])
+    @read_only
     @handle_api_errors
     def get_products():
         page = request.args.get('page', 1, type=int)
-        per_page = min(request.args.get('per_page', 20, type=int), 100)  # Limit max per_page
+        per_page = max(min(request.args.get('per_page', 20, type=int), 100), 1)  # Limit max per_page
         category = request.args.get('category')
         search = request.args.get('search')
+        sort = request.args.get('sort')
+        after = request.args.get('after')
+        include_total = request.args.get('include_total', '').lower() in ('1', 'true', 'yes')
         
-        query = Product.query
+        cache = get_catalog_cache()
+        cache_key = (category, search, sort, page, after, per_page, include_total)
+        product_ids = []
         
-        if category:
-            query = query.filter(Product.category == category)
+        def build():
+            listing = _build_product_listing(
+                category, search, sort, page, after, per_page, include_total
+            )
+            products = listing.pop('products')
+            product_ids.extend(product.id for product in products)
+            return encode_with_fragments(listing, 'products',
+                                         [product_fragment(product) for product in products])
         
-        if search:
-            query = query.filter(Product.name.contains(search))
+        def store(payload):
+            if cache:
+                cache.set_listing(cache_key, payload, product_ids)
         
-        products = query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
+        return _catalog_response(
+            catalog_validators('products', cache_key),
+            cache.get_listing(cache_key) if cache else None,
+            build,
+            store
         )
-        
-        return jsonify({
-            'products': [product.to_dict() for product in products.items],
-            'total': products.total,
-            'pages': products.pages,
-            'current_page': page
-        })
     
     @app.route('/api/products/<int:product_id>', methods=['GET'])
+    @read_only
     @handle_api_errors
     def get_product(product_id: int):
-        product = Product.query.get_or_404(product_id)
-        return jsonify(product.to_dict())
+        cache = get_catalog_cache()
+        
+        def store(payload):
+            if cache:
+                cache.set_product(product_id, payload)
+        
+        return _catalog_response(
+            catalog_validators('product', product_id),
+            cache.get_product(product_id) if cache else None,
+            lambda: product_fragment(Product.query.get_or_404(product_id)),
+            store
+        )
     
     @app.route('/api/categories', methods=['GET'])
+    @read_only
     @handle_api_errors
     def get_categories():
-        categories = db.session.query(Product.category).distinct().all()
-        category_list = [cat[0] for cat in categories if cat[0]]
-        return jsonify({'categories': category_list})
+        cache = get_catalog_cache()
+        counts = request.args.get('counts', '').lower() in ('1', 'true')
+        
+        def build():
+            facets = category_facets()
+            payload = {'categories': [facet['name'] for facet in facets]}
+            if counts:
+                payload['facets'] = facets
+            return payload
+        
+        def store(payload):
+            if cache:
+                cache.set_categories(payload, counts)
+        
+        return _catalog_response(
+            catalog_validators('categories', counts),
+            cache.get_categories(counts) if cache else None,
+            build,
+            store
+        )
+
+
+def _catalog_response(validators: Validators, cached: Optional[CatalogPayload],
+                      build: Callable[[], Any],
+                      store: Callable[[CatalogPayload], None]) -> Response:
+    """Serve a catalog resource, answering 304 whenever the client's copy is current.
+    
+    ``validators`` reflect the current catalog version and are checked before
+    anything else. A cached payload built under an older version, such as one
+    cached before a change made by another worker, is treated as a miss so
+    clients never get a body older than the version just read. ``build``
+    returns encoded bytes or JSON-able data; either way the encoded body is
+    what gets cached.
+    """
+    if is_not_modified(validators):
+        return not_modified(validators)
+    
+    if cached is not None and cached.validators.version >= validators.version:
+        if is_not_modified(cached.validators):
+            return not_modified(cached.validators)
+        return payload_response(cached)
+    
+    body = build()
+    if not isinstance(body, bytes):
+        body = encode_json(body)
+    payload = CatalogPayload(body, validators)
+    store(payload)
+    return payload_response(payload)
+
+
+PRODUCT_SORT_COLUMNS = {
+    'id': Product.id,
+    'name': Product.name,
+    'price': Product.price,
+}
+
+
+def _parse_product_sort(sort: str) -> Tuple[List[Any], bool]:
+    """Resolve a sort argument such as ``price`` or ``-price`` to key columns."""
+    descending = sort.startswith('-')
+    column = PRODUCT_SORT_COLUMNS.get(sort.lstrip('-'))
+    if column is None:
+        raise BadRequest(f'Invalid sort: {sort}')
+    
+    # Product id breaks ties so every row has a unique position
+    columns = [column] if column is Product.id else [column, Product.id]
+    return columns, descending
+
+
+def _build_product_listing(category: Optional[str], search: Optional[str], sort: Optional[str],
+                           page: int, after: Optional[str], per_page: int,
+                           include_total: bool) -> Dict[str, Any]:
+    """Query one page of the product listing.
+    
+    Passing ``after`` (even empty) selects cursor pagination, otherwise
+    ``page`` is used. ``products`` holds the Product rows, left for the
+    caller to encode.
+    """
+    cursor_mode = after is not None
+    sort_columns, descending = _parse_product_sort(sort or 'id')
+    query = Product.query
+    
+    if category:
+        query = query.filter(Product.category == category)
+    
+    # Search results come in relevance order unless a sort was requested
+    # or the client pages by cursor, which needs a stable sort key
+    ranked = bool(search) and not (sort or cursor_mode)
+    if search:
+        query = apply_search(query, search, ranked=ranked)
+    
+    if cursor_mode:
+        return _product_cursor_page(query, sort or 'id', sort_columns, descending,
+                                    after, per_page, include_total)
+    
+    if not ranked:
+        query = query.order_by(*[column.desc() if descending else column for column in sort_columns])
+    
+    products = query.paginate(
+        page=page, 
+        per_page=per_page, 
+        error_out=False
+    )
+    
+    return {
+        'products': products.items,
+        'total': products.total,
+        'pages': products.pages,
+        'current_page': page
+    }
+
+
+def _product_cursor_page(query, sort: str, sort_columns: List[Any], descending: bool,
+                         after: str, per_page: int, include_total: bool) -> Dict[str, Any]:
+    """Build a keyset page of products that follows the ``after`` cursor."""
+    after_key = None
+    if after:
+        cursor = decode_cursor(after, len(sort_columns) + 1)
+        if cursor[0] != sort:
+            raise BadRequest('Cursor does not match the requested sort')
+        after_key = cursor[1:]
+    
+    total = query.order_by(None).count() if include_total else None
+    
+    products, has_more = keyset_page(query, sort_columns, descending, after_key, per_page)
+    
+    next_cursor = None
+    if has_more:
+        last = products[-1]
+        next_cursor = encode_cursor([sort] + [getattr(last, column.key) for column in sort_columns])
+    
+    result = {
+        'products': products,
+        'next_cursor': next_cursor,
+        'has_more': has_more,
+    }
+    if include_total:
+        result['total'] = total
+    return result
 
 
 def _register_order_routes(app: Flask) -> None:
@@ -293,6 +650,7 @@ def _register_order_routes(app: Flask) -> None:
     
     @app.route('/api/checkout', methods=['POST'])
     @optional_token
+    @idempotent
     @handle_api_errors
     def checkout(current_user):
         data = request.get_json()
@@ -300,43 +658,80 @@ def _register_order_routes(app: Flask) -> None:
         if not data or 'items' not in data:
             raise BadRequest('Invalid request data')
         
+        # Phase 1: reserve stock and record a pending order. This transaction
+        # is short, so the SQLite write lock is released before payment.
         with database_transaction():
-            # Validate items and calculate total
             total_amount, order_items = _process_checkout_items(data['items'])
             
-            # Create order
-            order = _create_order(data, total_amount)
+            order = _create_order(data, total_amount, current_user)
             db.session.add(order)
             db.session.flush()  # Get order ID
             
-            # Create order items and update stock
             _create_order_items(order, order_items)
-            
-            # Process payment
-            payment_method = data.get('payment_method', 'stripe')
-            payment_details = data.get('payment_details', {})
-            payment_result = PaymentProcessor.process_payment(
-                total_amount, payment_method, payment_details
-            )
-            
-            if not payment_result.success:
-                raise BadRequest(f'Payment failed: {payment_result.error}')
-            
-            order.status = 'confirmed'
-            
-            return jsonify({
-                'success': True,
-                'order_number': order.order_number,
-                'total_amount': order.total_amount,
-                'status': order.status,
-                'payment_id': payment_result.payment_id
-            }), 201
+            order_id = order.id
+            order_number = order.order_number
+        
+        # Phase 2: charge outside any transaction. If the process dies here
+        # the order stays pending until the recurring release_stale_reservations
+        # sweep frees its stock and voids any charge made for it.
+        payment_method = data.get('payment_method', 'stripe')
+        payment_details = data.get('payment_details', {})
+        try:
+            with timed('payment'):
+                payment_result = PaymentProcessor.process_payment(
+                    total_amount, payment_method, payment_details, reference=order_number
+                )
+        except GatewayTimeout:
+            # The charge may have gone through; cancel it in the background
+            _release_reservation(order_id, 'payment_failed', void_payment=True)
+            raise ServiceUnavailable('Payment timed out, please try again', retry_after=1)
+        except Exception:
+            # A reset connection or unreadable reply may follow a charge the
+            # gateway made; voiding an order that has none is harmless
+            _release_reservation(order_id, 'payment_failed', void_payment=True)
+            raise
+        
+        # Phase 3: confirm the order, or compensate by releasing its stock
+        if not payment_result.success:
+            _release_reservation(order_id, 'payment_failed')
+            raise BadRequest(f'Payment failed: {payment_result.error}')
+        
+        with database_transaction():
+            confirmed = _transition_order(order_id, 'pending', 'confirmed')
+            if confirmed:
+                # Committed with the confirmation and run after the response
+                enqueue('order_confirmation', {'order_id': order_id})
+            else:
+                # The reservation expired while payment was in flight; the
+                # refund is retried until the gateway accepts it
+                enqueue('refund_payment', {'payment_id': payment_result.payment_id,
+                                           'amount': total_amount, 'method': payment_method})
+        
+        if not confirmed:
+            raise Conflict('Order reservation expired, please try again')
+        
+        return jsonify({
+            'success': True,
+            'order_number': order_number,
+            'total_amount': total_amount,
+            'status': 'confirmed',
+            'payment_id': payment_result.payment_id
+        }), 201
     
     @app.route('/api/orders/<order_number>', methods=['GET'])
+    @read_only
     @handle_api_errors
     def get_order(order_number: str):
         order = Order.query.filter_by(order_number=order_number).first_or_404()
-        return jsonify(order.to_dict())
+        
+        # Items are immutable once placed, so the order row alone identifies
+        # the representation and a match skips loading and serializing items
+        validators = content_validators('order', order.id, order.status)
+        if is_not_modified(validators):
+            return not_modified(validators)
+        
+        _load_order_items([order])
+        return conditional_json(order.to_dict(), validators)
     
     @app.route('/api/cart/validate', methods=['POST'])
     @handle_api_errors
@@ -355,15 +750,17 @@ def _register_order_routes(app: Flask) -> None:
 
 def _process_checkout_items(items: List[Dict[str, Any]]) -> Tuple[float, List[Dict[str, Any]]]:
     """Process and validate checkout items."""
+    quantities = _merge_cart_lines(items)
+    products = _load_products(quantities.keys())
+    
     total_amount = 0
     order_items = []
     
-    for item in items:
-        product = Product.query.get(item['product_id'])
+    for product_id, quantity in quantities.items():
+        product = products.get(product_id)
         if not product:
-            raise BadRequest(f'Product {item["product_id"]} not found')
+            raise BadRequest(f'Product {product_id} not found')
         
-        quantity = item['quantity']
         if product.stock_quantity < quantity:
             raise BadRequest(
                 f'Insufficient stock for {product.name}. '
@@ -382,11 +779,14 @@ def _process_checkout_items(items: List[Dict[str, Any]]) -> Tuple[float, List[Di
     return total_amount, order_items
 
 
-def _create_order(data: Dict[str, Any], total_amount: float) -> Order:
+def _create_order(data: Dict[str, Any], total_amount: float,
+                  user: Optional[User] = None) -> Order:
     """Create order with shipping information."""
     order = Order(
+        user_id=user.id if user else None,
         total_amount=total_amount,
-        status='pending'
+        status='pending',
+        payment_method=data.get('payment_method', 'stripe')
     )
     
     # Add shipping info if provided
@@ -401,18 +801,85 @@ def _create_order(data: Dict[str, Any], total_amount: float) -> Order:
 
 
 def _create_order_items(order: Order, order_items: List[Dict[str, Any]]) -> None:
-    """Create order items and update product stock."""
+    """Create order items and reserve their stock."""
     for item_data in order_items:
+        product = item_data['product']
         order_item = OrderItem(
             order_id=order.id,
-            product_id=item_data['product'].id,
+            product_id=product.id,
             quantity=item_data['quantity'],
             price=item_data['price']
         )
         db.session.add(order_item)
         
-        # Update product stock
-        item_data['product'].stock_quantity -= item_data['quantity']
+        # The stock check in _process_checkout_items may be stale by now; the
+        # conditional decrement is what actually guards against overselling
+        if not adjust_stock(product.id, -item_data['quantity'], 'reservation', order.id):
+            raise BadRequest(
+                f'Insufficient stock for {product.name}. '
+                f'Available: {current_stock(product.id)}'
+            )
+
+
+def _transition_order(order_id: int, from_status: str, to_status: str) -> bool:
+    """Move an order between statuses unless another request already did.
+    
+    The status check and update are a single statement, so a confirming
+    checkout and the reservation reaper can never both win.
+    """
+    result = db.session.execute(
+        db.update(Order)
+        .where(Order.id == order_id, Order.status == from_status)
+        .values(status=to_status)
+    )
+    return result.rowcount == 1
+
+
+def _release_reservation(order_id: int, status: str, void_payment: bool = False) -> bool:
+    """Cancel a pending order and return its reserved stock.
+    
+    With ``void_payment``, a job cancelling any charge made for the order is
+    queued in the same transaction, for orders whose payment outcome is unknown.
+    """
+    with database_transaction():
+        if not _transition_order(order_id, 'pending', status):
+            return False
+        
+        for item in OrderItem.query.filter_by(order_id=order_id):
+            adjust_stock(item.product_id, item.quantity, 'release', order_id)
+        
+        if void_payment:
+            order_number, method = db.session.query(Order.order_number, Order.payment_method) \
+                .filter(Order.id == order_id).one()
+            enqueue('void_payment', {'method': method, 'reference': order_number})
+    
+    return True
+
+
+def release_stale_reservations(max_age: timedelta) -> int:
+    """Release pending orders older than ``max_age``.
+    
+    Covers checkouts whose worker died between reserving stock and
+    confirming payment. The charge may already have been taken, so each
+    released order also queues a void. Returns the number of orders released.
+    """
+    cutoff = datetime.utcnow() - max_age
+    stale_ids = [
+        order_id for (order_id,) in db.session.query(Order.id)
+        .filter(Order.status == 'pending', Order.created_at < cutoff)
+    ]
+    
+    released = sum(1 for order_id in stale_ids
+                   if _release_reservation(order_id, 'expired', void_payment=True))
+    if released:
+        logger.warning("Released %d stale checkout reservations", released)
+    return released
+
+
+@job('release_stale_reservations', concurrency=1, every=60)
+def _sweep_stale_reservations(payload: Dict[str, Any]) -> None:
+    """Free stock held by checkouts of workers that died mid-payment."""
+    release_stale_reservations(timedelta(minutes=current_app.config['RESERVATION_TIMEOUT_MINUTES']))
 
 
 def _register_auth_routes(app: Flask) -> None:
@@ -469,6 +936,12 @@ def _register_auth_routes(app: Flask) -> None:
         if not user or not user.check_password(password):
             raise Unauthorized('Invalid email or password')
         
+        # Upgrade hashes made with an older method or cost while the
+        # plaintext is at hand
+        if get_password_hasher().needs_rehash(user.password_hash):
+            with database_transaction():
+                user.set_password(password)
+        
         # Generate token
         token = generate_token(user.id, user.email)
         
@@ -520,14 +993,22 @@ def _register_user_routes(app: Flask) -> None:
     @token_required
     @handle_api_errors
     def get_user_profile(current_user):
-        """Get user profile with orders."""
-        orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+        """Get user profile with the first page of orders."""
+        history = _order_history_page(current_user)
         
         return jsonify({
             'user': current_user.to_dict(),
-            'orders': [order.to_dict() for order in orders]
+            'orders': history['orders'],
+            'orders_next_cursor': history['next_cursor']
         })
     
+    @app.route('/api/orders', methods=['GET'])
+    @token_required
+    @handle_api_errors
+    def get_order_history(current_user):
+        """Get the user's orders, newest first, one cursor page at a time."""
+        return jsonify(_order_history_page(current_user))
+    
     @app.route('/api/user/profile', methods=['PUT'])
     @token_required
     @handle_api_errors
@@ -544,6 +1025,65 @@ def _register_user_routes(app: Flask) -> None:
             })
 
 
+def _order_history_page(user: User) -> Dict[str, Any]:
+    """Build a page of ``user``'s orders from the ``after`` and ``limit`` args."""
+    limit = max(min(request.args.get('limit', 20, type=int), 100), 1)
+    after = request.args.get('after')
+    
+    after_key = None
+    if after:
+        created_at, order_id = decode_cursor(after, 2)
+        if not isinstance(order_id, int) or isinstance(order_id, bool):
+            raise BadRequest('Invalid cursor')
+        try:
+            after_key = [datetime.fromisoformat(created_at), order_id]
+        except (TypeError, ValueError):
+            raise BadRequest('Invalid cursor')
+    
+    orders, has_more = keyset_page(
+        Order.query.filter_by(user_id=user.id),
+        [Order.created_at, Order.id],
+        True,
+        after_key,
+        limit
+    )
+    _load_order_items(orders)
+    
+    next_cursor = None
+    if has_more:
+        last = orders[-1]
+        next_cursor = encode_cursor([last.created_at.isoformat(), last.id])
+    
+    return {
+        'orders': [order.to_dict() for order in orders],
+        'next_cursor': next_cursor,
+        'has_more': has_more
+    }
+
+
+def _load_order_items(orders: List[Order]) -> None:
+    """Populate items and their products for ``orders`` with one joined query.
+    
+    Without this, serializing N orders lazily loads each order's items and
+    then each item's product.
+    """
+    if not orders:
+        return
+    
+    items_by_order: Dict[int, List[OrderItem]] = {order.id: [] for order in orders}
+    items = (
+        OrderItem.query
+        .options(joinedload(OrderItem.product))
+        .filter(OrderItem.order_id.in_(items_by_order))
+        .order_by(OrderItem.id)
+    )
+    for item in items:
+        items_by_order[item.order_id].append(item)
+    
+    for order in orders:
+        set_committed_value(order, 'items', items_by_order[order.id])
+
+
 def _update_user_fields(user: User, data: Dict[str, Any]) -> None:
     """Update user fields from request data."""
     if 'first_name' in data:
@@ -578,6 +1118,195 @@ def _register_utility_routes(app: Flask) -> None:
         return jsonify({'status': 'healthy', 'service': 'quickcart-api'})
 
 
+def _register_admin_routes(app: Flask) -> None:
+    """Register catalog administration routes."""
+    
+    @app.route('/api/admin/products/import', methods=['POST'])
+    @admin_required
+    @handle_api_errors
+    def import_products_route(current_user):
+        """Upsert products from an NDJSON or CSV request body, streamed."""
+        fmt = request.args.get('format') or format_for(content_type=request.mimetype)
+        if fmt not in FORMATS:
+            raise BadRequest(f'Unsupported format: {fmt}')
+        
+        stream = io.TextIOWrapper(request.stream, encoding='utf-8', newline='')
+        result = import_products(read_rows(stream, fmt), app.config['PRODUCT_IMPORT_BATCH_SIZE'])
+        logger.info("Product import by %s: %d inserted, %d updated, %d failed",
+                    current_user.email, result.inserted, result.updated, result.failed)
+        return jsonify(result.to_dict())
+    
+    @app.route('/api/admin/products/export', methods=['GET'])
+    @admin_required
+    @handle_api_errors
+    def export_products_route(current_user):
+        """Stream the whole catalog as NDJSON or CSV."""
+        fmt = request.args.get('format', 'ndjson')
+        if fmt not in FORMATS:
+            raise BadRequest(f'Unsupported format: {fmt}')
+        
+        mimetype = 'text/csv' if fmt == 'csv' else 'application/x-ndjson'
+        response = Response(stream_with_context(export_products(fmt)), mimetype=mimetype)
+        response.headers['Content-Disposition'] = f'attachment; filename=products.{fmt}'
+        return response
+
+
+def _register_cli_commands(app: Flask) -> None:
+    """Register maintenance commands."""
+    
+    @app.cli.command('release-reservations')
+    def release_reservations_command():
+        """Release stock held by abandoned checkouts."""
+        released = release_stale_reservations(
+            timedelta(minutes=app.config['RESERVATION_TIMEOUT_MINUTES'])
+        )
+        print(f'Released {released} stale reservations')
+    
+    @app.cli.command('purge-idempotency-keys')
+    def purge_idempotency_keys_command():
+        """Delete expired Idempotency-Key claims and stored responses."""
+        print(f'Purged {purge_expired_keys()} expired idempotency keys')
+
+
+def _register_inventory_commands(app: Flask) -> None:
+    """Register inventory ledger commands."""
+    
+    @app.cli.group('inventory')
+    def inventory_command():
+        """Audit and repair stock against the inventory ledger."""
+    
+    @inventory_command.command('audit')
+    def audit_command():
+        """List products whose stock disagrees with the ledger."""
+        drifted = audit_stock()
+        for row in drifted:
+            print(f"Product {row['product_id']}: stock {row['stock_quantity']}, "
+                  f"ledger {row['ledger_stock']}")
+        print(f'{len(drifted)} products out of balance')
+    
+    @inventory_command.command('rebuild')
+    def rebuild_command():
+        """Reset stock to the ledger totals."""
+        with database_transaction():
+            rebuilt = rebuild_stock()
+        print(f'Rebuilt stock for {rebuilt} products')
+    
+    @inventory_command.command('baseline')
+    def baseline_command():
+        """Record opening balances for products that predate the ledger."""
+        with database_transaction():
+            recorded = record_opening_balances()
+        print(f'Recorded {recorded} opening balances')
+
+
+def _register_catalog_commands(app: Flask) -> None:
+    """Register bulk catalog import and export commands."""
+    
+    @app.cli.group('products')
+    def products_command():
+        """Bulk import and export the product catalog."""
+    
+    @products_command.command('import')
+    @click.argument('source', type=click.File('rb'))
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file name.')
+    @click.option('--batch-size', default=lambda: app.config['PRODUCT_IMPORT_BATCH_SIZE'], type=int)
+    def import_command(source, fmt, batch_size):
+        """Upsert products from an NDJSON or CSV file ('-' for stdin)."""
+        fmt = fmt or format_for(filename=source.name)
+        started = time.perf_counter()
+        # newline='' lets the csv module handle line endings inside quoted fields
+        stream = io.TextIOWrapper(source, encoding='utf-8', newline='')
+        result = import_products(read_rows(stream, fmt), batch_size)
+        
+        for error in result.errors:
+            print(f"Line {error['line']}: {error['error']}")
+        print(f'Imported {result.inserted} new and {result.updated} updated products, '
+              f'{result.failed} failed ({time.perf_counter() - started:.1f}s)')
+    
+    @products_command.command('rebuild-facets')
+    def rebuild_facets_command():
+        """Recount the category facets from the products table."""
+        with database_transaction():
+            count = rebuild_category_facets(db.session.connection())
+        print(f'Rebuilt facets for {count} categories')
+    
+    @products_command.command('export')
+    @click.argument('target', type=click.File('wb'), default='-')
+    @click.option('--format', 'fmt', type=click.Choice(FORMATS), help='Defaults from the file name.')
+    def export_command(target, fmt):
+        """Write the catalog as NDJSON or CSV ('-' for stdout)."""
+        fmt = fmt or format_for(filename=target.name)
+        stream = io.TextIOWrapper(target, encoding='utf-8', newline='')
+        for chunk in export_products(fmt):
+            stream.write(chunk)
+        # Flush without closing the target, which may be stdout
+        stream.detach()
+
+
+def _register_job_commands(app: Flask) -> None:
+    """Register background job commands."""
+    
+    @app.cli.group('jobs')
+    def jobs_command():
+        """Run and inspect background jobs."""
+    
+    @jobs_command.command('worker')
+    @click.option('--threads', default=lambda: max(app.config['JOB_WORKER_THREADS'], 1), type=int)
+    def worker_command(threads):
+        """Run jobs until interrupted."""
+        worker = JobWorker(app, threads)
+        worker.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            print('Stopping after running jobs finish')
+            worker.stop()
+    
+    @jobs_command.command('run-pending')
+    def run_pending_command():
+        """Run every job that is due now, then exit."""
+        print(f'Ran {JobWorker(app).run_pending()} jobs')
+    
+    @jobs_command.command('status')
+    def status_command():
+        """Count jobs by type and status."""
+        for job_type, counts in sorted(job_counts().items()):
+            summary = ', '.join(f'{status} {count}' for status, count in sorted(counts.items()))
+            print(f'{job_type}: {summary}')
+    
+    @jobs_command.command('purge')
+    @click.option('--days', default=7, type=int, help='Keep jobs finished more recently.')
+    def purge_command(days):
+        """Delete finished jobs older than --days."""
+        print(f'Purged {purge_finished_jobs(timedelta(days=days))} finished jobs')
+
+
+def _register_schema_commands(app: Flask) -> None:
+    """Register schema migration commands."""
+    
+    @app.cli.group('schema')
+    def schema_command():
+        """Create missing tables and apply schema migrations."""
+    
+    @schema_command.command('upgrade')
+    def upgrade_command():
+        """Create missing tables, then apply pending migrations."""
+        db.create_all()
+        applied = upgrade(db.engine)
+        for migration in applied:
+            print(f'Applied {migration.version}: {migration.description}')
+        print(f'{len(applied)} migrations applied')
+    
+    @schema_command.command('status')
+    def status_command():
+        """List migrations not yet applied to the database."""
+        pending = pending_migrations(db.engine)
+        for migration in pending:
+            print(f'Pending {migration.version}: {migration.description}')
+        print(f'{len(pending)} migrations pending')
+
+
 def _register_error_handlers(app: Flask) -> None:
     """Register error handlers."""
     
@@ -636,19 +1365,42 @@ def seed_database() -> None:
         }
     ]
     
-    for product_data in sample_products:
-        if not Product.query.filter_by(name=product_data['name']).first():
-            product = Product(**product_data)
-            db.session.add(product)
+    # One lookup for all names, then one batched insert for the missing ones
+    names = [product_data['name'] for product_data in sample_products]
+    existing = {name for (name,) in db.session.query(Product.name).filter(Product.name.in_(names))}
+    db.session.add_all(
+        Product(**product_data) for product_data in sample_products
+        if product_data['name'] not in existing
+    )
     
     db.session.commit()
 
 
+def prepare_database(app: Flask) -> None:
+    """One-time startup work: create tables, migrate, seed, release stale reservations.
+    
+    Run once per deployment by whichever process starts the server, never
+    per worker, so concurrent workers do not race to create or seed.
+    """
+    with app.app_context():
+        db.create_all()
+        upgrade(db.engine)
+        
+        if Product.query.count() == 0:
+            seed_database()
+            logger.info("Database seeded with sample products")
+        
+        # Free stock held by checkouts interrupted by a previous shutdown
+        release_stale_reservations(timedelta(minutes=app.config['RESERVATION_TIMEOUT_MINUTES']))
+        purge_expired_keys()
+
+
 if __name__ == '__main__':
     app = create_app()
     
     with app.app_context():
         db.create_all()
+        upgrade(db.engine)
         seed_database()
     
     app.run(debug=True, host='0.0.0.0', port=5000)
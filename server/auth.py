@@ -1,9 +1,25 @@
 from functools import wraps
-from flask import request, jsonify, current_app
-from models import User
+from flask import Flask, request, jsonify, current_app, has_app_context
+from sqlalchemy import event
+from sqlalchemy.orm import make_transient_to_detached
+from models import db, User
+from cache import LRUCache
+import hashlib
+import time
 import jwt
 from datetime import datetime, timedelta
 
+def init_auth_cache(app: Flask) -> None:
+    """Attach verified-token and user-row caches to the app"""
+    app.extensions['auth_cache'] = {
+        'tokens': LRUCache(app.config['AUTH_TOKEN_CACHE_SIZE'], app.config['AUTH_TOKEN_CACHE_TTL']),
+        'users': LRUCache(app.config['AUTH_USER_CACHE_SIZE'], app.config['AUTH_USER_CACHE_TTL']),
+    }
+
+def _auth_cache(name):
+    caches = current_app.extensions.get('auth_cache')
+    return caches[name] if caches else None
+
 def generate_token(user_id, email):
     """Generate JWT token for user authentication"""
     payload = {
@@ -16,14 +32,82 @@ def generate_token(user_id, email):
     return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm='HS256')
 
 def decode_token(token):
-    """Decode JWT token and return user info"""
+    """Decode JWT token and return user info
+    
+    Verified claims are cached by token digest until the token expires, so
+    repeat requests skip signature verification.
+    """
+    cache = _auth_cache('tokens')
+    key = hashlib.sha256(token.encode()).digest()
+    
+    payload = cache.get(key) if cache is not None else None
+    if payload is not None:
+        if payload['exp'] > time.time():
+            return payload
+        cache.pop(key)
+        return None
+    
     try:
         payload = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=['HS256'])
-        return payload
     except jwt.ExpiredSignatureError:
         return None
     except jwt.InvalidTokenError:
         return None
+    
+    if cache is not None:
+        cache.set(key, payload, ttl=min(payload['exp'] - time.time(), cache.ttl))
+    return payload
+
+def bearer_user_id():
+    """Return the user id in the request's valid Bearer token, or None
+    
+    Only the token is checked; the user row is not loaded.
+    """
+    scheme, _, token = request.headers.get('Authorization', '').partition(' ')
+    if scheme != 'Bearer' or not token:
+        return None
+    payload = decode_token(token)
+    return payload['user_id'] if payload is not None else None
+
+def load_user(user_id):
+    """Return the user attached to the current session, using the row cache
+    
+    A cached row is attached without a SELECT, so routes can read and update
+    the user exactly as if it had been queried.
+    """
+    cache = _auth_cache('users')
+    row = cache.get(user_id) if cache is not None else None
+    
+    if row is None:
+        user = db.session.get(User, user_id)
+        if user is not None and cache is not None:
+            cache.set(user_id, {column.key: getattr(user, column.key) for column in User.__table__.columns})
+        return user
+    
+    user = User(**row)
+    make_transient_to_detached(user)
+    return db.session.merge(user, load=False)
+
+@event.listens_for(db.session, 'after_flush')
+def _track_user_changes(session, flush_context):
+    changed = {obj.id for obj in session.dirty | session.deleted if isinstance(obj, User)}
+    if changed:
+        session.info.setdefault('changed_user_ids', set()).update(changed)
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_changed_users(session):
+    changed = session.info.pop('changed_user_ids', None)
+    if not changed or not has_app_context():
+        return
+    
+    cache = _auth_cache('users')
+    if cache is not None:
+        for user_id in changed:
+            cache.pop(user_id)
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_user_changes(session):
+    session.info.pop('changed_user_ids', None)
 
 def token_required(f):
     """Decorator to require valid JWT token for protected routes"""
@@ -47,7 +131,7 @@ def token_required(f):
             if payload is None:
                 return jsonify({'error': 'Token is invalid or expired'}), 401
                 
-            current_user = User.query.get(payload['user_id'])
+            current_user = load_user(payload['user_id'])
             if not current_user:
                 return jsonify({'error': 'User not found'}), 401
                 
@@ -58,6 +142,18 @@ def token_required(f):
     
     return decorated
 
+def admin_required(f):
+    """Decorator for routes restricted to the addresses listed in ADMIN_EMAILS"""
+    @wraps(f)
+    @token_required
+    def decorated(current_user, *args, **kwargs):
+        if current_user.email.lower() not in current_app.config['ADMIN_EMAILS']:
+            return jsonify({'error': 'Admin access required'}), 403
+        
+        return f(current_user, *args, **kwargs)
+    
+    return decorated
+
 def optional_token(f):
     """Decorator for routes that can work with or without authentication"""
     @wraps(f)
@@ -70,7 +166,7 @@ def optional_token(f):
                 token = auth_header.split(" ")[1]
                 payload = decode_token(token)
                 if payload:
-                    current_user = User.query.get(payload['user_id'])
+                    current_user = load_user(payload['user_id'])
             except (IndexError, Exception):
                 pass  # Continue without user if token is invalid
         
@@ -0,0 +1,253 @@
+"""In-process catalog cache with LRU eviction, TTL and change tracking."""
+from __future__ import annotations
+
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Hashable, Iterable, Optional, Set, Tuple
+
+from flask import Flask, current_app, has_app_context
+from sqlalchemy import event, inspect
+
+from models import db, CatalogState, Product
+
+# Columns whose change can move a product between listings, reorder them or
+# change the category list. Any other column (stock) only changes content.
+STRUCTURAL_COLUMNS = frozenset({'name', 'description', 'price', 'category'})
+
+# Columns read by Product.to_dict(); a cached product fragment is reused only
+# while all of them still hold the values it was encoded from
+FRAGMENT_COLUMNS = ('name', 'description', 'price', 'category', 'image_url', 'stock_quantity')
+
+_MISSING = object()
+
+
+class LRUCache:
+    """Thread-safe mapping bounded by entry count, with per-entry expiry."""
+
+    def __init__(self, maxsize: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._clock = clock
+        self._data: 'OrderedDict[Hashable, Tuple[float, Any]]' = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self._lock:
+            entry = self._data.get(key, _MISSING)
+            if entry is _MISSING or entry[0] <= self._clock():
+                if entry is not _MISSING:
+                    del self._data[key]
+                self.misses += 1
+                return default
+            self._data.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None) -> None:
+        expires_at = self._clock() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def pop(self, key: Hashable) -> None:
+        with self._lock:
+            self._data.pop(key, None)
+
+    def discard_where(self, predicate: Callable[[Hashable, Any], bool]) -> None:
+        """Drop every entry for which ``predicate(key, value)`` is true."""
+        with self._lock:
+            for key in [key for key, (_, value) in self._data.items() if predicate(key, value)]:
+                del self._data[key]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+
+@dataclass
+class CatalogChanges:
+    """Product changes made in a transaction, applied to the cache on commit."""
+    content: Set[int] = field(default_factory=set)
+    structural: bool = False
+    categories: bool = False
+    version_bump_pending: bool = False
+
+    def __bool__(self) -> bool:
+        return bool(self.content) or self.structural or self.categories
+
+
+class CatalogCache:
+    """Serialized products, listing pages and the category list.
+
+    Each worker process holds its own cache. Commits made through this
+    process invalidate it immediately; entries built before a commit made by
+    another process are ignored once it bumps the catalog version. Product
+    fragments are checked against the freshly loaded row instead, so they
+    never go stale.
+    """
+
+    def __init__(self, max_products: int, max_listings: int, ttl: float):
+        self.products = LRUCache(max_products, ttl)
+        self.listings = LRUCache(max_listings, ttl)
+        # Keyed by whether the payload includes counts
+        self.categories = LRUCache(2, ttl)
+        self.fragments = LRUCache(max_products, float('inf'))
+
+    def get_product(self, product_id: int) -> Any:
+        return self.products.get(product_id)
+
+    def set_product(self, product_id: int, payload: Any) -> None:
+        self.products.set(product_id, payload)
+
+    def product_fragment(self, product: Product, encode: Callable[[], bytes]) -> bytes:
+        """Encoded JSON for ``product``, calling ``encode`` only when its columns changed."""
+        stamp = tuple(getattr(product, column) for column in FRAGMENT_COLUMNS)
+        entry = self.fragments.get(product.id)
+        if entry is not None and entry[0] == stamp:
+            return entry[1]
+        fragment = encode()
+        self.fragments.set(product.id, (stamp, fragment))
+        return fragment
+
+    def get_listing(self, key: Hashable) -> Any:
+        entry = self.listings.get(key)
+        return entry[0] if entry else None
+
+    def set_listing(self, key: Hashable, payload: Any, product_ids: Iterable[int]) -> None:
+        self.listings.set(key, (payload, frozenset(product_ids)))
+
+    def get_categories(self, counts: bool = False) -> Any:
+        return self.categories.get(counts)
+
+    def set_categories(self, payload: Any, counts: bool = False) -> None:
+        self.categories.set(counts, payload)
+
+    def apply(self, changes: CatalogChanges) -> None:
+        """Invalidate exactly what ``changes`` can have made stale."""
+        for product_id in changes.content:
+            self.products.pop(product_id)
+
+        if changes.structural:
+            self.listings.clear()
+        elif changes.content:
+            self.listings.discard_where(lambda key, entry: not entry[1].isdisjoint(changes.content))
+
+        if changes.categories:
+            self.categories.clear()
+        elif changes.content:
+            # Any stock change may move an in-stock count
+            self.categories.pop(True)
+
+    def clear(self) -> None:
+        self.products.clear()
+        self.listings.clear()
+        self.categories.clear()
+        self.fragments.clear()
+
+
+def init_catalog_cache(app: Flask) -> None:
+    """Attach a catalog cache to ``app`` unless disabled by configuration."""
+    if not app.config['CATALOG_CACHE_ENABLED']:
+        return
+
+    app.extensions['catalog_cache'] = CatalogCache(
+        max_products=app.config['CATALOG_CACHE_MAX_PRODUCTS'],
+        max_listings=app.config['CATALOG_CACHE_MAX_LISTINGS'],
+        ttl=app.config['CATALOG_CACHE_TTL'],
+    )
+
+
+def get_catalog_cache() -> Optional[CatalogCache]:
+    """Return the current app's catalog cache, or None when disabled."""
+    return current_app.extensions.get('catalog_cache')
+
+
+def pending_catalog_changes(session) -> CatalogChanges:
+    """Changes recorded on ``session`` that have not been committed yet."""
+    return session.info.setdefault('catalog_changes', CatalogChanges())
+
+
+def note_product_changes(session, product_ids: Iterable[int], structural: bool = False) -> None:
+    """Record product changes made outside the ORM, e.g. with bulk UPDATEs."""
+    changes = pending_catalog_changes(session)
+    changes.content.update(product_ids)
+    if structural:
+        changes.structural = True
+        changes.categories = True
+    changes.version_bump_pending = True
+
+
+@event.listens_for(db.session, 'after_flush')
+def _track_product_changes(session, flush_context):
+    changes = pending_catalog_changes(session)
+    changed = False
+
+    for obj in session.new:
+        if isinstance(obj, Product):
+            changes.structural = True
+            changes.categories = True
+            changed = True
+
+    for obj in session.deleted:
+        if isinstance(obj, Product):
+            changes.content.add(obj.id)
+            changes.structural = True
+            changes.categories = True
+            changed = True
+
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        state = inspect(obj)
+        modified = {
+            attr.key for attr in state.mapper.column_attrs
+            if state.attrs[attr.key].history.has_changes()
+        }
+        if not modified:
+            continue
+        changes.content.add(obj.id)
+        changed = True
+        if modified & STRUCTURAL_COLUMNS:
+            changes.structural = True
+        if 'category' in modified:
+            changes.categories = True
+
+    # The version moves in the same transaction as the change, so every
+    # worker sees it as soon as the change itself is visible
+    if changed:
+        CatalogState.bump(session.connection())
+
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_version_for_noted_changes(session):
+    # Noted changes bump the version once per transaction rather than once
+    # per statement
+    changes = session.info.get('catalog_changes')
+    if changes is not None and changes.version_bump_pending:
+        CatalogState.bump(session.connection())
+        changes.version_bump_pending = False
+
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_product_changes(session):
+    changes = session.info.pop('catalog_changes', None)
+    if not changes or not has_app_context():
+        return
+
+    cache = get_catalog_cache()
+    if cache is not None:
+        cache.apply(changes)
+
+
+@event.listens_for(db.session, 'after_rollback')
+def _discard_product_changes(session):
+    session.info.pop('catalog_changes', None)
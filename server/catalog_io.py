@@ -0,0 +1,267 @@
+"""Streaming bulk product import and export (NDJSON and CSV)."""
+from __future__ import annotations
+
+import csv
+import io
+import json
+import math
+from dataclasses import dataclass, field
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, TextIO, Tuple
+
+import sqlalchemy as sa
+
+from models import db, Product
+from cache import note_product_changes
+from inventory import record_movements
+
+FORMATS = ('ndjson', 'csv')
+FIELDS = ('id', 'name', 'description', 'price', 'category', 'image_url', 'stock_quantity')
+MAX_REPORTED_ERRORS = 100
+EXPORT_CHUNK_SIZE = 1000
+
+_products = Product.__table__
+
+
+@dataclass
+class ImportResult:
+    inserted: int = 0
+    updated: int = 0
+    failed: int = 0
+    errors: List[Dict[str, Any]] = field(default_factory=list)
+
+    def add_error(self, line: int, message: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'line': line, 'error': message})
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'inserted': self.inserted,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+        }
+
+
+def format_for(filename: Optional[str] = None, content_type: Optional[str] = None) -> str:
+    """Guess the file format from a name or MIME type, defaulting to NDJSON."""
+    if (filename and filename.lower().endswith('.csv')) or (content_type and 'csv' in content_type):
+        return 'csv'
+    return 'ndjson'
+
+
+def read_rows(stream: TextIO, fmt: str) -> Iterator[Tuple[int, Any]]:
+    """Yield ``(line_number, raw_row)`` pairs, one line in memory at a time.
+
+    Unparseable lines are yielded as exceptions so the importer can report
+    them without stopping.
+    """
+    if fmt == 'csv':
+        reader = csv.DictReader(stream)
+        for row in reader:
+            yield reader.line_num, row
+        return
+
+    for line_number, line in enumerate(stream, 1):
+        if not line.strip():
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f'Invalid JSON: {e}')
+
+
+def _optional_text(row: Dict[str, Any], key: str, max_length: Optional[int] = None) -> Optional[str]:
+    value = row.get(key)
+    if value is None or value == '':
+        return None
+    value = str(value).strip()
+    if max_length and len(value) > max_length:
+        raise ValueError(f'{key} exceeds {max_length} characters')
+    return value
+
+
+def _integer(value: Any, key: str) -> int:
+    # int() would accept True and truncate 1.5, so only whole numbers pass
+    if isinstance(value, bool):
+        raise ValueError(f'{key} must be an integer')
+    if isinstance(value, float):
+        if not value.is_integer():
+            raise ValueError(f'{key} must be an integer')
+        return int(value)
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f'{key} must be an integer')
+
+
+def validate_row(row: Any) -> Dict[str, Any]:
+    """Normalize one raw row, raising ValueError with a readable reason."""
+    if isinstance(row, Exception):
+        raise row
+    if not isinstance(row, dict):
+        raise ValueError('Row must be an object')
+
+    product: Dict[str, Any] = {}
+
+    raw_id = row.get('id')
+    if raw_id not in (None, ''):
+        product['id'] = _integer(raw_id, 'id')
+        if product['id'] <= 0:
+            raise ValueError('id must be positive')
+
+    name = _optional_text(row, 'name', 100)
+    if not name:
+        raise ValueError('name is required')
+    product['name'] = name
+
+    price = row.get('price')
+    if isinstance(price, bool):
+        raise ValueError('price must be a number')
+    try:
+        product['price'] = round(float(price), 2)
+    except (TypeError, ValueError):
+        raise ValueError('price must be a number')
+    if not math.isfinite(product['price']):
+        raise ValueError('price must be a finite number')
+    if product['price'] < 0:
+        raise ValueError('price cannot be negative')
+
+    product['description'] = _optional_text(row, 'description')
+    product['category'] = _optional_text(row, 'category', 50)
+    product['image_url'] = _optional_text(row, 'image_url', 200)
+
+    stock = row.get('stock_quantity')
+    if stock in (None, ''):
+        product['stock_quantity'] = None
+    else:
+        product['stock_quantity'] = _integer(stock, 'stock_quantity')
+        if product['stock_quantity'] < 0:
+            raise ValueError('stock_quantity cannot be negative')
+
+    return product
+
+
+def _existing_stock(product_ids: List[int]) -> Dict[int, int]:
+    stock: Dict[int, int] = {}
+    for start in range(0, len(product_ids), 500):
+        chunk = product_ids[start:start + 500]
+        rows = db.session.execute(
+            sa.select(_products.c.id, _products.c.stock_quantity).where(_products.c.id.in_(chunk))
+        )
+        stock.update((row.id, row.stock_quantity or 0) for row in rows)
+    return stock
+
+
+def _apply_batch(batch: List[Dict[str, Any]], result: ImportResult) -> None:
+    """Upsert one batch in a single transaction with one statement per kind."""
+    keyed = {row['id']: row for row in batch if 'id' in row}
+    unkeyed = [row for row in batch if 'id' not in row]
+    existing = _existing_stock(list(keyed))
+
+    updates, inserts, movements = [], [], []
+    for product_id, row in keyed.items():
+        if product_id in existing:
+            old_stock = existing[product_id]
+            new_stock = old_stock if row['stock_quantity'] is None else row['stock_quantity']
+            updates.append(dict(row, b_id=product_id, stock_quantity=new_stock))
+            if new_stock != old_stock:
+                movements.append({'product_id': product_id, 'delta': new_stock - old_stock,
+                                  'reason': 'import'})
+        else:
+            inserts.append(row)
+
+    if updates:
+        db.session.execute(
+            _products.update().where(_products.c.id == sa.bindparam('b_id')),
+            [{key: row[key] for key in ('b_id', 'name', 'description', 'price', 'category',
+                                        'image_url', 'stock_quantity')} for row in updates]
+        )
+
+    new_rows = inserts + unkeyed
+    for row in new_rows:
+        row['stock_quantity'] = row['stock_quantity'] or 0
+    if inserts:
+        db.session.execute(sa.insert(_products), inserts)
+    if unkeyed:
+        # RETURNING gives the new ids, in input order, for the ledger rows
+        new_ids = db.session.execute(
+            sa.insert(_products).returning(_products.c.id, sort_by_parameter_order=True), unkeyed
+        ).scalars().all()
+        for row, product_id in zip(unkeyed, new_ids):
+            row['id'] = product_id
+    movements.extend(
+        {'product_id': row['id'], 'delta': row['stock_quantity'], 'reason': 'import'}
+        for row in new_rows if row['stock_quantity']
+    )
+    record_movements(movements)
+
+    note_product_changes(db.session, [row['id'] for row in updates + new_rows], structural=True)
+    db.session.commit()
+    result.inserted += len(new_rows)
+    result.updated += len(updates)
+
+
+def import_products(rows: Iterable[Tuple[int, Any]], batch_size: int = 1000) -> ImportResult:
+    """Validate and upsert rows, committing every ``batch_size`` valid rows.
+
+    Rows with an ``id`` replace that product (keeping its stock when
+    ``stock_quantity`` is blank) or create it with that id; rows without one
+    are inserted. Stock differences are recorded in the inventory ledger.
+    Invalid rows, and rows repeating an earlier row's id, are skipped and
+    reported; memory use depends on the batch size and the number of ids.
+    """
+    result = ImportResult()
+    batch: List[Dict[str, Any]] = []
+    seen_ids: Set[int] = set()
+    try:
+        for line_number, raw in rows:
+            try:
+                product = validate_row(raw)
+                if 'id' in product:
+                    if product['id'] in seen_ids:
+                        raise ValueError(f"id {product['id']} appears more than once")
+                    seen_ids.add(product['id'])
+            except ValueError as e:
+                result.add_error(line_number, str(e))
+                continue
+            batch.append(product)
+            if len(batch) >= batch_size:
+                _apply_batch(batch, result)
+                batch = []
+        if batch:
+            _apply_batch(batch, result)
+    except Exception:
+        db.session.rollback()
+        raise
+    return result
+
+
+def export_products(fmt: str) -> Iterator[str]:
+    """Yield the catalog as NDJSON lines or CSV text, reading by id range."""
+    if fmt == 'csv':
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+        writer.writeheader()
+
+    columns = [_products.c[name] for name in FIELDS]
+    last_id = 0
+    while True:
+        rows = db.session.execute(
+            sa.select(*columns).where(_products.c.id > last_id)
+            .order_by(_products.c.id).limit(EXPORT_CHUNK_SIZE)
+        ).mappings().all()
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+
+        if fmt == 'csv':
+            writer.writerows(rows)
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+        else:
+            yield ''.join(json.dumps(dict(row), sort_keys=True) + '\n' for row in rows)
+
+    if fmt == 'csv' and buffer.tell():
+        yield buffer.getvalue()
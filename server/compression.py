@@ -0,0 +1,99 @@
+"""Negotiated gzip/brotli response compression with cached variants."""
+from __future__ import annotations
+
+import gzip
+from typing import Dict, Optional
+
+from flask import Flask, Response, request
+
+from metrics import timed
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - optional dependency
+    brotli = None
+
+# Preferred first when the client rates encodings equally
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+
+
+def compress(data: bytes, encoding: str, gzip_level: int, brotli_quality: int) -> bytes:
+    if encoding == 'br':
+        return brotli.compress(data, quality=brotli_quality)
+    return gzip.compress(data, compresslevel=gzip_level, mtime=0)
+
+
+def encoded_etag(etag: str, encoding: str) -> str:
+    """The ETag of the ``encoding`` variant of a representation.
+
+    Each encoding is a different representation, so it needs its own strong
+    ETag; the suffix is stripped again when comparing If-None-Match.
+    """
+    return f'{etag}-{encoding}'
+
+
+def etag_variants(etag: str):
+    """The ETag of every variant the server may have sent for ``etag``."""
+    return [etag] + [encoded_etag(etag, encoding) for encoding in ENCODINGS]
+
+
+def negotiate_encoding() -> Optional[str]:
+    """Pick the best supported encoding from Accept-Encoding, if any."""
+    accepted = request.accept_encodings
+    best, best_quality = None, 0
+    for encoding in ENCODINGS:
+        quality = accepted.quality(encoding)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def cache_compressed_variants(response: Response, variants: Dict[str, bytes]) -> Response:
+    """Let the compression step reuse and fill ``variants`` for this body.
+
+    Catalog payloads pass the dict stored with them, so an identical body is
+    compressed once per encoding rather than on every request.
+    """
+    response.compressed_variants = variants
+    return response
+
+
+def init_compression(app: Flask) -> None:
+    """Compress eligible responses of ``app`` unless disabled by configuration."""
+    if not app.config['COMPRESSION_ENABLED']:
+        return
+
+    min_size = app.config['COMPRESSION_MIN_SIZE']
+    mimetypes = frozenset(app.config['COMPRESSION_MIMETYPES'])
+    gzip_level = app.config['COMPRESSION_GZIP_LEVEL']
+    brotli_quality = app.config['COMPRESSION_BROTLI_QUALITY']
+
+    @app.after_request
+    def compress_response(response: Response) -> Response:
+        if (response.mimetype not in mimetypes or response.direct_passthrough
+                or response.is_streamed or 'Content-Encoding' in response.headers):
+            return response
+
+        # The body depends on Accept-Encoding even when left uncompressed
+        response.vary.add('Accept-Encoding')
+        if response.status_code != 200 or response.content_length < min_size:
+            return response
+
+        encoding = negotiate_encoding()
+        if encoding is None:
+            return response
+
+        with timed('compress'):
+            variants = getattr(response, 'compressed_variants', None)
+            body = variants.get(encoding) if variants is not None else None
+            if body is None:
+                body = compress(response.get_data(), encoding, gzip_level, brotli_quality)
+                if variants is not None:
+                    variants[encoding] = body
+
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(encoded_etag(etag, encoding), weak=weak)
+        return response
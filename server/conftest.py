@@ -1,9 +1,13 @@
 import pytest
 import tempfile
 import os
+import json
+from contextlib import contextmanager
+from sqlalchemy import event
 from app import create_app
 from models import db, Product, User
 from auth import generate_token
+from query_inspection import QueryRecorder
 
 @pytest.fixture
 def app():
@@ -14,7 +18,10 @@ def app():
         'TESTING': True,
         'DATABASE': db_path,
         'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
-        'WTF_CSRF_ENABLED': False
+        'WTF_CSRF_ENABLED': False,
+        # Full-cost hashing would dominate the suite; test_passwords covers the pool
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 0,
     })
     
     with app.app_context():
@@ -25,6 +32,84 @@ def app():
     os.close(db_fd)
     os.unlink(db_path)
 
+@pytest.fixture
+def query_counter(app):
+    """Collect the SQL statements issued against the app's engine."""
+    statements = []
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', record)
+    yield statements
+    event.remove(engine, 'before_cursor_execute', record)
+
+@pytest.fixture
+def query_budget(app):
+    """Fail if a block issues more than ``max_queries`` statements or an N+1."""
+    with app.app_context():
+        engine = db.engine
+    
+    @contextmanager
+    def budget(max_queries, repeat_threshold=None):
+        # The same N+1 rule the app reports on, unless a test tightens it
+        threshold = repeat_threshold or app.config['N_PLUS_ONE_THRESHOLD']
+        with QueryRecorder(engine) as recorder:
+            yield recorder
+        recorder.assert_within(max_queries, threshold)
+    
+    return budget
+
+class FakeClock:
+    """A clock for caches and rate limiters that moves only when told to."""
+    
+    def __init__(self):
+        self.now = 1000.0
+    
+    def __call__(self):
+        return self.now
+
+@pytest.fixture
+def clock():
+    """A fake clock; advance it by adding to ``clock.now``."""
+    return FakeClock()
+
+@pytest.fixture
+def checkout_body():
+    """Build a guest checkout of one product, as sent by the storefront."""
+    def build(product_id=1, quantity=2):
+        return {
+            'items': [{'product_id': product_id, 'quantity': quantity}],
+            'shipping_info': {'address': '1 Main St', 'city': 'Town', 'state': 'TS', 'zip': '12345'},
+            'payment_method': 'stripe'
+        }
+    
+    return build
+
+@pytest.fixture
+def checkout(checkout_body):
+    """POST a checkout from a test client, optionally with an Idempotency-Key."""
+    def post(client, quantity=2, product_id=1, key=None, body=None, headers=None, ip='127.0.0.1'):
+        headers = dict(headers or {})
+        if key is not None:
+            headers['Idempotency-Key'] = key
+        body = body or checkout_body(product_id, quantity)
+        return client.post('/api/checkout', data=json.dumps(body), content_type='application/json',
+                           headers=headers, environ_base={'REMOTE_ADDR': ip})
+    
+    return post
+
+@pytest.fixture
+def stock(app):
+    """Read a product's stock from the database, bypassing every cache."""
+    def read(product_id=1):
+        with app.app_context():
+            return db.session.get(Product, product_id).stock_quantity
+    
+    return read
+
 @pytest.fixture
 def client(app):
     """A test client for the app."""
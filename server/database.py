@@ -1,7 +1,9 @@
 import os
 import sqlalchemy
-from sqlalchemy import create_engine
-from sqlalchemy.pool import StaticPool
+from flask import current_app, g, has_request_context
+from flask_sqlalchemy.session import Session
+from sqlalchemy import create_engine, event
+from sqlalchemy.pool import QueuePool
 from dotenv import load_dotenv
 
 load_dotenv()
@@ -13,16 +15,91 @@ def get_database_url():
     # TODO: Add Turso integration later once deployment is stable
     return os.getenv('DATABASE_URL', 'sqlite:///quickcart.db')
 
-def create_database_engine():
+def get_database_profile():
+    """Get the engine profile name: DATABASE_PROFILE, else derived from FLASK_ENV"""
+    default = 'production' if os.getenv('FLASK_ENV') == 'production' else 'development'
+    return os.getenv('DATABASE_PROFILE', default)
+
+def get_sqlite_pragmas(profile):
+    """PRAGMAs applied to every new SQLite connection for a profile
+
+    Production runs in WAL mode: readers work from a snapshot and never wait
+    for the writer, and the writer never waits for readers. synchronous=NORMAL
+    is durable across application crashes in WAL mode and only risks the last
+    transactions on power loss. busy_timeout makes concurrent writers queue
+    instead of failing with "database is locked".
+    """
+    busy_timeout = int(os.getenv('SQLITE_BUSY_TIMEOUT_MS', 5000))
+
+    if profile != 'production':
+        return {'busy_timeout': busy_timeout}
+
+    return {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'busy_timeout': busy_timeout,
+        # Negative cache_size is in KiB rather than pages
+        'cache_size': -int(os.getenv('SQLITE_CACHE_SIZE_KB', 65536)),
+        'mmap_size': int(os.getenv('SQLITE_MMAP_SIZE', 268435456)),
+        'temp_store': 'MEMORY',
+    }
+
+def get_engine_options(profile):
+    """SQLAlchemy engine options for a profile"""
+    if profile != 'production':
+        return {
+            'pool_pre_ping': True,
+            'pool_recycle': 300,
+        }
+
+    # A local SQLite file never drops connections, so pre-ping and recycling
+    # only cost round-trips. Each thread checks out its own connection, so a
+    # thread reading in WAL mode is never serialized behind the one writing.
+    return {
+        'poolclass': QueuePool,
+        'pool_size': int(os.getenv('SQLITE_POOL_SIZE', 8)),
+        'max_overflow': int(os.getenv('SQLITE_POOL_OVERFLOW', 8)),
+        'pool_timeout': 30,
+        'connect_args': {'check_same_thread': False},
+    }
+
+def configure_sqlite_engine(engine, pragmas):
+    """Apply PRAGMAs whenever the engine opens a new SQLite connection"""
+    if engine.dialect.name != 'sqlite' or not pragmas:
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        try:
+            for name, value in pragmas.items():
+                cursor.execute(f'PRAGMA {name}={value}')
+        finally:
+            cursor.close()
+
+def create_database_engine(profile=None):
     """Create database engine with appropriate settings"""
-    database_url = get_database_url()
-    
-    # SQLite configuration for all environments
-    return create_engine(
-        database_url,
-        poolclass=StaticPool,
-        connect_args={
-            "check_same_thread": False,
-        },
-        echo=os.getenv('FLASK_ENV') == 'development'
+    profile = profile or get_database_profile()
+
+    engine = create_engine(
+        get_database_url(),
+        echo=os.getenv('FLASK_ENV') == 'development',
+        **get_engine_options(profile)
     )
+    configure_sqlite_engine(engine, get_sqlite_pragmas(profile))
+    return engine
+
+class RoutingSession(Session):
+    """Session that binds to the read engine inside ``read_only`` views
+
+    Flushes always go to the primary, so a read-only view that writes fails
+    loudly there instead of being refused by a read-only connection.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and _reading_from_reader():
+            return current_app.extensions['read_engine']
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+def _reading_from_reader():
+    return has_request_context() and g.get('use_read_engine', False)
@@ -0,0 +1,134 @@
+"""Category facets: per-category product counts maintained by triggers."""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict, List
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+
+from models import db, Product
+from sqlite_tables import OptionalTable
+
+logger = logging.getLogger(__name__)
+
+FACETS_TABLE = 'category_facets'
+
+_IN_STOCK = 'coalesce({row}.stock_quantity, 0) > 0'
+
+# Counts change only when a product enters or leaves a category or crosses
+# the in-stock boundary, so ordinary checkout decrements skip the trigger
+# body entirely. Triggers cover every write path: ORM flushes, bulk imports
+# and the inventory module's UPDATE statements alike.
+_ADD = f"""
+    INSERT INTO {FACETS_TABLE} (name, product_count, in_stock_count)
+    SELECT new.category, 1, {_IN_STOCK.format(row='new')} WHERE coalesce(new.category, '') != ''
+    ON CONFLICT (name) DO UPDATE SET
+        product_count = product_count + 1,
+        in_stock_count = in_stock_count + excluded.in_stock_count;
+"""
+
+_REMOVE = f"""
+    UPDATE {FACETS_TABLE} SET
+        product_count = product_count - 1,
+        in_stock_count = in_stock_count - ({_IN_STOCK.format(row='old')})
+    WHERE name = old.category;
+    DELETE FROM {FACETS_TABLE} WHERE name = old.category AND product_count <= 0;
+"""
+
+_FACETS_DDL = [
+    f"""
+    CREATE TABLE IF NOT EXISTS {FACETS_TABLE} (
+        name VARCHAR(50) PRIMARY KEY,
+        product_count INTEGER NOT NULL DEFAULT 0,
+        in_stock_count INTEGER NOT NULL DEFAULT 0
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FACETS_TABLE}_ai AFTER INSERT ON products BEGIN
+        {_ADD}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FACETS_TABLE}_ad AFTER DELETE ON products BEGIN
+        {_REMOVE}
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FACETS_TABLE}_au
+    AFTER UPDATE OF category, stock_quantity ON products
+    WHEN old.category IS NOT new.category
+        OR ({_IN_STOCK.format(row='old')}) != ({_IN_STOCK.format(row='new')})
+    BEGIN
+        {_REMOVE}
+        {_ADD}
+    END
+    """,
+]
+
+_facets = sa.table(
+    FACETS_TABLE, sa.column('name'), sa.column('product_count'), sa.column('in_stock_count')
+)
+
+_facets_table = OptionalTable(FACETS_TABLE)
+
+
+def rebuild_category_facets(connection: Connection) -> int:
+    """Recount every category from ``products``; returns the category count."""
+    connection.execute(_facets.delete())
+    connection.execute(sa.text(f"""
+        INSERT INTO {FACETS_TABLE} (name, product_count, in_stock_count)
+        SELECT category, count(*), sum({_IN_STOCK.format(row='products')})
+        FROM products WHERE coalesce(category, '') != '' GROUP BY category
+    """))
+    return connection.execute(sa.select(sa.func.count()).select_from(_facets)).scalar()
+
+
+def ensure_category_facets(connection: Connection) -> bool:
+    """Create the facets table and its triggers, counting existing products.
+
+    Returns False on other dialects, which aggregate ``products`` instead.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    created = not _facets_table.exists(connection)
+    for statement in _FACETS_DDL:
+        connection.execute(sa.text(statement))
+    if created:
+        count = rebuild_category_facets(connection)
+        logger.info("Built category facets for %d categories", count)
+
+    _facets_table.mark_available(connection.engine)
+    return True
+
+
+@event.listens_for(Product.metadata, 'after_create')
+def _create_category_facets(target, connection, **kw):
+    ensure_category_facets(connection)
+
+
+def facets_available() -> bool:
+    """Check whether the current database has the facets table."""
+    return _facets_table.available(db.engine)
+
+
+def category_facets() -> List[Dict[str, Any]]:
+    """Every category with its product and in-stock counts, by name.
+
+    Reads one row per category from the facets table, or aggregates
+    ``products`` when the database has no facets table.
+    """
+    if facets_available():
+        query = sa.select(_facets.c.name, _facets.c.product_count, _facets.c.in_stock_count)
+    else:
+        in_stock = sa.case((sa.func.coalesce(Product.stock_quantity, 0) > 0, 1), else_=0)
+        query = (
+            sa.select(Product.category.label('name'), sa.func.count().label('product_count'),
+                      sa.func.sum(in_stock).label('in_stock_count'))
+            .where(sa.func.coalesce(Product.category, '') != '')
+            .group_by(Product.category)
+        )
+    rows = db.session.execute(query.order_by('name')).mappings()
+    return [dict(row) for row in rows]
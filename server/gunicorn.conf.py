@@ -0,0 +1,94 @@
+"""Gunicorn settings for the production API server.
+
+Start with ``gunicorn -c gunicorn.conf.py wsgi:app`` from the server
+directory. The app is imported once in the master and forked into the
+workers, and startup database work runs once in the master. Each worker
+also runs JOB_WORKER_THREADS background job threads.
+
+Signals: HUP reloads the configuration and gracefully replaces the workers,
+TTIN/TTOU add or remove a worker, and USR2 followed by TERM to the old
+master upgrades to new code without dropping connections.
+"""
+import multiprocessing
+import os
+import tempfile
+
+bind = f"0.0.0.0:{os.getenv('PORT', '5000')}"
+
+# WEB_CONCURRENCY is the process count hosting platforms already set
+workers = int(os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.getenv('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+preload_app = True
+
+# Workers share request metrics through snapshot files, so /api/metrics
+# reports on every worker whichever one serves the scrape
+os.environ.setdefault('METRICS_DIR', os.path.join(tempfile.gettempdir(), 'quickcart-metrics'))
+
+# Rate limit buckets live in one SQLite file, so a client's limit holds
+# whichever worker serves it rather than once per worker
+os.environ.setdefault('RATE_LIMIT_STORAGE', os.path.join(tempfile.gettempdir(), 'quickcart-rate-limits.db'))
+
+# Recycle workers periodically so slow leaks cannot accumulate; the jitter
+# keeps them from all restarting at once
+max_requests = int(os.getenv('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.getenv('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.getenv('GUNICORN_GRACEFUL_TIMEOUT', 30))
+keepalive = int(os.getenv('GUNICORN_KEEPALIVE', 5))
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.getenv('GUNICORN_LOG_LEVEL', 'info')
+
+
+def on_starting(server):
+    """Create, seed and clean up the database once, before forking."""
+    from app import prepare_database
+    from metrics import clear_metrics_dir
+    from read_routing import database_engines
+
+    app = server.app.wsgi()
+    prepare_database(app)
+    clear_metrics_dir(os.environ['METRICS_DIR'])
+
+    # Do not hand the master's open connections to the workers
+    with app.app_context():
+        for engine in database_engines():
+            engine.dispose()
+
+
+def post_fork(server, worker):
+    """Give each worker its own connection pool and background job threads."""
+    from jobs import JobWorker
+    from read_routing import database_engines
+
+    app = server.app.wsgi()
+    with app.app_context():
+        for engine in database_engines():
+            engine.dispose(close=False)
+
+    threads = app.config['JOB_WORKER_THREADS']
+    if threads > 0:
+        worker.job_worker = JobWorker(app, threads)
+        worker.job_worker.start()
+
+
+def worker_exit(server, worker):
+    """Let running jobs finish and write final metrics before the worker goes away."""
+    job_worker = getattr(worker, 'job_worker', None)
+    if job_worker is not None:
+        job_worker.stop(timeout=graceful_timeout)
+
+    metrics = server.app.wsgi().extensions.get('metrics')
+    if metrics is not None:
+        metrics.flush()
+
+
+def child_exit(server, worker):
+    """Fold an exited worker's metrics into the retired workers' snapshot."""
+    from metrics import retire_worker_metrics
+
+    retire_worker_metrics(os.environ['METRICS_DIR'], worker.pid)
@@ -0,0 +1,124 @@
+"""Conditional GET support: ETag, Last-Modified and Cache-Control."""
+from __future__ import annotations
+
+import hashlib
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+from flask import Response, current_app, jsonify, request
+
+from compression import cache_compressed_variants, etag_variants
+from models import CatalogState
+
+
+@dataclass(frozen=True)
+class Validators:
+    """Validators describing one representation of a resource.
+
+    ``version`` is the catalog version for catalog resources.
+    """
+    etag: str
+    last_modified: Optional[datetime] = None
+    version: Optional[int] = None
+
+
+@dataclass(frozen=True)
+class CatalogPayload:
+    """An encoded catalog response body and the validators it was built under.
+
+    ``variants`` holds compressed copies of ``body`` by content coding,
+    filled in as clients ask for them.
+    """
+    body: bytes
+    validators: Validators
+    variants: Dict[str, bytes] = field(default_factory=dict, compare=False, repr=False)
+
+
+def _digest(*parts: Any) -> str:
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:20]
+
+
+def catalog_validators(*key_parts: Any) -> Validators:
+    """Validators for a catalog resource at the current catalog version.
+
+    This costs a single primary-key read, so it can run before any product
+    query or serialization.
+    """
+    version, updated_at = CatalogState.current()
+    return Validators(
+        etag=f'{version}-{_digest(version, *key_parts)}',
+        last_modified=updated_at,
+        version=version
+    )
+
+
+def content_validators(*key_parts: Any) -> Validators:
+    """Validators for a resource identified only by its own state."""
+    return Validators(etag=_digest(*key_parts))
+
+
+def is_not_modified(validators: Validators) -> bool:
+    """Check the request's conditional headers against ``validators``.
+
+    If-None-Match takes precedence over If-Modified-Since, and is matched
+    with the weak comparison, as required by RFC 9110: proxies that alter
+    the body send our ETags back with a ``W/`` prefix.
+    """
+    if request.if_none_match:
+        return _matched_etag(validators) is not None
+
+    if request.if_modified_since and validators.last_modified:
+        last_modified = validators.last_modified.replace(microsecond=0)
+        return last_modified <= request.if_modified_since.replace(tzinfo=None)
+
+    return False
+
+
+def _matched_etag(validators: Validators) -> Optional[str]:
+    """The ETag in If-None-Match of the variant the client holds, if current."""
+    # A compressed variant's ETag is the plain one plus a coding suffix
+    return next((etag for etag in etag_variants(validators.etag)
+                 if request.if_none_match.contains_weak(etag)), None)
+
+
+def _apply_headers(response: Response, validators: Validators) -> Response:
+    response.set_etag(validators.etag)
+    if validators.last_modified:
+        response.last_modified = validators.last_modified
+    cache_control = current_app.config['CACHE_CONTROL'].get(request.endpoint)
+    if cache_control:
+        response.headers['Cache-Control'] = cache_control
+    return response
+
+
+def not_modified(validators: Validators) -> Response:
+    """An empty 304 response carrying the current validators.
+
+    Its ETag and Vary match the 200 the client revalidates, which may have
+    been a compressed variant.
+    """
+    response = _apply_headers(Response(status=304), validators)
+    if request.if_none_match:
+        response.set_etag(_matched_etag(validators) or validators.etag)
+    if current_app.config['COMPRESSION_ENABLED']:
+        response.vary.add('Accept-Encoding')
+    return response
+
+
+def conditional_json(body: Any, validators: Validators) -> Response:
+    """A JSON response carrying validators and the endpoint's Cache-Control.
+
+    ``body`` may be already-encoded JSON bytes, which are sent as they are.
+    """
+    if isinstance(body, bytes):
+        response = current_app.response_class(body, mimetype='application/json')
+    else:
+        response = jsonify(body)
+    return _apply_headers(response, validators)
+
+
+def payload_response(payload: CatalogPayload) -> Response:
+    """A conditional response for a cached payload, reusing its compressed copies."""
+    response = conditional_json(payload.body, payload.validators)
+    return cache_compressed_variants(response, payload.variants)
@@ -0,0 +1,173 @@
+"""Idempotency-Key support: run a request once, replay its response to retries."""
+from __future__ import annotations
+
+import hashlib
+import logging
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Optional
+
+import sqlalchemy as sa
+from flask import Response, current_app, jsonify, request
+from sqlalchemy.exc import IntegrityError
+
+from admission import address_is_proxy, client_ip
+from models import db, IdempotencyRecord
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'Idempotency-Key'
+REPLAYED_HEADER = 'Idempotent-Replayed'
+MAX_KEY_LENGTH = 255
+
+_records = IdempotencyRecord.__table__
+
+
+def _error(message: str, status: int, retry_after: Optional[int] = None) -> Response:
+    response = jsonify({'error': message})
+    response.status_code = status
+    if retry_after:
+        response.headers['Retry-After'] = str(retry_after)
+    return response
+
+
+def _claim(scope: str, key: str, request_hash: str) -> Optional[sa.Row]:
+    """Record an in-flight claim on ``key``; return the existing row if taken.
+
+    Runs on its own connection and commits at once, so concurrent duplicates
+    in any worker process see the claim before the first request finishes.
+    """
+    now = datetime.utcnow()
+    lock_seconds = current_app.config['IDEMPOTENCY_LOCK_SECONDS']
+    with db.engine.begin() as connection:
+        # A claim whose request died, or a response past its retention, no
+        # longer holds the key
+        connection.execute(_records.delete().where(
+            _records.c.scope == scope, _records.c.key == key, _records.c.expires_at <= now
+        ))
+        try:
+            with connection.begin_nested():
+                connection.execute(_records.insert().values(
+                    scope=scope, key=key, request_hash=request_hash, status='in_flight',
+                    created_at=now, expires_at=now + timedelta(seconds=lock_seconds)
+                ))
+            return None
+        except IntegrityError:
+            return _load(connection, scope, key)
+
+
+def _load(connection, scope: str, key: str) -> Optional[sa.Row]:
+    return connection.execute(
+        sa.select(_records).where(_records.c.scope == scope, _records.c.key == key)
+    ).first()
+
+
+def _wait_for_result(scope: str, key: str) -> Optional[sa.Row]:
+    """Poll an in-flight key until it completes, disappears or the wait ends."""
+    deadline = time.monotonic() + current_app.config['IDEMPOTENCY_WAIT_SECONDS']
+    delay = 0.05
+    while True:
+        with db.engine.connect() as connection:
+            record = _load(connection, scope, key)
+        if record is None or record.status != 'in_flight' or time.monotonic() >= deadline:
+            return record
+        time.sleep(delay)
+        delay = min(delay * 2, 0.5)
+
+
+def _complete(scope: str, key: str, response: Response) -> None:
+    retention = current_app.config['IDEMPOTENCY_TTL_SECONDS']
+    with db.engine.begin() as connection:
+        connection.execute(_records.update().where(
+            _records.c.scope == scope, _records.c.key == key
+        ).values(
+            status='completed',
+            response_status=response.status_code,
+            response_mimetype=response.mimetype,
+            response_body=response.get_data(),
+            expires_at=datetime.utcnow() + timedelta(seconds=retention),
+        ))
+
+
+def _release(scope: str, key: str) -> None:
+    with db.engine.begin() as connection:
+        connection.execute(_records.delete().where(
+            _records.c.scope == scope, _records.c.key == key, _records.c.status == 'in_flight'
+        ))
+
+
+def _replay(record: sa.Row) -> Response:
+    response = current_app.response_class(
+        record.response_body, status=record.response_status, mimetype=record.response_mimetype
+    )
+    response.headers[REPLAYED_HEADER] = 'true'
+    return response
+
+
+def idempotent(view):
+    """Make a POST view safe to retry with an ``Idempotency-Key`` header.
+
+    The first request with a key claims it and runs the view; its response
+    is stored and replayed, without running the view again, to any retry
+    with the same key and body until ``IDEMPOTENCY_TTL_SECONDS`` pass. A
+    retry arriving while the first request is still running waits for its
+    result. Server errors release the key so the request can be retried.
+    Place it inside the authentication decorator so keys are per user, or
+    per client address for guests; a guest's key is ignored when that
+    address is a proxy's.
+    """
+    @wraps(view)
+    def decorated(current_user=None, *args, **kwargs):
+        key = request.headers.get(HEADER)
+        if key is None:
+            return view(current_user, *args, **kwargs)
+        if not key or len(key) > MAX_KEY_LENGTH:
+            return _error(f'{HEADER} must be 1 to {MAX_KEY_LENGTH} characters', 400)
+
+        proxy_count = current_app.config['RATE_LIMIT_PROXY_COUNT']
+        if current_user is not None:
+            scope = f'{request.endpoint}:{current_user.id}'
+        elif address_is_proxy(proxy_count):
+            # Every guest behind the proxy would share one scope and could be
+            # handed another guest's order, so the key is not honoured
+            return view(current_user, *args, **kwargs)
+        else:
+            # Guests choosing the same key must not receive each other's orders
+            scope = f'{request.endpoint}:anonymous:{client_ip(proxy_count)}'
+        request_hash = hashlib.sha256(request.get_data()).hexdigest()
+
+        record = _claim(scope, key, request_hash)
+        if record is not None:
+            if record.request_hash != request_hash:
+                return _error(f'{HEADER} was already used for a different request', 422)
+            if record.status == 'in_flight':
+                record = _wait_for_result(scope, key)
+            if record is None or record.status == 'in_flight':
+                # Either still running, or the first attempt failed and
+                # released the key; the client should simply retry
+                return _error('A request with this Idempotency-Key is in progress', 409,
+                              retry_after=1)
+            return _replay(record)
+
+        try:
+            response = current_app.make_response(view(current_user, *args, **kwargs))
+        except BaseException:
+            _release(scope, key)
+            raise
+
+        if response.status_code >= 500:
+            _release(scope, key)
+        else:
+            _complete(scope, key, response)
+        return response
+
+    return decorated
+
+
+def purge_expired_keys() -> int:
+    """Delete expired claims and responses; returns the number removed."""
+    with db.engine.begin() as connection:
+        return connection.execute(
+            _records.delete().where(_records.c.expires_at <= datetime.utcnow())
+        ).rowcount
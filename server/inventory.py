@@ -0,0 +1,131 @@
+"""Atomic stock movements backed by an append-only inventory ledger."""
+from __future__ import annotations
+
+from typing import Any, Dict, List, Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event, inspect
+
+from models import db, InventoryMovement, Product
+from cache import note_product_changes
+
+_products = Product.__table__
+_ledger = InventoryMovement.__table__
+
+
+def _record(connection, product_id: int, delta: int, reason: str,
+            order_id: Optional[int] = None) -> None:
+    connection.execute(sa.insert(_ledger).values(
+        product_id=product_id, delta=delta, reason=reason, order_id=order_id
+    ))
+
+
+def record_movements(movements: List[Dict[str, Any]]) -> None:
+    """Append many ledger rows in one executemany.
+
+    Each movement is a dict with ``product_id``, ``delta`` and ``reason``.
+    """
+    if movements:
+        db.session.execute(sa.insert(_ledger), [dict(movement, order_id=None) for movement in movements])
+
+
+def adjust_stock(product_id: int, delta: int, reason: str,
+                 order_id: Optional[int] = None) -> bool:
+    """Apply a stock movement and record it in the ledger.
+
+    The change is one conditional UPDATE, so concurrent checkouts on any
+    number of workers can neither oversell nor lose updates. A negative
+    movement only succeeds while enough stock remains; False means the
+    product is missing or has too little stock, and nothing was changed.
+    """
+    statement = (
+        sa.update(_products)
+        .where(_products.c.id == product_id)
+        .values(stock_quantity=_products.c.stock_quantity + delta)
+    )
+    if delta < 0:
+        statement = statement.where(_products.c.stock_quantity >= -delta)
+
+    connection = db.session.connection()
+    if connection.execute(statement).rowcount != 1:
+        return False
+
+    _record(connection, product_id, delta, reason, order_id)
+    note_product_changes(db.session, [product_id])
+    return True
+
+
+def current_stock(product_id: int) -> Optional[int]:
+    return db.session.execute(
+        sa.select(_products.c.stock_quantity).where(_products.c.id == product_id)
+    ).scalar()
+
+
+def audit_stock() -> List[Dict[str, Any]]:
+    """Products whose stock differs from the sum of their ledger movements."""
+    ledger_totals = (
+        sa.select(_ledger.c.product_id, sa.func.sum(_ledger.c.delta).label('ledger_stock'))
+        .group_by(_ledger.c.product_id)
+        .subquery()
+    )
+    ledger_stock = sa.func.coalesce(ledger_totals.c.ledger_stock, 0)
+    rows = db.session.execute(
+        sa.select(_products.c.id, _products.c.stock_quantity, ledger_stock.label('ledger_stock'))
+        .select_from(_products.outerjoin(ledger_totals, ledger_totals.c.product_id == _products.c.id))
+        .where(sa.func.coalesce(_products.c.stock_quantity, 0) != ledger_stock)
+        .order_by(_products.c.id)
+    )
+    return [
+        {'product_id': row.id, 'stock_quantity': row.stock_quantity, 'ledger_stock': row.ledger_stock}
+        for row in rows
+    ]
+
+
+def rebuild_stock() -> int:
+    """Reset every drifted product's stock to its ledger total."""
+    drifted = audit_stock()
+    for row in drifted:
+        db.session.execute(
+            sa.update(_products)
+            .where(_products.c.id == row['product_id'])
+            .values(stock_quantity=row['ledger_stock'])
+        )
+    if drifted:
+        note_product_changes(db.session, [row['product_id'] for row in drifted])
+    return len(drifted)
+
+
+def record_opening_balances() -> int:
+    """Give products that predate the ledger an opening movement."""
+    missing = db.session.execute(
+        sa.select(_products.c.id, _products.c.stock_quantity)
+        .where(
+            sa.func.coalesce(_products.c.stock_quantity, 0) != 0,
+            ~sa.exists().where(_ledger.c.product_id == _products.c.id)
+        )
+    ).all()
+    connection = db.session.connection()
+    for row in missing:
+        _record(connection, row.id, row.stock_quantity, 'opening')
+    return len(missing)
+
+
+@event.listens_for(db.session, 'after_flush')
+def _record_orm_stock_changes(session, flush_context):
+    """Ledger stock set through the ORM: new products and direct edits."""
+    connection = session.connection()
+
+    for obj in session.new:
+        if isinstance(obj, Product) and obj.stock_quantity:
+            _record(connection, obj.id, obj.stock_quantity, 'initial')
+
+    for obj in session.dirty:
+        if not isinstance(obj, Product):
+            continue
+        history = inspect(obj).attrs.stock_quantity.history
+        if not history.has_changes():
+            continue
+        old = history.deleted[0] if history.deleted else 0
+        new = history.added[0] if history.added else 0
+        if (new or 0) != (old or 0):
+            _record(connection, obj.id, (new or 0) - (old or 0), 'adjustment')
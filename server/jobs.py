@@ -0,0 +1,276 @@
+"""Durable background jobs stored in the database and run by worker threads.
+
+Route handlers call :func:`enqueue` inside their own transaction, so a job
+exists exactly when the change that prompted it was committed, and return
+without waiting for it. Workers claim jobs with a single UPDATE, so any
+number of threads and processes can share the queue without a broker.
+"""
+from __future__ import annotations
+
+import json
+import logging
+import random
+import threading
+import time
+import uuid
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+import sqlalchemy as sa
+from flask import Flask
+
+from models import db, Job
+
+logger = logging.getLogger(__name__)
+
+_jobs = Job.__table__
+
+
+@dataclass(frozen=True)
+class JobType:
+    name: str
+    handler: Callable[[Dict[str, Any]], None]
+    max_attempts: int
+    # Most jobs of this type running at once across all workers
+    concurrency: Optional[int]
+    # Seconds a claimed job stays invisible to other workers
+    timeout: Optional[float]
+    # Recurring types are queued again this many seconds after the last run
+    every: Optional[float] = None
+
+
+_job_types: Dict[str, JobType] = {}
+
+# Seconds between a worker's checks that recurring jobs are queued
+SCHEDULE_INTERVAL = 30
+
+
+def job(name: str, max_attempts: int = 5, concurrency: Optional[int] = None,
+        timeout: Optional[float] = None, every: Optional[float] = None):
+    """Register the decorated function as the handler for ``name`` jobs.
+
+    Handlers receive the payload dict and run inside an application
+    context; raising marks the attempt failed and schedules a retry. Types
+    with ``every`` are also queued by running workers on that schedule.
+    """
+    def register(handler: Callable[[Dict[str, Any]], None]):
+        _job_types[name] = JobType(name, handler, max_attempts, concurrency, timeout, every)
+        return handler
+    return register
+
+
+def enqueue(job_type: str, payload: Optional[Dict[str, Any]] = None, delay: float = 0) -> Job:
+    """Add a job to the current session; it becomes runnable when that commits."""
+    if job_type not in _job_types:
+        raise ValueError(f'Unknown job type: {job_type}')
+
+    new_job = Job(
+        job_type=job_type,
+        payload=json.dumps(payload or {}),
+        max_attempts=_job_types[job_type].max_attempts,
+        run_at=datetime.utcnow() + timedelta(seconds=delay),
+    )
+    db.session.add(new_job)
+    return new_job
+
+
+def schedule_recurring() -> int:
+    """Queue the next run of each recurring type with none queued or running.
+
+    The check and insert are one statement, so workers racing to schedule
+    the same type queue it once. Returns the number of jobs queued.
+    """
+    now = datetime.utcnow()
+    queued = 0
+    for job_type in _job_types.values():
+        if not job_type.every:
+            continue
+        outstanding = sa.select(_jobs.c.id).where(
+            _jobs.c.job_type == job_type.name, _jobs.c.status.in_(('queued', 'running'))
+        )
+        with db.engine.begin() as connection:
+            if connection.execute(outstanding.limit(1)).first() is not None:
+                continue
+            values = sa.select(
+                sa.literal(job_type.name), sa.literal('{}'), sa.literal('queued'), sa.literal(0),
+                sa.literal(job_type.max_attempts),
+                sa.literal(now + timedelta(seconds=job_type.every)), sa.literal(now),
+            ).where(~outstanding.exists())
+            queued += connection.execute(_jobs.insert().from_select(
+                ['job_type', 'payload', 'status', 'attempts', 'max_attempts', 'run_at', 'created_at'],
+                values,
+            )).rowcount
+    return queued
+
+
+def retry_delay(attempts: int, base: float, cap: float) -> float:
+    """Exponential backoff with jitter after ``attempts`` failed attempts."""
+    return min(cap, base * 2 ** (attempts - 1)) * random.uniform(0.5, 1.0)
+
+
+def _claim(connection, now: datetime, token: str) -> Optional[sa.Row]:
+    """Mark the earliest runnable job as running and return it, atomically.
+
+    A job is runnable when it is queued and due, or running with an expired
+    lock. Types at their concurrency limit are skipped.
+    """
+    candidate = _jobs.alias('candidate')
+    runnable = sa.and_(
+        candidate.c.job_type.in_(list(_job_types)),
+        sa.or_(
+            sa.and_(candidate.c.status == 'queued', candidate.c.run_at <= now),
+            sa.and_(candidate.c.status == 'running', candidate.c.locked_until <= now),
+        ),
+    )
+
+    limits = {name: t.concurrency for name, t in _job_types.items() if t.concurrency}
+    if limits:
+        other = _jobs.alias('other')
+        running = (
+            sa.select(sa.func.count())
+            .where(other.c.job_type == candidate.c.job_type, other.c.status == 'running',
+                   other.c.locked_until > now)
+            .scalar_subquery()
+        )
+        limit = sa.case(limits, value=candidate.c.job_type, else_=None)
+        runnable = sa.and_(runnable, sa.or_(limit.is_(None), running < limit))
+
+    next_id = (
+        sa.select(candidate.c.id).where(runnable)
+        .order_by(candidate.c.run_at, candidate.c.id).limit(1)
+        .scalar_subquery()
+    )
+    return connection.execute(
+        _jobs.update().where(_jobs.c.id == next_id)
+        .values(status='running', attempts=_jobs.c.attempts + 1, lock_token=token,
+                locked_until=now)
+        .returning(_jobs.c.id, _jobs.c.job_type, _jobs.c.payload, _jobs.c.attempts,
+                   _jobs.c.max_attempts)
+    ).first()
+
+
+class JobWorker:
+    """Claim and run jobs for ``app`` on a pool of daemon threads."""
+
+    def __init__(self, app: Flask, threads: int = 1, poll_interval: Optional[float] = None):
+        self.app = app
+        self.threads = threads
+        self.poll_interval = poll_interval or app.config['JOB_POLL_INTERVAL']
+        self.default_timeout = app.config['JOB_VISIBILITY_TIMEOUT']
+        self.retry_base = app.config['JOB_RETRY_BASE_SECONDS']
+        self.retry_max = app.config['JOB_RETRY_MAX_SECONDS']
+        self._stopping = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._next_schedule = 0.0
+
+    def run_one(self) -> bool:
+        """Claim and run a single job; False when none is runnable."""
+        with self.app.app_context():
+            token = str(uuid.uuid4())
+            now = datetime.utcnow()
+            with db.engine.begin() as connection:
+                claimed = _claim(connection, now, token)
+                if claimed is None:
+                    return False
+                job_type = _job_types[claimed.job_type]
+                timeout = job_type.timeout or self.default_timeout
+                connection.execute(_jobs.update().where(_jobs.c.id == claimed.id)
+                                   .values(locked_until=now + timedelta(seconds=timeout)))
+
+            if claimed.attempts > claimed.max_attempts:
+                # Its last attempt outlived the visibility timeout
+                self._finish(claimed.id, token, 'failed', error='Timed out')
+                return True
+
+            try:
+                job_type.handler(json.loads(claimed.payload))
+            except Exception as e:
+                db.session.rollback()
+                logger.exception("Job %s (%s) failed on attempt %d",
+                                 claimed.id, claimed.job_type, claimed.attempts)
+                self._fail(claimed, token, f'{type(e).__name__}: {e}')
+            else:
+                self._finish(claimed.id, token, 'done')
+            return True
+
+    def run_pending(self) -> int:
+        """Run jobs on the calling thread until none is runnable; returns the count."""
+        count = 0
+        while self.run_one():
+            count += 1
+        return count
+
+    def _finish(self, job_id: int, token: str, status: str, error: Optional[str] = None) -> None:
+        # The token check ignores a worker that lost its lock to a timeout
+        with db.engine.begin() as connection:
+            connection.execute(
+                _jobs.update().where(_jobs.c.id == job_id, _jobs.c.lock_token == token)
+                .values(status=status, finished_at=datetime.utcnow(), locked_until=None,
+                        last_error=error)
+            )
+
+    def _fail(self, claimed: sa.Row, token: str, error: str) -> None:
+        if claimed.attempts >= claimed.max_attempts:
+            self._finish(claimed.id, token, 'failed', error)
+            return
+        delay = retry_delay(claimed.attempts, self.retry_base, self.retry_max)
+        with db.engine.begin() as connection:
+            connection.execute(
+                _jobs.update().where(_jobs.c.id == claimed.id, _jobs.c.lock_token == token)
+                .values(status='queued', run_at=datetime.utcnow() + timedelta(seconds=delay),
+                        locked_until=None, last_error=error)
+            )
+
+    def _schedule(self) -> None:
+        now = time.monotonic()
+        if now >= self._next_schedule:
+            self._next_schedule = now + SCHEDULE_INTERVAL
+            with self.app.app_context():
+                schedule_recurring()
+
+    def _loop(self) -> None:
+        while not self._stopping.is_set():
+            try:
+                self._schedule()
+                ran = self.run_one()
+            except Exception:
+                logger.exception("Job worker error")
+                ran = False
+            if not ran:
+                self._stopping.wait(self.poll_interval)
+
+    def start(self) -> None:
+        for i in range(self.threads):
+            thread = threading.Thread(target=self._loop, name=f'job-worker-{i}', daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Started %d job worker threads", self.threads)
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Stop claiming jobs and wait for running ones to finish."""
+        self._stopping.set()
+        for thread in self._threads:
+            thread.join(timeout)
+        self._threads = []
+
+
+def job_counts() -> Dict[str, Dict[str, int]]:
+    """Number of jobs per type and status."""
+    rows = db.session.execute(
+        sa.select(_jobs.c.job_type, _jobs.c.status, sa.func.count())
+        .group_by(_jobs.c.job_type, _jobs.c.status)
+    )
+    counts: Dict[str, Dict[str, int]] = {}
+    for job_type, status, count in rows:
+        counts.setdefault(job_type, {})[status] = count
+    return counts
+
+
+def purge_finished_jobs(older_than: timedelta) -> int:
+    """Delete done and failed jobs that finished before ``older_than`` ago."""
+    with db.engine.begin() as connection:
+        return connection.execute(_jobs.delete().where(
+            _jobs.c.status.in_(['done', 'failed']),
+            _jobs.c.finished_at < datetime.utcnow() - older_than,
+        )).rowcount
@@ -0,0 +1,358 @@
+"""Per-request timing, Server-Timing headers and Prometheus metrics."""
+from __future__ import annotations
+
+import glob
+import json
+import os
+import threading
+import time
+import uuid
+from collections import defaultdict
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+
+from read_routing import database_engines
+from serialization import FastJSONProvider
+
+# Upper bounds in seconds, chosen around the API's interesting latencies:
+# cached reads in milliseconds, checkout around the half-second payment call
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+PHASES = ('db', 'payment', 'serialize', 'compress')
+
+# Cumulative snapshot of every worker that has exited, next to the live ones
+RETIRED_SNAPSHOT = 'metrics-retired.json'
+
+# Workers whose files a scrape may have read just before they were retired
+RETIRED_WORKERS_KEPT = 64
+
+
+class RequestTimings:
+    """Time spent in each phase of the current request."""
+
+    def __init__(self) -> None:
+        self.started = time.perf_counter()
+        self.phases: Dict[str, float] = defaultdict(float)
+        self.queries = 0
+
+
+def _current_timings() -> Optional[RequestTimings]:
+    if not has_request_context():
+        return None
+    return g.get('request_timings')
+
+
+@contextmanager
+def timed(phase: str) -> Iterator[None]:
+    """Add the time spent in the block to ``phase`` of the current request."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings = _current_timings()
+        if timings is not None:
+            timings.phases[phase] += time.perf_counter() - started
+
+
+class TimedJSONProvider(FastJSONProvider):
+    """JSON provider that records serialization time."""
+
+    def encode(self, obj: Any) -> bytes:
+        with timed('serialize'):
+            return super().encode(obj)
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if not kwargs:
+            return super().dumps(obj)
+        with timed('serialize'):
+            return super().dumps(obj, **kwargs)
+
+
+class MetricsRegistry:
+    """Thread-safe per-process aggregates, exportable as mergeable snapshots."""
+
+    def __init__(self, buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._lock = threading.Lock()
+        self._requests: Dict[Tuple[str, str, str], int] = defaultdict(int)
+        self._latency: Dict[Tuple[str, str], List[float]] = {}
+        self._phases: Dict[Tuple[str, str], float] = defaultdict(float)
+        self._queries: Dict[str, int] = defaultdict(int)
+
+    def observe(self, method: str, endpoint: str, status: int, duration: float,
+                timings: RequestTimings) -> None:
+        with self._lock:
+            self._requests[(method, endpoint, str(status))] += 1
+
+            # Per-bucket (not cumulative) counts, then sum and count
+            histogram = self._latency.setdefault(
+                (method, endpoint), [0] * (len(self.buckets) + 1) + [0.0, 0]
+            )
+            index = next((i for i, bound in enumerate(self.buckets) if duration <= bound),
+                         len(self.buckets))
+            histogram[index] += 1
+            histogram[-2] += duration
+            histogram[-1] += 1
+
+            for phase, seconds in timings.phases.items():
+                self._phases[(endpoint, phase)] += seconds
+            self._queries[endpoint] += timings.queries
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                'buckets': list(self.buckets),
+                'requests': [[*key, count] for key, count in self._requests.items()],
+                'latency': [[*key, list(values)] for key, values in self._latency.items()],
+                'phases': [[*key, seconds] for key, seconds in self._phases.items()],
+                'queries': [[endpoint, count] for endpoint, count in self._queries.items()],
+            }
+
+
+def merge_snapshots(snapshots: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine snapshots from several worker processes."""
+    requests: Dict[tuple, int] = defaultdict(int)
+    latency: Dict[tuple, List[float]] = {}
+    phases: Dict[tuple, float] = defaultdict(float)
+    queries: Dict[str, int] = defaultdict(int)
+    buckets = snapshots[0]['buckets'] if snapshots else list(LATENCY_BUCKETS)
+
+    for snapshot in snapshots:
+        for *key, count in snapshot['requests']:
+            requests[tuple(key)] += count
+        for method, endpoint, values in snapshot['latency']:
+            merged = latency.setdefault((method, endpoint), [0] * len(values))
+            for i, value in enumerate(values):
+                merged[i] += value
+        for endpoint, phase, seconds in snapshot['phases']:
+            phases[(endpoint, phase)] += seconds
+        for endpoint, count in snapshot['queries']:
+            queries[endpoint] += count
+
+    return {
+        'buckets': buckets,
+        'requests': [[*key, count] for key, count in requests.items()],
+        'latency': [[*key, values] for key, values in latency.items()],
+        'phases': [[*key, seconds] for key, seconds in phases.items()],
+        'queries': [[endpoint, count] for endpoint, count in queries.items()],
+    }
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels: str) -> str:
+    return '{' + ','.join(f'{name}="{_escape(str(value))}"' for name, value in labels.items()) + '}'
+
+
+def render_prometheus(snapshot: Dict[str, Any]) -> str:
+    """Render a snapshot in the Prometheus text exposition format."""
+    lines = [
+        '# HELP quickcart_http_requests_total HTTP requests by endpoint and status.',
+        '# TYPE quickcart_http_requests_total counter',
+    ]
+    for method, endpoint, status, count in sorted(snapshot['requests']):
+        lines.append(f'quickcart_http_requests_total'
+                     f'{_labels(method=method, endpoint=endpoint, status=status)} {count}')
+
+    lines += [
+        '# HELP quickcart_http_request_duration_seconds Request wall time.',
+        '# TYPE quickcart_http_request_duration_seconds histogram',
+    ]
+    bounds = [str(bound) for bound in snapshot['buckets']] + ['+Inf']
+    for method, endpoint, values in sorted(snapshot['latency']):
+        cumulative = 0
+        for bound, count in zip(bounds, values[:len(bounds)]):
+            cumulative += count
+            lines.append(f'quickcart_http_request_duration_seconds_bucket'
+                         f'{_labels(method=method, endpoint=endpoint, le=bound)} {cumulative}')
+        labels = _labels(method=method, endpoint=endpoint)
+        lines.append(f'quickcart_http_request_duration_seconds_sum{labels} {values[-2]:.6f}')
+        lines.append(f'quickcart_http_request_duration_seconds_count{labels} {values[-1]}')
+
+    lines += [
+        '# HELP quickcart_request_phase_seconds_total Time spent in SQL, payment and serialization.',
+        '# TYPE quickcart_request_phase_seconds_total counter',
+    ]
+    for endpoint, phase, seconds in sorted(snapshot['phases']):
+        lines.append(f'quickcart_request_phase_seconds_total'
+                     f'{_labels(endpoint=endpoint, phase=phase)} {seconds:.6f}')
+
+    lines += [
+        '# HELP quickcart_db_queries_total SQL statements executed.',
+        '# TYPE quickcart_db_queries_total counter',
+    ]
+    for endpoint, count in sorted(snapshot['queries']):
+        lines.append(f'quickcart_db_queries_total{_labels(endpoint=endpoint)} {count}')
+
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsStore:
+    """Registry plus optional sharing through ``METRICS_DIR``.
+
+    Each gunicorn worker keeps its own registry; with a metrics directory
+    configured every worker periodically writes its snapshot there and a
+    scrape, whichever worker serves it, merges all of them. When a worker
+    exits the master folds its snapshot into ``RETIRED_SNAPSHOT``, so
+    counters never go backwards and the directory holds one file per live
+    worker.
+    """
+
+    def __init__(self, directory: Optional[str], flush_interval: float):
+        self.registry = MetricsRegistry()
+        self.directory = directory
+        self.flush_interval = flush_interval
+        self._last_flush = 0.0
+        self._flush_lock = threading.Lock()
+        self._worker: Tuple[Optional[int], str] = (None, '')
+
+    @property
+    def worker_id(self) -> str:
+        """Unique per process, unlike a PID, which a later worker may reuse."""
+        if self._worker[0] != os.getpid():
+            self._worker = (os.getpid(), uuid.uuid4().hex)
+        return self._worker[1]
+
+    def maybe_flush(self) -> None:
+        if self.directory and time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def flush(self) -> None:
+        if not self.directory:
+            return
+        with self._flush_lock:
+            self._last_flush = time.monotonic()
+            os.makedirs(self.directory, exist_ok=True)
+            snapshot = self.registry.snapshot()
+            snapshot['worker'] = self.worker_id
+            _write_snapshot(_worker_snapshot_path(self.directory, os.getpid()), snapshot)
+
+    def collect(self) -> Dict[str, Any]:
+        if not self.directory:
+            return self.registry.snapshot()
+
+        self.flush()
+        retired_path = os.path.join(self.directory, RETIRED_SNAPSHOT)
+        snapshots = [
+            snapshot for path in glob.glob(os.path.join(self.directory, 'metrics-*.json'))
+            if path != retired_path and (snapshot := _read_snapshot(path)) is not None
+        ]
+        # Read after the live files: a worker retired in between is then
+        # counted in the retired snapshot, and its own file is skipped
+        retired = _read_snapshot(retired_path)
+        if retired is not None:
+            folded = set(retired['workers'])
+            snapshots = [s for s in snapshots if s.get('worker') not in folded] + [retired]
+        return merge_snapshots(snapshots)
+
+
+def _worker_snapshot_path(directory: str, pid: int) -> str:
+    return os.path.join(directory, f'metrics-{pid}.json')
+
+
+def _read_snapshot(path: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def _write_snapshot(path: str, snapshot: Dict[str, Any]) -> None:
+    tmp_path = f'{path}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(snapshot, f)
+    os.replace(tmp_path, path)
+
+
+def retire_worker_metrics(directory: str, pid: int) -> None:
+    """Fold the snapshot of exited worker ``pid`` into the retired workers' total.
+
+    Called by the gunicorn master, one worker at a time, after the worker
+    wrote its final snapshot.
+    """
+    path = _worker_snapshot_path(directory, pid)
+    snapshot = _read_snapshot(path)
+    if snapshot is None:
+        return
+
+    retired_path = os.path.join(directory, RETIRED_SNAPSHOT)
+    retired = _read_snapshot(retired_path)
+    merged = merge_snapshots([snapshot] if retired is None else [retired, snapshot])
+    workers = retired['workers'] if retired is not None else []
+    merged['workers'] = (workers + [snapshot.get('worker')])[-RETIRED_WORKERS_KEPT:]
+    _write_snapshot(retired_path, merged)
+    os.remove(path)
+
+
+def clear_metrics_dir(directory: str) -> None:
+    """Remove snapshots left by a previous server run."""
+    for path in glob.glob(os.path.join(directory, 'metrics-*.json*')):
+        os.remove(path)
+
+
+def server_timing(timings: RequestTimings, total: float) -> str:
+    """Format phase timings as a Server-Timing header value."""
+    entries = [f'db;dur={timings.phases["db"] * 1000:.1f};desc="{timings.queries} queries"']
+    for phase in PHASES[1:]:
+        if phase in timings.phases:
+            entries.append(f'{phase};dur={timings.phases[phase] * 1000:.1f}')
+    entries.append(f'total;dur={total * 1000:.1f}')
+    return ', '.join(entries)
+
+
+def _register_sql_timing(engine) -> None:
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('query_started')
+        if not stack:
+            return
+        started = stack.pop()
+        timings = _current_timings()
+        if timings is not None:
+            timings.phases['db'] += time.perf_counter() - started
+            timings.queries += 1
+
+
+def init_metrics(app: Flask) -> None:
+    """Instrument every request of ``app`` unless disabled by configuration."""
+    if not app.config['METRICS_ENABLED']:
+        return
+
+    store = MetricsStore(app.config['METRICS_DIR'], app.config['METRICS_FLUSH_INTERVAL'])
+    app.extensions['metrics'] = store
+    app.json = TimedJSONProvider(app)
+    with app.app_context():
+        for engine in database_engines():
+            _register_sql_timing(engine)
+
+    @app.before_request
+    def start_request_timer():
+        g.request_timings = RequestTimings()
+
+    @app.after_request
+    def record_request_timings(response: Response) -> Response:
+        timings = g.pop('request_timings', None)
+        if timings is None:
+            return response
+
+        total = time.perf_counter() - timings.started
+        endpoint = request.endpoint or 'unmatched'
+        store.registry.observe(request.method, endpoint, response.status_code, total, timings)
+        response.headers['Server-Timing'] = server_timing(timings, total)
+        store.maybe_flush()
+        return response
+
+    @app.route('/api/metrics', methods=['GET'])
+    def metrics():
+        body = render_prometheus(store.collect())
+        return Response(body, mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,94 @@
+"""Versioned schema migrations for databases that predate a model change.
+
+``db.create_all()`` only creates missing tables, so anything added to an
+existing table (an index, a column) ships as a migration here as well as in
+the model. Applied versions are recorded in ``schema_migrations``; every
+migration runs in its own transaction and must be written so that it is a
+no-op on a database freshly created from the current models. A step is
+either an SQL statement or a callable taking the connection.
+"""
+from __future__ import annotations
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Any, Callable, List, Set, Tuple, Union
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Engine
+
+from facets import ensure_category_facets
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True)
+class Migration:
+    version: str
+    description: str
+    steps: Tuple[Union[str, Callable[[Connection], Any]], ...]
+
+
+def add_column_if_missing(connection: Connection, table: str, column: str, ddl: str) -> None:
+    """ALTER TABLE ADD COLUMN, skipped when ``create_all()`` already made it."""
+    columns = {row[1] for row in connection.exec_driver_sql(f'PRAGMA table_info({table})')}
+    if column not in columns:
+        connection.exec_driver_sql(f'ALTER TABLE {table} ADD COLUMN {column} {ddl}')
+
+
+MIGRATIONS: List[Migration] = [
+    Migration('0001', 'Index hot query columns', (
+        'CREATE INDEX IF NOT EXISTS ix_products_category_id ON products (category, id)',
+        'CREATE INDEX IF NOT EXISTS ix_orders_user_id_created_at ON orders (user_id, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_orders_status_created_at ON orders (status, created_at)',
+        'CREATE INDEX IF NOT EXISTS ix_order_items_order_id ON order_items (order_id)',
+        'CREATE INDEX IF NOT EXISTS ix_order_items_product_id ON order_items (product_id)',
+        # Give the query planner statistics for the new indexes
+        'ANALYZE',
+    )),
+    Migration('0002', 'Add trigger-maintained category facets', (
+        ensure_category_facets,
+    )),
+    Migration('0003', 'Record the payment method of orders', (
+        lambda connection: add_column_if_missing(connection, 'orders', 'payment_method',
+                                                 'VARCHAR(20)'),
+    )),
+]
+
+_schema_migrations = sa.Table(
+    'schema_migrations', sa.MetaData(),
+    sa.Column('version', sa.String(20), primary_key=True),
+    sa.Column('description', sa.String(200), nullable=False),
+    sa.Column('applied_at', sa.DateTime, nullable=False),
+)
+
+
+def applied_versions(connection: Connection) -> Set[str]:
+    _schema_migrations.create(connection, checkfirst=True)
+    return set(connection.execute(sa.select(_schema_migrations.c.version)).scalars())
+
+
+def pending_migrations(engine: Engine) -> List[Migration]:
+    with engine.begin() as connection:
+        applied = applied_versions(connection)
+    return [migration for migration in MIGRATIONS if migration.version not in applied]
+
+
+def upgrade(engine: Engine) -> List[Migration]:
+    """Apply pending migrations in version order and return them."""
+    applied = []
+    for migration in pending_migrations(engine):
+        with engine.begin() as connection:
+            for step in migration.steps:
+                if callable(step):
+                    step(connection)
+                else:
+                    connection.execute(sa.text(step))
+            connection.execute(_schema_migrations.insert().values(
+                version=migration.version,
+                description=migration.description,
+                applied_at=datetime.utcnow(),
+            ))
+        logger.info("Applied migration %s: %s", migration.version, migration.description)
+        applied.append(migration)
+    return applied
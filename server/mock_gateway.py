@@ -0,0 +1,158 @@
+"""A local payment gateway for development, load tests and the test suite.
+
+Run ``python mock_gateway.py --port 5099`` and point ``PAYMENT_GATEWAY_URL``
+at it. It speaks HTTP/1.1 keep-alive, answers after a configurable latency,
+declines a configurable share of charges and honours Idempotency-Key the
+way real gateways do: a repeated key returns the original outcome.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import random
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+
+class MockGatewayHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    server: 'MockGatewayServer'
+
+    def log_message(self, format: str, *args: Any) -> None:
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def setup(self) -> None:
+        super().setup()
+        self.server.count_connection()
+
+    def _send(self, status: int, body: Dict[str, Any]) -> None:
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self) -> None:
+        if self.path == '/health':
+            self._send(200, {'status': 'ok'})
+        else:
+            self._send(404, {'error': 'Not found'})
+
+    def do_POST(self) -> None:
+        length = int(self.headers.get('Content-Length', 0))
+        body = json.loads(self.rfile.read(length) or b'{}')
+        key = self.headers.get('Idempotency-Key') or uuid.uuid4().hex
+
+        routes = {'/v1/charges': self.server.charge, '/v1/refunds': self.server.refund,
+                  '/v1/voids': self.server.void}
+        route = routes.get(self.path)
+        if route is None:
+            self._send(404, {'error': 'Not found'})
+            return
+        self._send(*route(key, body))
+
+
+class MockGatewayServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, address: Tuple[str, int], latency: float = 0.0,
+                 failure_rate: float = 0.0, verbose: bool = False):
+        super().__init__(address, MockGatewayHandler)
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.verbose = verbose
+        self.charges: Dict[str, Dict[str, Any]] = {}
+        self.connections = 0
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def count_connection(self) -> None:
+        with self._lock:
+            self.connections += 1
+
+    def _respond_after_latency(self) -> None:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        time.sleep(self.latency)
+        with self._lock:
+            self.in_flight -= 1
+
+    def charge(self, key: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        self._respond_after_latency()
+        with self._lock:
+            if key in self.charges:
+                charge = self.charges[key]
+            elif not isinstance(body.get('amount'), int) or body['amount'] <= 0:
+                return 400, {'error': 'Invalid amount'}
+            elif random.random() < self.failure_rate:
+                charge = {'status': 'declined', 'error': 'Payment declined by bank'}
+                self.charges[key] = charge
+            else:
+                charge = {'id': f'ch_{uuid.uuid4().hex[:24]}', 'status': 'succeeded',
+                          'amount': body['amount']}
+                self.charges[key] = charge
+        if charge['status'] == 'declined':
+            return 402, {'error': charge['error']}
+        return 200, charge
+
+    def _find(self, payment_id: str) -> Optional[Dict[str, Any]]:
+        return next((c for c in self.charges.values() if c.get('id') == payment_id), None)
+
+    def refund(self, key: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        self._respond_after_latency()
+        with self._lock:
+            charge = self._find(body.get('payment_id'))
+            if charge is None:
+                return 404, {'error': 'No such charge'}
+            charge['status'] = 'refunded'
+            return 200, {'id': charge['id'], 'status': 'refunded'}
+
+    def void(self, key: str, body: Dict[str, Any]) -> Tuple[int, Dict[str, Any]]:
+        self._respond_after_latency()
+        with self._lock:
+            charge = self.charges.get(body.get('idempotency_key'))
+            if charge is None or charge['status'] != 'succeeded':
+                return 404, {'error': 'No such charge'}
+            charge['status'] = 'voided'
+            return 200, {'id': charge['id'], 'status': 'voided'}
+
+
+def start_mock_gateway(port: int = 0, **options: Any) -> MockGatewayServer:
+    """Serve a mock gateway on a background thread; ``port=0`` picks a free one."""
+    server = MockGatewayServer(('127.0.0.1', port), **options)
+    threading.Thread(target=server.serve_forever, args=(0.1,), daemon=True).start()
+    return server
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5099)
+    parser.add_argument('--latency', type=float, default=0.5, help='Seconds per request.')
+    parser.add_argument('--failure-rate', type=float, default=0.05)
+    parser.add_argument('--verbose', action='store_true')
+    args = parser.parse_args()
+
+    server = MockGatewayServer((args.host, args.port), args.latency, args.failure_rate, args.verbose)
+    print(f'Mock payment gateway on {server.url} '
+          f'(latency {args.latency}s, failure rate {args.failure_rate})')
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -1,12 +1,18 @@
 from flask_sqlalchemy import SQLAlchemy
-from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
 import uuid
 
-db = SQLAlchemy()
+from passwords import get_password_hasher
+from database import RoutingSession
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
 
 class Product(db.Model):
     __tablename__ = 'products'
+    __table_args__ = (
+        # Category filters and DISTINCT category, in id order for pagination
+        db.Index('ix_products_category_id', 'category', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
@@ -14,7 +20,9 @@ class Product(db.Model):
     price = db.Column(db.Float, nullable=False)
     category = db.Column(db.String(50))
     image_url = db.Column(db.String(200))
-    stock_quantity = db.Column(db.Integer, default=0)
+    # Active history loads the previous value on assignment, so the inventory
+    # ledger always records the true delta of ORM stock edits
+    stock_quantity = db.column_property(db.Column(db.Integer, default=0), active_history=True)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     def is_available(self):
@@ -37,7 +45,7 @@ class User(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     email = db.Column(db.String(120), unique=True, nullable=False)
-    password_hash = db.Column(db.String(128))
+    password_hash = db.Column(db.String(255))
     first_name = db.Column(db.String(50))
     last_name = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
@@ -45,10 +53,10 @@ class User(db.Model):
     orders = db.relationship('Order', backref='user', lazy=True)
     
     def set_password(self, password):
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = get_password_hasher().hash(password)
     
     def check_password(self, password):
-        return check_password_hash(self.password_hash, password)
+        return get_password_hasher().verify(self.password_hash, password)
     
     def to_dict(self):
         return {
@@ -60,12 +68,20 @@ class User(db.Model):
 
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        # Order history, newest first; the rowid id is implicitly last
+        db.Index('ix_orders_user_id_created_at', 'user_id', 'created_at'),
+        # Stale reservation sweep
+        db.Index('ix_orders_status_created_at', 'status', 'created_at'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_number = db.Column(db.String(36), unique=True, default=lambda: str(uuid.uuid4()))
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=True)
     total_amount = db.Column(db.Float, nullable=False)
     status = db.Column(db.String(20), default='pending')
+    # Recorded before charging, so an abandoned checkout's charge can be voided
+    payment_method = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Shipping information
@@ -90,8 +106,8 @@ class OrderItem(db.Model):
     __tablename__ = 'order_items'
     
     id = db.Column(db.Integer, primary_key=True)
-    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
-    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False, index=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
     quantity = db.Column(db.Integer, nullable=False)
     price = db.Column(db.Float, nullable=False)  # Price at time of purchase
     
@@ -106,3 +122,97 @@ class OrderItem(db.Model):
             'price': self.price,
             'subtotal': self.quantity * self.price
         }
+
+class InventoryMovement(db.Model):
+    """Append-only record of every stock change; stock is the sum of deltas."""
+    __tablename__ = 'inventory_ledger'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    product_id = db.Column(db.Integer, db.ForeignKey('products.id'), nullable=False, index=True)
+    delta = db.Column(db.Integer, nullable=False)
+    reason = db.Column(db.String(20), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'product_id': self.product_id,
+            'delta': self.delta,
+            'reason': self.reason,
+            'order_id': self.order_id,
+            'created_at': self.created_at.isoformat()
+        }
+
+class CatalogState(db.Model):
+    """Single-row catalog version, bumped in every transaction that changes products."""
+    __tablename__ = 'catalog_state'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    @classmethod
+    def current(cls):
+        """Return (version, updated_at) without loading an ORM object."""
+        row = db.session.execute(
+            db.select(cls.version, cls.updated_at).where(cls.id == 1)
+        ).first()
+        return (row.version, row.updated_at) if row else (0, None)
+    
+    @classmethod
+    def bump(cls, connection):
+        """Increment the version on ``connection`` inside the caller's transaction."""
+        now = datetime.utcnow()
+        result = connection.execute(
+            db.update(cls).where(cls.id == 1).values(version=cls.version + 1, updated_at=now)
+        )
+        if result.rowcount == 0:
+            connection.execute(db.insert(cls).values(id=1, version=1, updated_at=now))
+
+class IdempotencyRecord(db.Model):
+    """Claim on, and then stored response of, a request sent with an Idempotency-Key."""
+    __tablename__ = 'idempotency_keys'
+    
+    # Endpoint and user, so keys chosen by different clients never collide
+    scope = db.Column(db.String(100), primary_key=True)
+    key = db.Column(db.String(255), primary_key=True)
+    request_hash = db.Column(db.String(64), nullable=False)
+    status = db.Column(db.String(20), nullable=False, default='in_flight')
+    response_status = db.Column(db.Integer)
+    response_mimetype = db.Column(db.String(100))
+    response_body = db.Column(db.LargeBinary)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # An in-flight claim is abandoned, and a stored response forgotten, after this
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+class ReadYourWritesWindow(db.Model):
+    """Until when a signed-in user's reads skip the replica, after a write."""
+    __tablename__ = 'read_your_writes'
+    
+    user_id = db.Column(db.Integer, primary_key=True)
+    # Unix time, compared with time.time() on every routed read
+    primary_until = db.Column(db.Float, nullable=False)
+
+class Job(db.Model):
+    """Background job waiting to run, running, or finished."""
+    __tablename__ = 'jobs'
+    __table_args__ = (
+        # Workers look for the earliest runnable job of a status
+        db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    job_type = db.Column(db.String(50), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    # queued -> running -> done, or back to queued for a retry, or failed
+    status = db.Column(db.String(20), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    # A running job whose lock has expired is assumed lost and runs again
+    locked_until = db.Column(db.DateTime)
+    lock_token = db.Column(db.String(36))
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
@@ -0,0 +1,56 @@
+"""Keyset (cursor) pagination helpers."""
+from __future__ import annotations
+
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+import sqlalchemy as sa
+from werkzeug.exceptions import BadRequest
+
+
+def encode_cursor(values: Sequence[Any]) -> str:
+    """Encode the sort key of the last row on a page as an opaque token."""
+    raw = json.dumps(list(values), separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).rstrip(b'=').decode()
+
+
+def decode_cursor(token: str, size: int) -> List[Any]:
+    """Decode a token produced by ``encode_cursor``."""
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (binascii.Error, ValueError):
+        raise BadRequest('Invalid cursor')
+
+    if not isinstance(values, list) or len(values) != size:
+        raise BadRequest('Invalid cursor')
+
+    # Only scalars can be bound as query parameters
+    if not all(_is_scalar(value) for value in values):
+        raise BadRequest('Invalid cursor')
+
+    return values
+
+
+def _is_scalar(value: Any) -> bool:
+    """True for the str, int and float values a sort key can hold."""
+    return isinstance(value, (str, int, float)) and not isinstance(value, bool)
+
+
+def keyset_page(query, columns: Sequence[Any], descending: bool,
+                after: Optional[Sequence[Any]], limit: int) -> Tuple[list, bool]:
+    """Fetch the page of ``query`` that follows the ``after`` key.
+
+    ``columns`` must end with a unique column so the order is total. One extra
+    row is read to learn whether another page exists, so no COUNT(*) or
+    OFFSET is ever needed.
+    """
+    key = sa.tuple_(*columns)
+    if after is not None:
+        query = query.filter(key < sa.tuple_(*after) if descending else key > sa.tuple_(*after))
+
+    order = [column.desc() if descending else column.asc() for column in columns]
+    rows = query.order_by(None).order_by(*order).limit(limit + 1).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,121 @@
+"""Password hashing in a bounded process pool with configurable cost."""
+from __future__ import annotations
+
+import logging
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeoutError
+from concurrent.futures.process import BrokenProcessPool
+from functools import cached_property
+from typing import Any, Callable, Optional
+
+from flask import Flask, current_app, has_app_context
+from werkzeug.exceptions import ServiceUnavailable
+from werkzeug.security import check_password_hash, generate_password_hash
+
+logger = logging.getLogger(__name__)
+
+# Werkzeug's own default; scrypt:32768:8:1 is the memory-hard alternative
+DEFAULT_HASH_METHOD = 'pbkdf2:sha256:600000'
+
+
+class PasswordHasher:
+    """Hash and verify passwords off the request thread.
+
+    Hashing is deliberately CPU-bound, so it runs in a small process pool
+    where it cannot hold up the threads serving other requests. At most
+    ``max_pending`` operations may be running or queued per worker process;
+    beyond that callers get a 503 with Retry-After instead of piling up
+    behind a login storm. ``workers=0`` hashes inline on the calling thread.
+    """
+
+    def __init__(self, method: str = DEFAULT_HASH_METHOD, workers: int = 0,
+                 max_pending: int = 32, timeout: float = 10.0, retry_after: int = 1):
+        self.method = method
+        self.workers = workers
+        self.timeout = timeout
+        self.retry_after = retry_after
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._executor: Optional[ProcessPoolExecutor] = None
+        self._executor_pid: Optional[int] = None
+        self._executor_lock = threading.Lock()
+
+    def hash(self, password: str) -> str:
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash: Optional[str], password: str) -> bool:
+        if not password_hash:
+            return False
+        return self._run(check_password_hash, password_hash, password)
+
+    @cached_property
+    def _hash_prefix(self) -> str:
+        # Werkzeug stores short names expanded ('scrypt' as 'scrypt:32768:8:1'),
+        # so the prefix comes from a real hash; computed once, on first use,
+        # so that creating a hasher stays cheap
+        return generate_password_hash('', self.method).split('$', 1)[0]
+
+    def needs_rehash(self, password_hash: str) -> bool:
+        """True when a stored hash was made with a different method or cost."""
+        return password_hash.split('$', 1)[0] != self._hash_prefix
+
+    def _pool(self) -> ProcessPoolExecutor:
+        # Pools do not survive fork, so each gunicorn worker starts its own
+        # on first use; spawn avoids forking a multi-threaded process
+        with self._executor_lock:
+            if self._executor is None or self._executor_pid != os.getpid():
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.workers, mp_context=multiprocessing.get_context('spawn')
+                )
+                self._executor_pid = os.getpid()
+            return self._executor
+
+    def _reset_pool(self) -> None:
+        with self._executor_lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _busy(self, reason: str) -> ServiceUnavailable:
+        return ServiceUnavailable(reason, retry_after=self.retry_after)
+
+    def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if not self._slots.acquire(blocking=False):
+            raise self._busy('Too many authentication requests, please retry shortly')
+        try:
+            if not self.workers:
+                return func(*args)
+            try:
+                return self._pool().submit(func, *args).result(timeout=self.timeout)
+            except FutureTimeoutError:
+                raise self._busy('Authentication timed out, please retry shortly')
+            except BrokenProcessPool:
+                logger.exception("Password hashing pool died; restarting it")
+                self._reset_pool()
+                raise self._busy('Authentication temporarily unavailable, please retry shortly')
+        finally:
+            self._slots.release()
+
+    def shutdown(self) -> None:
+        self._reset_pool()
+
+
+def init_password_hasher(app: Flask) -> None:
+    """Attach a password hasher configured from ``app.config``."""
+    app.extensions['password_hasher'] = PasswordHasher(
+        method=app.config['PASSWORD_HASH_METHOD'],
+        workers=app.config['PASSWORD_HASH_WORKERS'],
+        max_pending=app.config['PASSWORD_HASH_MAX_PENDING'],
+        timeout=app.config['PASSWORD_HASH_TIMEOUT'],
+    )
+
+
+_inline_hasher = PasswordHasher()
+
+
+def get_password_hasher() -> PasswordHasher:
+    """The current app's hasher; inline defaults outside an application."""
+    if has_app_context():
+        return current_app.extensions.get('password_hasher', _inline_hasher)
+    return _inline_hasher
@@ -0,0 +1,178 @@
+"""HTTP payment gateway clients with pooled keep-alive connections."""
+from __future__ import annotations
+
+import http.client
+import json
+import logging
+import queue
+import socket
+import threading
+from dataclasses import dataclass
+from typing import Any, Dict, Optional, Tuple
+from urllib.parse import urlsplit
+
+from flask import Flask, current_app
+from werkzeug.exceptions import ServiceUnavailable
+
+logger = logging.getLogger(__name__)
+
+PAYMENT_METHODS = ('stripe', 'paypal', 'apple_pay')
+
+
+@dataclass
+class PaymentResult:
+    """Data class for payment processing results."""
+    success: bool
+    payment_id: Optional[str] = None
+    method: Optional[str] = None
+    error: Optional[str] = None
+
+
+class GatewayTimeout(Exception):
+    """The gateway did not answer in time; the charge may or may not exist."""
+
+
+class ConnectionPool:
+    """Keep-alive connections to one host, at most ``maxsize`` in use at once.
+
+    Idle connections are reused most-recent first, so a quiet pool keeps few
+    sockets warm. Callers beyond ``maxsize`` wait up to ``acquire_timeout``
+    and then get a 503, which bounds the payments in flight per process.
+    """
+
+    def __init__(self, url: str, timeout: float, maxsize: int, acquire_timeout: float):
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.timeout = timeout
+        self.acquire_timeout = acquire_timeout
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._idle: 'queue.LifoQueue[http.client.HTTPConnection]' = queue.LifoQueue()
+        self.created = 0
+
+    def _connect(self) -> http.client.HTTPConnection:
+        connection_class = (http.client.HTTPSConnection if self.scheme == 'https'
+                            else http.client.HTTPConnection)
+        self.created += 1
+        return connection_class(self.host, self.port, timeout=self.timeout)
+
+    def acquire(self) -> Tuple[http.client.HTTPConnection, bool]:
+        """A connection and whether it was reused from an earlier request."""
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            raise ServiceUnavailable('Payment service is busy, please retry shortly',
+                                     retry_after=1)
+        try:
+            return self._idle.get_nowait(), True
+        except queue.Empty:
+            return self._connect(), False
+
+    def release(self, connection: http.client.HTTPConnection, reusable: bool) -> None:
+        if reusable:
+            self._idle.put(connection)
+        else:
+            connection.close()
+        self._slots.release()
+
+    def close(self) -> None:
+        while True:
+            try:
+                self._idle.get_nowait().close()
+            except queue.Empty:
+                return
+
+
+class HTTPGatewayClient:
+    """JSON-over-HTTP client for one payment gateway.
+
+    Every charge carries an Idempotency-Key, so a request that fails on a
+    stale keep-alive connection is safely resent once on a fresh one.
+    """
+
+    def __init__(self, name: str, url: str, timeout: float = 5.0, max_connections: int = 10,
+                 acquire_timeout: float = 2.0):
+        self.name = name
+        self.base_path = urlsplit(url).path.rstrip('/')
+        self.pool = ConnectionPool(url, timeout, max_connections, acquire_timeout)
+
+    def _post(self, path: str, body: Dict[str, Any], idempotency_key: str) -> Tuple[int, Dict[str, Any]]:
+        payload = json.dumps(body)
+        headers = {'Content-Type': 'application/json', 'Idempotency-Key': idempotency_key}
+
+        for attempt in range(2):
+            connection, reused = self.pool.acquire()
+            reusable = False
+            try:
+                connection.request('POST', self.base_path + path, payload, headers)
+                response = connection.getresponse()
+                data = response.read()
+                reusable = not response.will_close
+                return response.status, json.loads(data or b'{}')
+            except socket.timeout:
+                raise GatewayTimeout(f'{self.name} did not respond in {self.pool.timeout}s')
+            except (http.client.RemoteDisconnected, ConnectionError, http.client.BadStatusLine):
+                # The server closed an idle keep-alive socket; retry once fresh
+                if not reused or attempt:
+                    raise
+                logger.debug("Reconnecting to %s after a stale connection", self.name)
+            finally:
+                self.pool.release(connection, reusable)
+        raise AssertionError('unreachable')
+
+    def charge(self, amount: float, method: str, details: Dict[str, Any],
+               reference: str) -> PaymentResult:
+        status, data = self._post('/v1/charges', {
+            'amount': round(amount * 100),
+            'currency': 'usd',
+            'method': method,
+            'details': details,
+        }, idempotency_key=f'charge-{reference}')
+        if status == 200:
+            return PaymentResult(success=True, payment_id=data['id'], method=method)
+        return PaymentResult(success=False, method=method,
+                             error=data.get('error', f'Gateway returned {status}'))
+
+    def refund(self, payment_id: str, amount: float) -> PaymentResult:
+        status, data = self._post('/v1/refunds', {
+            'payment_id': payment_id,
+            'amount': round(amount * 100),
+        }, idempotency_key=f'refund-{payment_id}')
+        return PaymentResult(success=status == 200, payment_id=payment_id, method='refund',
+                             error=None if status == 200 else data.get('error'))
+
+    def void(self, reference: str) -> bool:
+        """Cancel the charge made for ``reference``, if the gateway has one."""
+        status, _ = self._post('/v1/voids', {'idempotency_key': f'charge-{reference}'},
+                               idempotency_key=f'void-{reference}')
+        return status in (200, 404)
+
+    def close(self) -> None:
+        self.pool.close()
+
+
+def init_payment_gateways(app: Flask) -> None:
+    """Create a client for every payment method with a configured gateway URL.
+
+    Methods configured with the same URL and timeout share one client, and
+    so one connection pool and in-flight limit.
+    """
+    clients: Dict[Tuple[str, float], HTTPGatewayClient] = {}
+    gateways = {}
+    for method, settings in app.config['PAYMENT_GATEWAYS'].items():
+        if not settings.get('url'):
+            continue
+        key = (settings['url'], settings.get('timeout', app.config['PAYMENT_TIMEOUT']))
+        if key not in clients:
+            clients[key] = HTTPGatewayClient(
+                urlsplit(key[0]).netloc, key[0], timeout=key[1],
+                max_connections=app.config['PAYMENT_MAX_CONNECTIONS'],
+                acquire_timeout=app.config['PAYMENT_ACQUIRE_TIMEOUT'],
+            )
+        gateways[method] = clients[key]
+    app.extensions['payment_gateways'] = gateways
+
+
+def get_payment_gateway(method: str) -> Optional[HTTPGatewayClient]:
+    """The current app's client for ``method``; None means payments are simulated."""
+    gateways = current_app.extensions.get('payment_gateways', {})
+    return gateways.get(method, gateways.get('default'))
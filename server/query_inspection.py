@@ -0,0 +1,131 @@
+"""SQL inspection: N+1 detection, slow query logging and query budgets."""
+from __future__ import annotations
+
+import logging
+import time
+from collections import Counter
+from dataclasses import dataclass
+from typing import Any, Iterable, List, Tuple
+
+from flask import Flask, Response, g, has_request_context, request
+from sqlalchemy import event
+
+from read_routing import database_engines
+
+logger = logging.getLogger(__name__)
+
+
+@dataclass
+class QueryRecord:
+    statement: str
+    parameters: Any
+    duration: float
+
+
+def find_repeated(statements: Iterable[str], threshold: int) -> List[Tuple[str, int]]:
+    """SELECTs issued at least ``threshold`` times, most frequent first.
+
+    Statements reach the cursor with bound parameters, so identical text
+    means the same query run for different values: the N+1 signature.
+    """
+    counts = Counter(s for s in statements if s.lstrip().upper().startswith('SELECT'))
+    return [(statement, count) for statement, count in counts.most_common() if count >= threshold]
+
+
+def _shorten(text: Any, limit: int = 500) -> str:
+    text = ' '.join(str(text).split())
+    return text if len(text) <= limit else text[:limit] + '...'
+
+
+class QueryRecorder:
+    """Collect every statement an engine executes while the block runs."""
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.queries: List[QueryRecord] = []
+
+    def _before(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('recorder_started', []).append(time.perf_counter())
+
+    def _after(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info['recorder_started'].pop()
+        self.queries.append(QueryRecord(statement, parameters, time.perf_counter() - started))
+
+    def __enter__(self) -> 'QueryRecorder':
+        event.listen(self.engine, 'before_cursor_execute', self._before)
+        event.listen(self.engine, 'after_cursor_execute', self._after)
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        event.remove(self.engine, 'before_cursor_execute', self._before)
+        event.remove(self.engine, 'after_cursor_execute', self._after)
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @property
+    def statements(self) -> List[str]:
+        return [query.statement for query in self.queries]
+
+    def report(self) -> str:
+        return '\n'.join(
+            f'  {i}. {_shorten(query.statement)} {_shorten(query.parameters, 100)}'
+            for i, query in enumerate(self.queries, 1)
+        )
+
+    def assert_within(self, max_queries: int, repeat_threshold: int = 3) -> None:
+        """Fail with the full statement list if the budget was exceeded."""
+        if len(self) > max_queries:
+            raise AssertionError(
+                f'Expected at most {max_queries} queries, got {len(self)}:\n{self.report()}'
+            )
+        repeated = find_repeated(self.statements, repeat_threshold)
+        if repeated:
+            statement, count = repeated[0]
+            raise AssertionError(
+                f'Possible N+1: {count} identical SELECTs: {_shorten(statement)}\n{self.report()}'
+            )
+
+
+def _register_listeners(engine, slow_query_seconds: float) -> None:
+    @event.listens_for(engine, 'before_cursor_execute')
+    def _before(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('inspect_started', []).append(time.perf_counter())
+
+    @event.listens_for(engine, 'after_cursor_execute')
+    def _after(conn, cursor, statement, parameters, context, executemany):
+        stack = conn.info.get('inspect_started')
+        if not stack:
+            return
+        duration = time.perf_counter() - stack.pop()
+
+        if duration >= slow_query_seconds:
+            logger.warning("Slow query (%.1f ms): %s; parameters=%s",
+                           duration * 1000, _shorten(statement), _shorten(parameters, 200))
+
+        if has_request_context() and 'query_log' in g:
+            g.query_log.append(statement)
+
+
+def init_query_inspection(app: Flask) -> None:
+    """Log slow queries and likely N+1 patterns for every request of ``app``."""
+    if not app.config['QUERY_INSPECTION_ENABLED']:
+        return
+
+    threshold = app.config['N_PLUS_ONE_THRESHOLD']
+    with app.app_context():
+        for engine in database_engines():
+            _register_listeners(engine, app.config['SLOW_QUERY_MS'] / 1000)
+
+    @app.before_request
+    def start_query_log():
+        g.query_log = []
+
+    @app.after_request
+    def check_query_log(response: Response) -> Response:
+        statements = g.pop('query_log', None)
+        if statements:
+            for statement, count in find_repeated(statements, threshold):
+                logger.warning("Possible N+1 in %s %s: %d identical SELECTs: %s",
+                               request.method, request.endpoint, count, _shorten(statement))
+        return response
@@ -0,0 +1,167 @@
+"""Send read-only requests to a separate read engine.
+
+By default the read engine opens the primary SQLite file with ``mode=ro``
+through its own connection pool, so catalog browsing never waits for a
+pooled connection held by a request queued on the write lock. In WAL mode
+those readers see every committed write immediately. ``DATABASE_READ_URL``
+points reads at a replica instead; as a replica may lag, a client that just
+wrote keeps reading from the primary for ``READ_YOUR_WRITES_SECONDS``. The
+window is marked by a cookie, which API clients on another origin do not send
+back, so a signed-in user's window is also recorded on the primary by user id.
+"""
+from __future__ import annotations
+
+import time
+from functools import wraps
+from typing import Any, Callable, List, Optional
+from urllib.parse import quote
+
+from flask import Flask, Response, current_app, g, request
+from sqlalchemy import create_engine, select, text
+from sqlalchemy.engine import Engine, make_url
+
+from auth import bearer_user_id
+from database import get_engine_options, get_sqlite_pragmas, configure_sqlite_engine
+from models import ReadYourWritesWindow
+
+# Set on responses to writes while reads go to a replica; until the time it
+# holds, the client's reads are served by the primary
+PRIMARY_UNTIL_COOKIE = 'primary_until'
+
+SAFE_METHODS = frozenset({'GET', 'HEAD', 'OPTIONS'})
+
+_OPEN_WINDOW = text(f"""
+    INSERT INTO {ReadYourWritesWindow.__tablename__} (user_id, primary_until)
+    VALUES (:user_id, :primary_until)
+    ON CONFLICT (user_id) DO UPDATE SET primary_until = excluded.primary_until
+""")
+
+# PRAGMAs that write to the database file and so fail on a read-only connection
+_WRITE_PRAGMAS = ('journal_mode', 'synchronous')
+
+
+def read_only_sqlite_url(url: Any) -> Optional[Any]:
+    """A ``mode=ro`` URI for the SQLite file at ``url``, or None if it has none."""
+    if url.get_backend_name() != 'sqlite' or url.database in (None, '', ':memory:'):
+        return None
+    if url.database.startswith('file:'):
+        return None
+    return url.set(database=f'file:{quote(url.database)}', query={'mode': 'ro', 'uri': 'true'})
+
+
+def create_read_engine(app: Flask, primary: Engine) -> Optional[Engine]:
+    """The engine for read-only requests: a replica if configured, else ``mode=ro``."""
+    replica_url = app.config['DATABASE_READ_URL']
+    url = make_url(replica_url) if replica_url else read_only_sqlite_url(primary.url)
+    if url is None:
+        return None
+
+    profile = app.config['DATABASE_PROFILE']
+    engine = create_engine(url, **get_engine_options(profile))
+    pragmas = {
+        name: value for name, value in get_sqlite_pragmas(profile).items()
+        if name not in _WRITE_PRAGMAS
+    }
+    if replica_url:
+        pragmas['query_only'] = 1
+    configure_sqlite_engine(engine, pragmas)
+    return engine
+
+
+def init_read_routing(app: Flask) -> None:
+    """Create the read engine and the read-your-writes cookie, if enabled."""
+    if not app.config['DATABASE_READ_ROUTING']:
+        return
+
+    with app.app_context():
+        primary = app.extensions['sqlalchemy'].engine
+    engine = create_read_engine(app, primary)
+    if engine is None:
+        return
+    app.extensions['read_engine'] = engine
+
+    if not app.config['DATABASE_READ_URL']:
+        # The same database: committed writes are already visible to readers
+        return
+
+    @app.after_request
+    def remember_write(response: Response) -> Response:
+        if request.method not in SAFE_METHODS and response.status_code < 400:
+            window = app.config['READ_YOUR_WRITES_SECONDS']
+            primary_until = int(time.time() + window + 1)
+            response.set_cookie(PRIMARY_UNTIL_COOKIE, str(primary_until),
+                                max_age=int(window) + 1, httponly=True, samesite='Lax')
+            user_id = bearer_user_id()
+            if user_id is not None:
+                with primary.begin() as connection:
+                    connection.execute(_OPEN_WINDOW, {'user_id': user_id,
+                                                      'primary_until': primary_until})
+        return response
+
+
+def get_read_engine() -> Optional[Engine]:
+    """The current app's read engine, or None when reads use the primary."""
+    return current_app.extensions.get('read_engine')
+
+
+def database_engines() -> List[Engine]:
+    """Every engine of the current app, primary first, for instrumentation."""
+    engines = [current_app.extensions['sqlalchemy'].engine]
+    if get_read_engine() is not None:
+        engines.append(get_read_engine())
+    return engines
+
+
+def _recently_wrote() -> bool:
+    try:
+        if float(request.cookies.get(PRIMARY_UNTIL_COOKIE, 0)) > time.time():
+            return True
+    except ValueError:
+        pass
+
+    user_id = bearer_user_id()
+    if user_id is None:
+        return False
+    with current_app.extensions['sqlalchemy'].engine.connect() as connection:
+        primary_until = connection.execute(
+            select(ReadYourWritesWindow.primary_until)
+            .where(ReadYourWritesWindow.user_id == user_id)
+        ).scalar()
+    return primary_until is not None and primary_until > time.time()
+
+
+def read_only(f: Callable) -> Callable:
+    """Serve a view that only reads from the read engine.
+
+    Behind a replica, a 404 is retried on the primary: the missing row may
+    be one this client just created, such as the order it has just placed.
+    """
+    @wraps(f)
+    def decorated(*args: Any, **kwargs: Any) -> Any:
+        if get_read_engine() is None:
+            return f(*args, **kwargs)
+        # Only a replica lags; the mode=ro engine already sees every commit
+        replica = bool(current_app.config['DATABASE_READ_URL'])
+        if replica and _recently_wrote():
+            return f(*args, **kwargs)
+
+        session = current_app.extensions['sqlalchemy'].session
+        g.use_read_engine = True
+        try:
+            response = f(*args, **kwargs)
+        finally:
+            g.use_read_engine = False
+            # End the read transaction so later queries start on the primary
+            session.rollback()
+
+        if replica and _status_code(response) == 404:
+            return f(*args, **kwargs)
+        return response
+
+    return decorated
+
+
+def _status_code(response: Any) -> int:
+    if isinstance(response, tuple):
+        return response[1] if len(response) > 1 and isinstance(response[1], int) else 200
+    return getattr(response, 'status_code', 200)
@@ -1,19 +1,13 @@
-from app import create_app, db, seed_database
+from app import create_app, prepare_database
 import os
 
 if __name__ == '__main__':
+    # Development server. In production serve through gunicorn instead:
+    #   gunicorn -c gunicorn.conf.py wsgi:app
     app = create_app()
-    
-    with app.app_context():
-        # Create tables
-        db.create_all()
-        
-        # Seed database if it's empty
-        from models import Product
-        if Product.query.count() == 0:
-            seed_database()
-            print("Database seeded with sample products!")
+    prepare_database(app)
     
     # Run the app
     port = int(os.environ.get('PORT', 5000))
-    app.run(debug=True, host='0.0.0.0', port=port)
+    debug = os.environ.get('FLASK_ENV', 'development') == 'development'
+    app.run(debug=debug, host='0.0.0.0', port=port)
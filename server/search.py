@@ -0,0 +1,143 @@
+"""Full-text product search backed by an SQLite FTS5 index."""
+from __future__ import annotations
+
+import logging
+import re
+from typing import Optional
+
+import sqlalchemy as sa
+from sqlalchemy import event
+from sqlalchemy.engine import Connection
+from sqlalchemy.exc import OperationalError
+
+from models import db, Product
+from sqlite_tables import OptionalTable
+
+logger = logging.getLogger(__name__)
+
+FTS_TABLE = 'products_fts'
+
+# Matches in the product name weigh more than matches in the description.
+RANK_EXPRESSION = f'bm25({FTS_TABLE}, 10.0, 1.0)'
+
+MAX_SEARCH_TERMS = 10
+
+_TOKEN_REGEX = re.compile(r'\w+', re.UNICODE)
+
+# External-content index: the FTS table stores only the inverted index and
+# reads column values from ``products``. Triggers keep it in sync, and the
+# update trigger only fires for the indexed columns so stock changes during
+# checkout never touch the index.
+_INDEX_DDL = [
+    f"""
+    CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        name,
+        description,
+        content='products',
+        content_rowid='id',
+        tokenize='unicode61 remove_diacritics 2',
+        prefix='2 3'
+    )
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON products BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+    END
+    """,
+    f"""
+    CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au
+    AFTER UPDATE OF name, description ON products BEGIN
+        INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, name, description)
+        VALUES ('delete', old.id, old.name, old.description);
+        INSERT INTO {FTS_TABLE}(rowid, name, description)
+        VALUES (new.id, new.name, new.description);
+    END
+    """,
+]
+
+_fts_table = sa.table(FTS_TABLE, sa.column('rowid'))
+
+_search_index = OptionalTable(FTS_TABLE)
+
+
+def ensure_search_index(connection: Connection) -> bool:
+    """Create the search index and its triggers if missing.
+
+    A freshly created index is rebuilt from the existing ``products`` rows, so
+    this is safe to run against databases that predate the index.
+    """
+    if connection.dialect.name != 'sqlite':
+        return False
+
+    try:
+        created = not _search_index.exists(connection)
+        for statement in _INDEX_DDL:
+            connection.execute(sa.text(statement))
+        if created:
+            connection.execute(sa.text(
+                f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')"
+            ))
+            logger.info("Built product search index")
+    except OperationalError:
+        logger.warning("FTS5 unavailable, product search falls back to LIKE scans")
+        return False
+
+    _search_index.mark_available(connection.engine)
+    return True
+
+
+@event.listens_for(Product.metadata, 'after_create')
+def _create_search_index(target, connection, **kw):
+    ensure_search_index(connection)
+
+
+def search_available() -> bool:
+    """Check whether the current database has the search index."""
+    return _search_index.available(db.engine)
+
+
+def build_match_expression(term: str) -> Optional[str]:
+    """Turn free text into an FTS5 query that prefix-matches every word.
+
+    Only word characters survive tokenization, so user input can never
+    inject FTS5 query syntax.
+    """
+    tokens = _TOKEN_REGEX.findall(term)[:MAX_SEARCH_TERMS]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def apply_search(query, term: str, ranked: bool = True):
+    """Restrict a product query to search matches.
+
+    With ``ranked`` the best matches come first; otherwise the caller is
+    expected to impose its own order.
+    """
+    if not search_available():
+        return query.filter(Product.name.contains(term))
+
+    match = build_match_expression(term)
+    if match is None:
+        return query.filter(sa.false())
+
+    hits = (
+        sa.select(
+            _fts_table.c.rowid.label('product_id'),
+            sa.literal_column(RANK_EXPRESSION).label('score')
+        )
+        .where(sa.text(f'{FTS_TABLE} MATCH :fts_match').bindparams(fts_match=match))
+        .subquery('search_hits')
+    )
+
+    query = query.join(hits, hits.c.product_id == Product.id)
+    if ranked:
+        query = query.order_by(hits.c.score, Product.id)
+    return query
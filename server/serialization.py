@@ -0,0 +1,93 @@
+"""Fast JSON encoding and pre-encoded product fragments."""
+from __future__ import annotations
+
+import json
+import logging
+from typing import Any, Dict, List
+
+from flask import Flask, current_app
+from flask.json.provider import DefaultJSONProvider
+
+from cache import get_catalog_cache
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - optional dependency
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+if orjson is not None:
+    # Match Flask's defaults: sorted keys, and dates and dataclasses go
+    # through the provider's default() so the output is backend-independent
+    _ORJSON_OPTIONS = (orjson.OPT_SORT_KEYS | orjson.OPT_NON_STR_KEYS
+                       | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS)
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson when available.
+
+    ``JSON_BACKEND`` selects ``orjson``, ``stdlib`` or ``auto`` (orjson if
+    installed). Both backends produce compact, key-sorted output, so the
+    choice never changes a response body beyond whitespace and escaping.
+    """
+
+    def __init__(self, app: Flask):
+        super().__init__(app)
+        backend = app.config.get('JSON_BACKEND', 'auto')
+        if backend == 'orjson' and orjson is None:
+            logger.warning("JSON_BACKEND=orjson but orjson is not installed; using json")
+        self.use_orjson = orjson is not None and backend in ('auto', 'orjson')
+
+    def encode(self, obj: Any) -> bytes:
+        """Compact JSON bytes for ``obj``."""
+        if self.use_orjson:
+            return orjson.dumps(obj, default=self.default, option=_ORJSON_OPTIONS)
+        return json.dumps(obj, default=self.default, sort_keys=self.sort_keys,
+                          ensure_ascii=self.ensure_ascii, separators=(',', ':')).encode()
+
+    def dumps(self, obj: Any, **kwargs: Any) -> str:
+        if kwargs:
+            return super().dumps(obj, **kwargs)
+        return self.encode(obj).decode()
+
+    def loads(self, s: str | bytes, **kwargs: Any) -> Any:
+        if self.use_orjson and not kwargs:
+            return orjson.loads(s)
+        return super().loads(s, **kwargs)
+
+    def response(self, *args: Any, **kwargs: Any):
+        if self._app.debug:
+            # Keep Flask's indented output while debugging
+            return super().response(*args, **kwargs)
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(self.encode(obj), mimetype=self.mimetype)
+
+
+def encode_json(obj: Any) -> bytes:
+    """Encode ``obj`` with the current app's JSON provider."""
+    provider = current_app.json
+    if isinstance(provider, FastJSONProvider):
+        return provider.encode(obj)
+    return provider.dumps(obj, separators=(',', ':')).encode()
+
+
+def product_fragment(product) -> bytes:
+    """The encoded ``to_dict()`` of a product, reused while its row is unchanged."""
+    cache = get_catalog_cache()
+    if cache is None:
+        return encode_json(product.to_dict())
+    return cache.product_fragment(product, lambda: encode_json(product.to_dict()))
+
+
+def encode_with_fragments(envelope: Dict[str, Any], key: str, fragments: List[bytes]) -> bytes:
+    """Encode ``envelope`` with ``key`` set to a list of pre-encoded items.
+
+    The envelope is encoded with an empty list under ``key`` and the items are
+    spliced in. Keys are unique and string values never contain an unescaped
+    quote, so the placeholder can only match the key itself.
+    """
+    placeholder = f'"{key}":[]'.encode()
+    encoded = encode_json(dict(envelope, **{key: []}))
+    index = encoded.index(placeholder) + len(placeholder) - 1
+    return encoded[:index] + b','.join(fragments) + encoded[index:]
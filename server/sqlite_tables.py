@@ -0,0 +1,40 @@
+"""Tables, such as the search index, that only SQLite databases can have."""
+from __future__ import annotations
+
+import weakref
+
+import sqlalchemy as sa
+from sqlalchemy.engine import Connection, Engine
+
+
+class OptionalTable:
+    """An SQLite-only table whose presence is checked once per engine.
+
+    Queries use it when the current database has it and fall back to
+    plain SQL otherwise, so older databases and other dialects still work.
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self._status: 'weakref.WeakKeyDictionary[Engine, bool]' = weakref.WeakKeyDictionary()
+
+    def exists(self, connection: Connection) -> bool:
+        """Look the table up in ``sqlite_master``, bypassing the cache."""
+        return connection.execute(
+            sa.text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = :name"),
+            {'name': self.name}
+        ).first() is not None
+
+    def mark_available(self, engine: Engine) -> None:
+        """Record that the table has just been created on ``engine``'s database."""
+        self._status[engine] = True
+
+    def available(self, engine: Engine) -> bool:
+        """Check whether ``engine``'s database has the table."""
+        if engine not in self._status:
+            if engine.dialect.name != 'sqlite':
+                self._status[engine] = False
+            else:
+                with engine.connect() as connection:
+                    self._status[engine] = self.exists(connection)
+        return self._status[engine]
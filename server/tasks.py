@@ -0,0 +1,52 @@
+"""Background job handlers for work that should not delay a response."""
+from __future__ import annotations
+
+import logging
+from typing import Any, Dict
+
+from flask import current_app
+
+from models import db, Order, Product
+from jobs import enqueue, job
+from payments import get_payment_gateway
+
+logger = logging.getLogger(__name__)
+
+
+@job('order_confirmation', max_attempts=8)
+def send_order_confirmation(payload: Dict[str, Any]) -> None:
+    """Notify the customer that their order was confirmed.
+
+    There is no mail provider yet, so the confirmation is logged; delivery
+    belongs here so a slow or failing provider never holds up checkout. The
+    order's products are then queued for a stock level check.
+    """
+    order = db.session.get(Order, payload['order_id'])
+    if order is None:
+        return
+    recipient = order.user.email if order.user else 'guest'
+    logger.info("Order %s confirmed for %s: %d items, total %.2f",
+                order.order_number, recipient, len(order.items), order.total_amount)
+
+    enqueue('low_stock_check', {'product_ids': [item.product_id for item in order.items]})
+    db.session.commit()
+
+
+@job('low_stock_check', concurrency=1)
+def check_stock_levels(payload: Dict[str, Any]) -> None:
+    """Warn about products whose stock fell below ``LOW_STOCK_THRESHOLD``."""
+    threshold = current_app.config['LOW_STOCK_THRESHOLD']
+    low = (
+        db.session.query(Product.id, Product.name, Product.stock_quantity)
+        .filter(Product.id.in_(payload['product_ids']), Product.stock_quantity < threshold)
+    )
+    for product_id, name, stock in low:
+        logger.warning("Low stock: product %d (%s) has %d left", product_id, name, stock)
+
+
+@job('void_payment', max_attempts=10)
+def void_payment(payload: Dict[str, Any]) -> None:
+    """Cancel a charge whose outcome was unknown when checkout gave up on it."""
+    gateway = get_payment_gateway(payload['method'])
+    if gateway is not None and not gateway.void(payload['reference']):
+        raise RuntimeError(f"Gateway refused to void {payload['reference']}")
@@ -0,0 +1,88 @@
+import json
+import pytest
+from admission import Limit, MemoryBuckets, SQLiteBuckets
+
+@pytest.fixture
+def admission(app):
+    """The test app's admission control, adjustable per test."""
+    return app.extensions['admission']
+
+def login(client, ip='10.0.0.1', **headers):
+    return client.post('/api/auth/login', data=json.dumps({
+        'email': 'nobody@example.com', 'password': 'wrong'
+    }), content_type='application/json', headers=headers, environ_base={'REMOTE_ADDR': ip})
+
+class TestTokenBuckets:
+    def test_parse_limit(self):
+        """Test 'count/period' specs become a burst and a refill rate"""
+        assert Limit.parse('10/minute') == Limit(burst=10, rate=10 / 60)
+        with pytest.raises(ValueError):
+            Limit.parse('10/fortnight')
+
+    @pytest.mark.parametrize('store', ['memory', 'sqlite'])
+    def test_burst_then_refill(self, store, tmp_path, clock):
+        """Test a bucket admits its burst, then one request per refill interval"""
+        buckets = (MemoryBuckets(100, clock=clock) if store == 'memory'
+                   else SQLiteBuckets(str(tmp_path / 'limits.db'), clock=clock))
+        limit = Limit.parse('3/minute')
+
+        assert [buckets.take('a', limit) for _ in range(3)] == [0, 0, 0]
+        assert buckets.take('a', limit) == pytest.approx(20)
+        assert buckets.take('b', limit) == 0
+
+        clock.now += 10
+        assert buckets.take('a', limit) == pytest.approx(10)
+        clock.now += 10
+        assert buckets.take('a', limit) == 0
+        assert buckets.take('a', limit) == pytest.approx(20)
+
+    def test_sqlite_buckets_are_shared(self, tmp_path, clock):
+        """Test workers using the same file draw from one bucket"""
+        path = str(tmp_path / 'limits.db')
+        first, second = SQLiteBuckets(path, clock=clock), SQLiteBuckets(path, clock=clock)
+        limit = Limit.parse('2/minute')
+
+        assert first.take('a', limit) == 0
+        assert second.take('a', limit) == 0
+        assert first.take('a', limit) > 0
+        assert second.take('a', limit) > 0
+
+class TestAdmissionControl:
+    def test_login_limited_per_ip(self, client, admission):
+        """Test login attempts past the burst get a 429 with Retry-After"""
+        admission.limits['auth'] = Limit.parse('2/minute')
+        assert login(client).status_code == 401
+        assert login(client).status_code == 401
+
+        response = login(client)
+        assert response.status_code == 429
+        assert response.headers['Retry-After'] == '30'
+        assert 'error' in json.loads(response.data)
+
+        # Other clients and other route classes are unaffected
+        assert login(client, ip='10.0.0.2').status_code == 401
+        assert client.get('/api/categories', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 200
+        assert client.get('/api/health', environ_base={'REMOTE_ADDR': '10.0.0.1'}).status_code == 200
+
+    def test_search_has_its_own_limit(self, client, admission, sample_products):
+        """Test searches are limited separately from plain browsing"""
+        admission.limits['search'] = Limit.parse('1/minute')
+        assert client.get('/api/products?search=test').status_code == 200
+        assert client.get('/api/products?search=other').status_code == 429
+        assert client.get('/api/products').status_code == 200
+
+    def test_signed_in_users_are_limited_by_user(self, client, admission, auth_headers):
+        """Test a signed-in user's requests count against the user, not the address"""
+        admission.limits['default'] = Limit.parse('1/minute')
+        assert client.get('/api/auth/me', headers=auth_headers).status_code == 200
+        assert client.get('/api/auth/me', headers=auth_headers,
+                          environ_base={'REMOTE_ADDR': '10.0.0.9'}).status_code == 429
+        assert client.get('/api/categories').status_code == 200
+
+    def test_forwarded_for_behind_trusted_proxy(self, client, admission):
+        """Test the address our proxy appended is used, not ones the client sent"""
+        admission.limits['auth'] = Limit.parse('1/minute')
+        admission.proxy_count = 1
+        assert login(client, **{'X-Forwarded-For': '1.1.1.1, 203.0.113.5'}).status_code == 401
+        assert login(client, **{'X-Forwarded-For': '2.2.2.2, 203.0.113.5'}).status_code == 429
+        assert login(client, **{'X-Forwarded-For': '203.0.113.6'}).status_code == 401
@@ -1,7 +1,10 @@
 import pytest
 import json
-from models import Product, Order, OrderItem
-from app import db
+import sqlite3
+from datetime import datetime, timedelta
+from models import Product, Order, OrderItem, Job
+from app import db, PaymentProcessor, PaymentResult
+from pagination import encode_cursor
 
 class TestProductAPI:
     def test_get_products_empty(self, client):
@@ -79,4 +82,235 @@ class TestCheckoutAPI:
         
         assert response.status_code == 400
         data = json.loads(response.data)
-        assert 'insufficient stock' in data['error'].lower()
\ No newline at end of file
+        assert 'insufficient stock' in data['error'].lower()
+    
+    def test_payment_runs_outside_write_transaction(self, app, client, sample_products, monkeypatch):
+        """Test the database write lock is free while payment is processed"""
+        db_path = app.config['DATABASE']
+        lock_free = []
+
+        def fake_payment(amount, method, details, reference=None):
+            conn = sqlite3.connect(db_path, timeout=0)
+            try:
+                conn.execute('BEGIN IMMEDIATE')
+                lock_free.append(True)
+                conn.rollback()
+            finally:
+                conn.close()
+            return PaymentResult(success=True, payment_id='pi_test', method=method)
+
+        monkeypatch.setattr(PaymentProcessor, 'process_payment', fake_payment)
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 1}]}),
+                               content_type='application/json')
+
+        assert response.status_code == 201
+        assert lock_free == [True]
+
+    def test_failed_payment_releases_reservation(self, app, client, sample_products, monkeypatch):
+        """Test a declined payment returns stock and marks the order"""
+        monkeypatch.setattr(
+            PaymentProcessor, 'process_payment',
+            lambda amount, method, details, reference=None: PaymentResult(success=False, error='Card declined')
+        )
+
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 4}]}),
+                               content_type='application/json')
+
+        assert response.status_code == 400
+        assert 'Card declined' in json.loads(response.data)['error']
+        with app.app_context():
+            assert db.session.get(Product, 1).stock_quantity == 10
+            assert Order.query.one().status == 'payment_failed'
+
+    def test_release_stale_reservations_command(self, app, runner, sample_products):
+        """Test abandoned pending orders give their stock back"""
+        with app.app_context():
+            product = db.session.get(Product, 2)
+            product.stock_quantity -= 2
+            order = Order(total_amount=99.98, status='pending',
+                          created_at=datetime.utcnow() - timedelta(hours=1))
+            order.items.append(OrderItem(product_id=2, quantity=2, price=49.99))
+            fresh = Order(total_amount=49.99, status='pending')
+            fresh.items.append(OrderItem(product_id=2, quantity=1, price=49.99))
+            db.session.add_all([order, fresh])
+            db.session.commit()
+            order_number = order.order_number
+
+        result = runner.invoke(args=['release-reservations'])
+        assert 'Released 1 stale reservations' in result.output
+
+        with app.app_context():
+            assert db.session.get(Product, 2).stock_quantity == 5
+            assert [o.status for o in Order.query.order_by(Order.id)] == ['expired', 'pending']
+            # The worker may have died after charging, so the charge is voided
+            void = Job.query.filter_by(job_type='void_payment').one()
+            assert json.loads(void.payload)['reference'] == order_number
+
+
+class TestProductCursorPagination:
+    @pytest.fixture
+    def many_products(self, app):
+        """Create products with duplicate prices to exercise tie-breaking"""
+        with app.app_context():
+            for i in range(7):
+                db.session.add(Product(
+                    name=f'Product {i}',
+                    price=10.0 if i % 2 else 20.0,
+                    category='electronics' if i < 5 else 'home',
+                    stock_quantity=1
+                ))
+            db.session.commit()
+
+    def _walk(self, client, url):
+        """Follow next_cursor links and return every product id"""
+        ids = []
+        data = json.loads(client.get(f'{url}&after=').data)
+        ids.extend(product['id'] for product in data['products'])
+        while data['next_cursor']:
+            data = json.loads(client.get(f"{url}&after={data['next_cursor']}").data)
+            ids.extend(product['id'] for product in data['products'])
+        assert data['has_more'] is False
+        return ids
+
+    def test_cursor_walk_visits_every_product_once(self, client, many_products):
+        """Test cursor pages cover the listing in id order"""
+        assert self._walk(client, '/api/products?per_page=3') == [1, 2, 3, 4, 5, 6, 7]
+
+    def test_cursor_walk_with_duplicate_sort_keys(self, client, many_products):
+        """Test descending price order breaks ties by id"""
+        ids = self._walk(client, '/api/products?per_page=2&sort=-price')
+        assert ids == [7, 5, 3, 1, 6, 4, 2]
+
+    def test_cursor_with_category_and_total(self, client, many_products):
+        """Test filters apply to cursor pages and total is opt-in"""
+        data = json.loads(client.get('/api/products?category=home&after=').data)
+        assert [product['id'] for product in data['products']] == [6, 7]
+        assert 'total' not in data
+
+        data = json.loads(client.get('/api/products?category=home&after=&include_total=1').data)
+        assert data['total'] == 2
+
+    def test_cursor_rejects_tampered_or_mismatched_token(self, client, many_products):
+        """Test invalid cursors are rejected"""
+        assert client.get('/api/products?after=not-a-cursor').status_code == 400
+        for values in (['id', {'a': 1}], ['id', [1, 2]], ['id', True]):
+            assert client.get(f'/api/products?after={encode_cursor(values)}').status_code == 400
+
+        data = json.loads(client.get('/api/products?per_page=2&sort=price&after=').data)
+        response = client.get(f"/api/products?sort=name&after={data['next_cursor']}")
+        assert response.status_code == 400
+
+    def test_page_mode_respects_sort(self, client, many_products):
+        """Test classic page pagination keeps working with a sort"""
+        data = json.loads(client.get('/api/products?page=2&per_page=3&sort=-id').data)
+        assert [product['id'] for product in data['products']] == [4, 3, 2]
+        assert data['total'] == 7
+        assert data['pages'] == 3
+
+
+class TestCartValidationAPI:
+    def test_validate_large_cart_uses_one_query(self, client, sample_products, query_counter):
+        """Test every cart line is validated from a single product query"""
+        items = [{'product_id': 1 + i % 2, 'quantity': 1} for i in range(8)]
+        items.append({'product_id': 999, 'quantity': 1})
+
+        response = client.post('/api/cart/validate',
+                               data=json.dumps({'items': items}),
+                               content_type='application/json')
+
+        assert response.status_code == 200
+        product_queries = [s for s in query_counter if 'FROM products' in s]
+        assert len(product_queries) == 1
+
+    def test_validate_merges_repeated_products(self, client, sample_products):
+        """Test repeated lines are validated against their combined quantity"""
+        items = [
+            {'product_id': 2, 'quantity': 3},
+            {'product_id': 1, 'quantity': 1},
+            {'product_id': 2, 'quantity': 3},
+        ]
+
+        response = client.post('/api/cart/validate',
+                               data=json.dumps({'items': items}),
+                               content_type='application/json')
+
+        data = json.loads(response.data)
+        assert data['valid'] is False
+        assert [item['product_id'] for item in data['items']] == [2, 1]
+        assert data['items'][0]['error'] == 'Only 5 items available'
+        assert data['items'][1]['valid'] is True
+
+    def test_checkout_merges_repeated_products(self, client, sample_products):
+        """Test checkout rejects repeated lines that together exceed stock"""
+        checkout_data = {
+            'items': [
+                {'product_id': 2, 'quantity': 3},
+                {'product_id': 2, 'quantity': 3},
+            ]
+        }
+
+        response = client.post('/api/checkout',
+                               data=json.dumps(checkout_data),
+                               content_type='application/json')
+
+        assert response.status_code == 400
+        assert 'insufficient stock' in json.loads(response.data)['error'].lower()
+
+
+class TestQueryBudgets:
+    """Per-endpoint query ceilings; a failure lists every statement issued."""
+
+    @pytest.fixture
+    def order_number(self, app, sample_products):
+        with app.app_context():
+            order = Order(total_amount=79.98, status='confirmed')
+            order.items.append(OrderItem(product_id=1, quantity=1, price=29.99))
+            order.items.append(OrderItem(product_id=2, quantity=1, price=49.99))
+            db.session.add(order)
+            db.session.commit()
+            return order.order_number
+
+    def test_product_listing(self, client, sample_products, query_budget):
+        """Test a filtered listing stays within its query budget"""
+        with query_budget(3):
+            client.get('/api/products?category=electronics')
+
+    def test_product_detail(self, client, sample_products, query_budget):
+        """Test product detail stays within its query budget"""
+        with query_budget(2):
+            client.get('/api/products/1')
+
+    def test_categories(self, client, sample_products, query_budget):
+        """Test the category list stays within its query budget"""
+        with query_budget(2):
+            client.get('/api/categories')
+
+    def test_cart_validate(self, client, sample_products, query_budget):
+        """Test cart size does not add queries"""
+        items = [{'product_id': 1 + i % 2, 'quantity': 1} for i in range(20)]
+        with query_budget(1):
+            client.post('/api/cart/validate', data=json.dumps({'items': items}),
+                        content_type='application/json')
+
+    def test_checkout(self, client, sample_products, query_budget, monkeypatch):
+        """Test checkout stays within its query budget"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        monkeypatch.setattr('app.time.sleep', lambda seconds: None)
+        items = [{'product_id': 1, 'quantity': 1}, {'product_id': 2, 'quantity': 1}]
+        # Includes queueing the order confirmation job
+        with query_budget(11):
+            response = client.post('/api/checkout', data=json.dumps({'items': items}),
+                                   content_type='application/json')
+        assert response.status_code == 201
+
+    def test_order_detail(self, client, order_number, query_budget):
+        """Test order detail stays within its query budget"""
+        with query_budget(2):
+            client.get(f'/api/orders/{order_number}')
+
+    def test_profile(self, client, auth_headers, query_budget):
+        """Test the profile stays within its query budget"""
+        with query_budget(2):
+            client.get('/api/user/profile', headers=auth_headers)
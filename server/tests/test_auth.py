@@ -0,0 +1,82 @@
+import pytest
+import json
+import jwt
+from datetime import datetime, timedelta
+from models import User
+from app import db
+from auth import decode_token, load_user
+
+class TestTokenCache:
+    def test_verified_token_skips_jwt_decode(self, app, auth_headers, monkeypatch):
+        """Test repeat decodes are served from the token cache"""
+        token = auth_headers['Authorization'].split(' ')[1]
+        calls = []
+        real_decode = jwt.decode
+
+        def counting_decode(*args, **kwargs):
+            calls.append(1)
+            return real_decode(*args, **kwargs)
+
+        monkeypatch.setattr(jwt, 'decode', counting_decode)
+        with app.app_context():
+            first = decode_token(token)
+            second = decode_token(token)
+
+        assert first == second
+        assert len(calls) == 1
+
+    def test_expired_cached_token_is_rejected(self, app, test_user, monkeypatch):
+        """Test cached claims stop being accepted once exp passes"""
+        with app.app_context():
+            token = jwt.encode({
+                'user_id': test_user['id'],
+                'email': test_user['email'],
+                'exp': datetime.utcnow() + timedelta(seconds=30),
+            }, app.config['SECRET_KEY'], algorithm='HS256')
+            assert decode_token(token) is not None
+
+            import auth
+            monkeypatch.setattr(auth.time, 'time', lambda: datetime.utcnow().timestamp() + 60)
+            assert decode_token(token) is None
+
+    def test_invalid_token_is_not_cached(self, app):
+        """Test garbage tokens keep failing"""
+        with app.app_context():
+            assert decode_token('not-a-token') is None
+            assert decode_token('not-a-token') is None
+
+class TestUserCache:
+    def test_me_endpoint_hits_no_database_when_warm(self, client, auth_headers, query_counter):
+        """Test authenticated hot paths issue no SQL once cached"""
+        client.get('/api/auth/me', headers=auth_headers)
+        query_counter.clear()
+
+        response = client.get('/api/auth/me', headers=auth_headers)
+
+        assert response.status_code == 200
+        assert query_counter == []
+
+    def test_profile_update_invalidates_cached_user(self, client, auth_headers):
+        """Test profile changes are visible on the next request"""
+        client.get('/api/auth/me', headers=auth_headers)
+
+        response = client.put('/api/user/profile',
+                              data=json.dumps({'first_name': 'Changed'}),
+                              headers=auth_headers)
+        assert response.status_code == 200
+
+        data = json.loads(client.get('/api/auth/me', headers=auth_headers).data)
+        assert data['user']['first_name'] == 'Changed'
+
+    def test_cached_user_is_attached_to_session(self, app, test_user):
+        """Test a user rebuilt from the cache can be updated"""
+        with app.app_context():
+            load_user(test_user['id'])
+            db.session.remove()
+
+            user = load_user(test_user['id'])
+            user.last_name = 'Cached'
+            db.session.commit()
+
+            db.session.remove()
+            assert db.session.get(User, test_user['id']).last_name == 'Cached'
@@ -0,0 +1,106 @@
+import pytest
+import json
+from models import CatalogState, Product
+from app import db, PaymentProcessor
+from cache import LRUCache, get_catalog_cache
+
+class TestLRUCache:
+    def test_evicts_least_recently_used(self):
+        """Test the oldest untouched entry is evicted first"""
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+
+        assert cache.get('a') == 1
+        assert cache.get('b') is None
+        assert cache.get('c') == 3
+
+    def test_entries_expire(self, clock):
+        """Test entries are dropped after their TTL"""
+        cache = LRUCache(maxsize=10, ttl=5, clock=clock)
+        cache.set('a', 1)
+
+        clock.now += 4.9
+        assert cache.get('a') == 1
+        clock.now += 0.1
+        assert cache.get('a') is None
+        assert len(cache) == 0
+
+class TestCatalogCache:
+    def test_repeat_reads_skip_product_queries(self, client, sample_products, query_counter):
+        """Test cached catalog reads only look up the catalog version"""
+        for url in ['/api/products', '/api/products/1', '/api/categories']:
+            client.get(url)
+
+        query_counter.clear()
+        for url in ['/api/products', '/api/products/1', '/api/categories']:
+            assert client.get(url).status_code == 200
+
+        assert len(query_counter) == 3
+        assert all('FROM catalog_state' in statement for statement in query_counter)
+
+    def test_checkout_invalidates_purchased_product_only(self, app, client, sample_products, monkeypatch):
+        """Test stock changes evict the product and listings containing it"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        client.get('/api/products/1')
+        client.get('/api/products/2')
+        client.get('/api/products?category=electronics')
+        client.get('/api/products?category=home')
+
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 3}]}),
+                               content_type='application/json')
+        assert response.status_code == 201
+
+        with app.app_context():
+            cache = get_catalog_cache()
+            assert cache.get_product(1) is None
+            assert cache.get_product(2) is not None
+            assert cache.get_listing(('home', None, None, 1, None, 20, False)) is not None
+
+        assert json.loads(client.get('/api/products/1').data)['stock_quantity'] == 7
+        data = json.loads(client.get('/api/products?category=electronics').data)
+        assert data['products'][0]['stock_quantity'] == 7
+
+    def test_entries_older_than_catalog_version_are_misses(self, app, client, sample_products):
+        """Test a commit made by another worker is served before cached entries expire"""
+        client.get('/api/products/1')
+
+        with app.app_context(), db.engine.begin() as connection:
+            # Bypasses this process's session hooks, as another worker's commit would
+            connection.execute(db.update(Product).where(Product.id == 1).values(price=5.0))
+            CatalogState.bump(connection)
+        with app.app_context():
+            version = CatalogState.current()[0]
+
+        response = client.get('/api/products/1')
+        assert json.loads(response.data)['price'] == 5.0
+        assert response.headers['ETag'].strip('"').startswith(f'{version}-')
+
+    def test_product_changes_invalidate_listings_and_categories(self, app, client, sample_products):
+        """Test inserts and category changes are visible immediately"""
+        client.get('/api/products')
+        client.get('/api/categories')
+
+        with app.app_context():
+            product = db.session.get(Product, 2)
+            product.category = 'garden'
+            db.session.add(Product(name='New Product', price=5.0, category='toys'))
+            db.session.commit()
+
+        assert json.loads(client.get('/api/products').data)['total'] == 3
+        categories = json.loads(client.get('/api/categories').data)['categories']
+        assert set(categories) == {'electronics', 'garden', 'toys'}
+
+    def test_rolled_back_changes_keep_cache(self, app, client, sample_products):
+        """Test rolled back transactions do not invalidate"""
+        client.get('/api/products/1')
+
+        with app.app_context():
+            product = db.session.get(Product, 1)
+            product.stock_quantity = 0
+            db.session.flush()
+            db.session.rollback()
+            assert get_catalog_cache().get_product(1) is not None
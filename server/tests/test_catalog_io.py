@@ -0,0 +1,133 @@
+import pytest
+import csv
+import io
+import json
+from models import db, Product, InventoryMovement
+from inventory import audit_stock
+
+@pytest.fixture
+def admin_headers(app, auth_headers):
+    """The test user's headers, with the test user made an admin."""
+    app.config['ADMIN_EMAILS'] = {'test@example.com'}
+    return auth_headers
+
+def _ndjson(*rows):
+    return ''.join(json.dumps(row) + '\n' for row in rows)
+
+class TestImportEndpoint:
+    def test_requires_admin(self, client, auth_headers):
+        """Test signed-in non-admins are refused"""
+        response = client.post('/api/admin/products/import', data='', headers=auth_headers)
+        assert response.status_code == 403
+        assert client.post('/api/admin/products/import', data='').status_code == 401
+
+    def test_upserts_and_reports_invalid_rows(self, app, client, admin_headers, sample_products):
+        """Test new rows are inserted, known ids updated and bad lines skipped"""
+        client.get('/api/products')  # warm the listing cache
+        body = _ndjson(
+            {'id': 1, 'name': 'Renamed', 'price': 19.99, 'category': 'electronics'},
+            {'id': 2, 'name': 'Test Product 2', 'price': 49.99, 'category': 'home', 'stock_quantity': 8},
+            {'name': 'Brand New', 'price': 5, 'category': 'garden', 'stock_quantity': 3},
+            {'name': '', 'price': 5},
+        ) + '{broken\n'
+
+        response = client.post('/api/admin/products/import', data=body,
+                               headers=dict(admin_headers, **{'Content-Type': 'application/x-ndjson'}))
+
+        result = json.loads(response.data)
+        assert (result['inserted'], result['updated'], result['failed']) == (1, 2, 2)
+        assert [error['line'] for error in result['errors']] == [4, 5]
+
+        with app.app_context():
+            assert db.session.get(Product, 1).name == 'Renamed'
+            assert db.session.get(Product, 1).stock_quantity == 10  # blank stock is kept
+            assert db.session.get(Product, 2).stock_quantity == 8
+            assert audit_stock() == []
+
+        listing = json.loads(client.get('/api/products').data)
+        assert [p['name'] for p in listing['products']] == ['Renamed', 'Test Product 2', 'Brand New']
+        categories = json.loads(client.get('/api/categories').data)['categories']
+        assert 'garden' in categories
+
+    def test_rejects_repeated_ids_and_non_finite_prices(self, app, client, admin_headers):
+        """Test a repeated id and NaN or infinite prices are reported, not imported"""
+        body = _ndjson({'id': 7, 'name': 'First', 'price': 1},
+                       {'id': 7, 'name': 'Second', 'price': 2}) + (
+            '{"name": "Nan", "price": NaN}\n'
+            '{"name": "Inf", "price": "inf"}\n'
+        )
+
+        response = client.post('/api/admin/products/import', data=body,
+                               headers=dict(admin_headers, **{'Content-Type': 'application/x-ndjson'}))
+
+        result = json.loads(response.data)
+        assert (result['inserted'], result['failed']) == (1, 3)
+        assert [error['line'] for error in result['errors']] == [2, 3, 4]
+        with app.app_context():
+            assert [p.name for p in Product.query.all()] == ['First']
+
+    def test_rejects_booleans_and_fractional_stock(self, app, client, admin_headers):
+        """Test true prices, ids and stock, and fractional stock, are reported, not coerced"""
+        body = _ndjson({'name': 'Bool price', 'price': True},
+                       {'id': True, 'name': 'Bool id', 'price': 1},
+                       {'name': 'Bool stock', 'price': 1, 'stock_quantity': True},
+                       {'name': 'Half stock', 'price': 1, 'stock_quantity': 1.5},
+                       {'name': 'Whole stock', 'price': 1, 'stock_quantity': 2.0})
+
+        response = client.post('/api/admin/products/import', data=body,
+                               headers=dict(admin_headers, **{'Content-Type': 'application/x-ndjson'}))
+
+        result = json.loads(response.data)
+        assert (result['inserted'], result['failed']) == (1, 4)
+        assert [error['line'] for error in result['errors']] == [1, 2, 3, 4]
+        with app.app_context():
+            assert [(p.name, p.stock_quantity) for p in Product.query.all()] == [('Whole stock', 2)]
+
+    def test_csv_import_in_batches(self, app, client, admin_headers):
+        """Test CSV bodies are imported across several batches"""
+        app.config['PRODUCT_IMPORT_BATCH_SIZE'] = 2
+        rows = ['name,price,category,stock_quantity'] + [f'Item {i},1.5,misc,{i}' for i in range(5)]
+
+        response = client.post('/api/admin/products/import', data='\n'.join(rows) + '\n',
+                               headers=dict(admin_headers, **{'Content-Type': 'text/csv'}))
+
+        assert json.loads(response.data)['inserted'] == 5
+        with app.app_context():
+            assert Product.query.count() == 5
+            assert InventoryMovement.query.filter_by(reason='import').count() == 4
+
+class TestExport:
+    def test_export_streams_csv(self, client, admin_headers, sample_products):
+        """Test the export endpoint streams every product"""
+        response = client.get('/api/admin/products/export?format=csv', headers=admin_headers)
+
+        assert response.is_streamed
+        rows = list(csv.DictReader(io.StringIO(response.get_data(as_text=True))))
+        assert [row['name'] for row in rows] == ['Test Product 1', 'Test Product 2']
+
+    def test_cli_round_trip(self, app, runner, sample_products, tmp_path):
+        """Test an exported file imports back without changes"""
+        target = tmp_path / 'products.ndjson'
+        runner.invoke(args=['products', 'export', str(target)])
+        assert len(target.read_text().splitlines()) == 2
+
+        result = runner.invoke(args=['products', 'import', str(target)])
+
+        assert 'Imported 0 new and 2 updated products, 0 failed' in result.output
+        with app.app_context():
+            assert InventoryMovement.query.filter_by(reason='import').count() == 0
+            assert db.session.get(Product, 2).to_dict()['stock_quantity'] == 5
+
+    def test_cli_csv_keeps_line_breaks_in_fields(self, app, runner, sample_products, tmp_path):
+        """Test CSV files round trip descriptions containing line breaks"""
+        with app.app_context():
+            db.session.get(Product, 1).description = 'First line\r\nSecond line'
+            db.session.commit()
+        target = tmp_path / 'products.csv'
+        runner.invoke(args=['products', 'export', str(target)])
+
+        result = runner.invoke(args=['products', 'import', str(target)])
+
+        assert 'Imported 0 new and 2 updated products, 0 failed' in result.output
+        with app.app_context():
+            assert db.session.get(Product, 1).description == 'First line\r\nSecond line'
@@ -0,0 +1,77 @@
+import pytest
+import gzip
+import json
+from models import db, Product
+import compression
+
+@pytest.fixture
+def catalog(app):
+    """Enough products for a listing well above the compression threshold."""
+    with app.app_context():
+        for i in range(40):
+            db.session.add(Product(name=f'Product {i}', description='Compressible text ' * 10,
+                                   price=10.0, category='electronics', stock_quantity=5))
+        db.session.commit()
+
+def _get(client, path='/api/products?per_page=40', **headers):
+    return client.get(path, headers=headers)
+
+class TestNegotiation:
+    def test_gzip_listing_round_trips(self, client, catalog):
+        """Test a gzip-accepting client gets a smaller, identical body"""
+        plain = _get(client)
+        response = _get(client, **{'Accept-Encoding': 'gzip'})
+
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert len(response.data) < len(plain.data)
+        assert json.loads(gzip.decompress(response.data)) == json.loads(plain.data)
+
+    def test_identity_without_accept_encoding(self, client, catalog):
+        """Test clients that accept nothing get the plain body"""
+        response = _get(client)
+        assert 'Content-Encoding' not in response.headers
+        assert 'Accept-Encoding' in response.headers['Vary']
+
+    def test_refused_encoding_is_not_used(self, client, catalog):
+        """Test q=0 rules an encoding out"""
+        response = _get(client, **{'Accept-Encoding': 'gzip;q=0, br;q=0'})
+        assert 'Content-Encoding' not in response.headers
+
+    def test_small_responses_are_left_alone(self, client):
+        """Test bodies under the threshold are not compressed"""
+        response = _get(client, '/api/health', **{'Accept-Encoding': 'gzip'})
+        assert 'Content-Encoding' not in response.headers
+
+    @pytest.mark.skipif(compression.brotli is None, reason='brotli not installed')
+    def test_brotli_preferred_when_accepted(self, client, catalog):
+        """Test brotli wins over gzip at equal quality"""
+        response = _get(client, **{'Accept-Encoding': 'gzip, br'})
+        assert response.headers['Content-Encoding'] == 'br'
+        assert json.loads(compression.brotli.decompress(response.data))['products']
+
+class TestCompressedVariants:
+    def test_catalog_variant_compressed_once(self, client, catalog, monkeypatch):
+        """Test identical cached payloads are not recompressed"""
+        calls = []
+        real_compress = compression.compress
+        monkeypatch.setattr(compression, 'compress',
+                            lambda *args: calls.append(args[1]) or real_compress(*args))
+
+        for _ in range(3):
+            response = _get(client, **{'Accept-Encoding': 'gzip'})
+            assert response.headers['Content-Encoding'] == 'gzip'
+
+        assert calls == ['gzip']
+
+    def test_variant_etag_revalidates(self, client, catalog):
+        """Test a compressed variant's ETag differs yet still yields 304"""
+        plain = _get(client)
+        response = _get(client, **{'Accept-Encoding': 'gzip'})
+        assert response.headers['ETag'] != plain.headers['ETag']
+
+        revalidated = _get(client, **{'Accept-Encoding': 'gzip',
+                                      'If-None-Match': response.headers['ETag']})
+        assert revalidated.status_code == 304
+        assert revalidated.headers['ETag'] == response.headers['ETag']
+        assert 'Accept-Encoding' in revalidated.headers['Vary']
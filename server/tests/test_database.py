@@ -0,0 +1,74 @@
+import pytest
+import os
+import tempfile
+from sqlalchemy import text
+from sqlalchemy.pool import QueuePool
+from app import create_app, db, prepare_database
+from models import Product
+from database import get_database_profile, get_sqlite_pragmas
+
+@pytest.fixture
+def production_app():
+    """An app using the production engine profile on a temporary file."""
+    workdir = tempfile.mkdtemp()
+    db_path = os.path.join(workdir, 'quickcart.db')
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'DATABASE_PROFILE': 'production',
+    })
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+class TestDatabaseProfiles:
+    def test_profile_follows_environment(self, monkeypatch):
+        """Test the profile is picked from DATABASE_PROFILE or FLASK_ENV"""
+        monkeypatch.delenv('DATABASE_PROFILE', raising=False)
+        monkeypatch.setenv('FLASK_ENV', 'production')
+        assert get_database_profile() == 'production'
+
+        monkeypatch.setenv('DATABASE_PROFILE', 'development')
+        assert get_database_profile() == 'development'
+
+    def test_production_pragmas_applied(self, production_app):
+        """Test new connections run in WAL mode with the tuned settings"""
+        expected = get_sqlite_pragmas('production')
+        with production_app.app_context():
+            assert isinstance(db.engine.pool, QueuePool)
+            with db.engine.connect() as conn:
+                pragma = lambda name: conn.execute(text(f'PRAGMA {name}')).scalar()
+                assert pragma('journal_mode') == 'wal'
+                assert pragma('synchronous') == 1  # NORMAL
+                assert pragma('temp_store') == 2  # MEMORY
+                assert pragma('busy_timeout') == expected['busy_timeout']
+                assert pragma('cache_size') == expected['cache_size']
+
+    def test_readers_not_blocked_by_open_write(self, production_app):
+        """Test a reader sees committed data while a write transaction is open"""
+        with production_app.app_context():
+            db.create_all()
+            with db.engine.begin() as conn:
+                conn.execute(text("INSERT INTO products (name, price, stock_quantity) VALUES ('A', 1, 5)"))
+
+            writer = db.engine.connect()
+            writer.begin()
+            writer.execute(text('UPDATE products SET stock_quantity = 0'))
+            try:
+                with db.engine.connect() as reader:
+                    assert reader.execute(text('SELECT stock_quantity FROM products')).scalar() == 5
+            finally:
+                writer.rollback()
+                writer.close()
+
+class TestStartup:
+    def test_prepare_database_is_idempotent(self, production_app):
+        """Test startup work can run again without reseeding"""
+        prepare_database(production_app)
+        with production_app.app_context():
+            seeded = Product.query.count()
+        assert seeded > 0
+
+        prepare_database(production_app)
+        with production_app.app_context():
+            assert Product.query.count() == seeded
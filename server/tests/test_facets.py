@@ -0,0 +1,103 @@
+import json
+import random
+from sqlalchemy import text
+from models import db, Product
+from facets import category_facets, rebuild_category_facets
+from inventory import adjust_stock
+from migrations import upgrade
+from app import PaymentProcessor
+
+def facet_counts():
+    return {f['name']: (f['product_count'], f['in_stock_count']) for f in category_facets()}
+
+class TestCategoryFacets:
+    def test_facets_built_from_existing_products(self, app, sample_products):
+        """Test create_all installs triggers that count the sample products"""
+        with app.app_context():
+            assert facet_counts() == {'electronics': (1, 1), 'home': (1, 1)}
+
+    def test_triggers_follow_every_write_path(self, app, sample_products):
+        """Test inserts, moves, stock changes and deletes keep counts exact"""
+        with app.app_context():
+            db.session.add(Product(name='Lamp', price=5, category='home', stock_quantity=0))
+            db.session.add(Product(name='Blank', price=5, category='', stock_quantity=3))
+            db.session.commit()
+            assert facet_counts() == {'electronics': (1, 1), 'home': (2, 1)}
+
+            adjust_stock(2, -5, 'sale')
+            db.session.commit()
+            assert facet_counts()['home'] == (2, 0)
+
+            product = db.session.get(Product, 1)
+            product.category = 'garden'
+            db.session.commit()
+            assert facet_counts() == {'garden': (1, 1), 'home': (2, 0)}
+
+            db.session.delete(product)
+            db.session.commit()
+            assert facet_counts() == {'home': (2, 0)}
+
+    def test_incremental_counts_match_rebuild(self, app):
+        """Test random edits leave the same counts as a full recount"""
+        rng = random.Random(7)
+        categories = ['a', 'b', 'c', None]
+        with app.app_context():
+            db.session.add_all(
+                Product(name=f'P{i}', price=1, category=rng.choice(categories),
+                        stock_quantity=rng.randint(0, 2))
+                for i in range(60)
+            )
+            db.session.commit()
+            for _ in range(200):
+                product = db.session.get(Product, rng.randint(1, 60))
+                if rng.random() < 0.5:
+                    product.category = rng.choice(categories)
+                else:
+                    product.stock_quantity = rng.randint(0, 2)
+                db.session.commit()
+
+            incremental = facet_counts()
+            rebuild_category_facets(db.session.connection())
+            assert facet_counts() == incremental
+
+    def test_migration_backfills_existing_database(self, app, sample_products):
+        """Test upgrading a database created before the facets table fills it"""
+        with app.app_context():
+            db.session.execute(text('DROP TABLE category_facets'))
+            for suffix in ('ai', 'ad', 'au'):
+                db.session.execute(text(f'DROP TRIGGER category_facets_{suffix}'))
+            db.session.commit()
+
+            upgrade(db.engine)
+            assert facet_counts() == {'electronics': (1, 1), 'home': (1, 1)}
+
+class TestCategoriesAPI:
+    def test_categories_with_counts(self, client, sample_products):
+        """Test counts are returned only when asked for"""
+        data = json.loads(client.get('/api/categories').data)
+        assert data == {'categories': ['electronics', 'home']}
+
+        data = json.loads(client.get('/api/categories?counts=1').data)
+        assert data['categories'] == ['electronics', 'home']
+        assert data['facets'][0] == {'name': 'electronics', 'product_count': 1, 'in_stock_count': 1}
+
+    def test_checkout_of_last_unit_updates_in_stock_count(self, client, sample_products, checkout,
+                                                          monkeypatch):
+        """Test a cached counts payload is refreshed when stock runs out"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        before = client.get('/api/categories?counts=1')
+        client.get('/api/categories')
+
+        assert checkout(client, quantity=5, product_id=2).status_code == 201
+
+        response = client.get('/api/categories?counts=1',
+                              headers={'If-None-Match': before.headers['ETag']})
+        assert response.status_code == 200
+        home = json.loads(response.data)['facets'][1]
+        assert home == {'name': 'home', 'product_count': 1, 'in_stock_count': 0}
+
+    def test_categories_read_facets_not_products(self, client, sample_products, query_counter):
+        """Test the category list never aggregates the products table"""
+        client.get('/api/categories?counts=1')
+        assert any('category_facets' in s for s in query_counter)
+        assert not any('FROM products' in s for s in query_counter)
@@ -0,0 +1,80 @@
+import pytest
+import json
+from models import Product, Order, CatalogState
+from app import db, PaymentProcessor
+
+class TestCatalogConditionalGet:
+    @pytest.mark.parametrize('url', ['/api/products', '/api/products/1', '/api/categories'])
+    def test_validators_and_304(self, client, sample_products, url):
+        """Test catalog responses carry validators and honour If-None-Match"""
+        response = client.get(url)
+        assert response.status_code == 200
+        etag = response.headers['ETag']
+        assert not etag.startswith('W/')
+        assert 'Last-Modified' in response.headers
+        assert 'Cache-Control' in response.headers
+
+        response = client.get(url, headers={'If-None-Match': etag})
+        assert response.status_code == 304
+        assert response.data == b''
+        assert response.headers['ETag'] == etag
+
+    def test_weak_if_none_match(self, client, sample_products):
+        """Test If-None-Match uses the weak comparison, so W/ tags match too"""
+        etag = client.get('/api/products/1').headers['ETag']
+        response = client.get('/api/products/1', headers={'If-None-Match': f'W/{etag}'})
+        assert response.status_code == 304
+
+    def test_if_modified_since(self, client, sample_products):
+        """Test Last-Modified revalidation"""
+        response = client.get('/api/products/1')
+        last_modified = response.headers['Last-Modified']
+
+        response = client.get('/api/products/1', headers={'If-Modified-Since': last_modified})
+        assert response.status_code == 304
+
+    def test_product_change_changes_etag(self, app, client, sample_products):
+        """Test catalog writes bump the version and invalidate ETags"""
+        etag = client.get('/api/products').headers['ETag']
+        with app.app_context():
+            version = CatalogState.current()[0]
+            db.session.get(Product, 2).stock_quantity = 1
+            db.session.commit()
+            assert CatalogState.current()[0] == version + 1
+
+        response = client.get('/api/products', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+        assert response.headers['ETag'] != etag
+
+    def test_listing_etag_depends_on_arguments(self, client, sample_products):
+        """Test different listings never share an ETag"""
+        etag = client.get('/api/products?category=home').headers['ETag']
+        response = client.get('/api/products?category=electronics', headers={'If-None-Match': etag})
+        assert response.status_code == 200
+
+    def test_cache_control_is_configurable(self, app, client, sample_products):
+        """Test Cache-Control comes from per-endpoint configuration"""
+        app.config['CACHE_CONTROL']['get_product'] = 'public, max-age=120'
+        assert client.get('/api/products/1').headers['Cache-Control'] == 'public, max-age=120'
+
+class TestOrderConditionalGet:
+    def test_order_etag_follows_status(self, app, client, sample_products, monkeypatch):
+        """Test order ETags change when the order status changes"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 1}]}),
+                               content_type='application/json')
+        order_number = json.loads(response.data)['order_number']
+
+        response = client.get(f'/api/orders/{order_number}')
+        etag = response.headers['ETag']
+        assert response.headers['Cache-Control'] == 'private, no-cache'
+        assert client.get(f'/api/orders/{order_number}',
+                          headers={'If-None-Match': etag}).status_code == 304
+
+        with app.app_context():
+            Order.query.filter_by(order_number=order_number).first().status = 'shipped'
+            db.session.commit()
+
+        assert client.get(f'/api/orders/{order_number}',
+                          headers={'If-None-Match': etag}).status_code == 200
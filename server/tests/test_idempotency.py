@@ -0,0 +1,188 @@
+import hashlib
+import json
+import threading
+import time
+import pytest
+from datetime import datetime, timedelta
+from models import db, Order, IdempotencyRecord
+from app import PaymentProcessor, PaymentResult
+from idempotency import purge_expired_keys
+
+@pytest.fixture
+def payments(monkeypatch):
+    """Count charges instead of calling the slow mock processor."""
+    calls = []
+
+    def pay(amount, method, details, reference=None):
+        calls.append(amount)
+        return PaymentResult(success=True, payment_id=f'pi_{len(calls)}', method=method)
+
+    monkeypatch.setattr(PaymentProcessor, 'process_payment', pay)
+    return calls
+
+def body_hash(body):
+    return hashlib.sha256(json.dumps(body).encode()).hexdigest()
+
+class TestIdempotentCheckout:
+    def test_retry_replays_without_charging_again(self, app, client, sample_products, payments,
+                                                  checkout, stock):
+        """Test a repeated key returns the stored response and touches nothing"""
+        first = checkout(client, key='order-1')
+        second = checkout(client, key='order-1')
+
+        assert first.status_code == second.status_code == 201
+        assert second.data == first.data
+        assert second.headers['Idempotent-Replayed'] == 'true'
+        assert 'Idempotent-Replayed' not in first.headers
+        assert len(payments) == 1
+        assert stock() == 8
+        with app.app_context():
+            assert Order.query.count() == 1
+
+    def test_requests_without_key_are_not_deduplicated(self, app, client, sample_products,
+                                                       payments, checkout, stock):
+        """Test checkout without the header behaves as before"""
+        checkout(client)
+        checkout(client)
+        assert len(payments) == 2
+        assert stock() == 6
+
+    def test_key_reused_for_different_body(self, client, sample_products, payments, checkout):
+        """Test a key cannot be replayed for a different cart"""
+        checkout(client, key='order-1')
+        response = checkout(client, key='order-1', product_id=2, quantity=1)
+        assert response.status_code == 422
+        assert len(payments) == 1
+
+    def test_client_errors_are_replayed(self, app, client, sample_products, payments, checkout):
+        """Test a stored 400 is returned again rather than re-run"""
+        assert checkout(client, key='order-1', quantity=50).status_code == 400
+
+        response = checkout(client, key='order-1', quantity=50)
+        assert response.status_code == 400
+        assert response.headers['Idempotent-Replayed'] == 'true'
+
+    def test_server_error_releases_key(self, app, client, sample_products, payments,
+                                       monkeypatch, checkout, stock):
+        """Test a failed attempt can be retried with the same key"""
+        def broken(amount, method, details, reference=None):
+            raise RuntimeError('gateway down')
+
+        with monkeypatch.context() as patch:
+            patch.setattr(PaymentProcessor, 'process_payment', broken)
+            assert checkout(client, key='order-1').status_code == 500
+
+        response = checkout(client, key='order-1')
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        assert stock() == 8
+
+    def test_keys_are_scoped_per_user(self, app, client, sample_products, payments,
+                                      auth_headers, checkout):
+        """Test the same key from different users runs both checkouts"""
+        checkout(client, key='order-1')
+        response = checkout(client, key='order-1', headers=auth_headers)
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        assert len(payments) == 2
+
+    def test_guest_keys_are_scoped_per_client(self, app, client, sample_products, payments,
+                                              checkout):
+        """Test guests at different addresses never share a key"""
+        checkout(client, key='order-1')
+        response = checkout(client, key='order-1', ip='10.0.0.2')
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        assert len(payments) == 2
+
+    def test_guest_keys_ignored_behind_untrusted_proxy(self, app, client, sample_products,
+                                                       payments, checkout):
+        """Test guests are only deduplicated once the proxy is trusted"""
+        forwarded = {'X-Forwarded-For': '203.0.113.7'}
+        checkout(client, key='order-1', headers=forwarded)
+        response = checkout(client, key='order-1', headers=forwarded)
+        assert response.status_code == 201
+        assert 'Idempotent-Replayed' not in response.headers
+        assert len(payments) == 2
+
+        app.config['RATE_LIMIT_PROXY_COUNT'] = 1
+        checkout(client, key='order-2', headers=forwarded)
+        response = checkout(client, key='order-2', headers=forwarded)
+        assert response.headers['Idempotent-Replayed'] == 'true'
+        assert len(payments) == 3
+
+    def test_concurrent_duplicate_waits_for_first(self, app, sample_products, monkeypatch,
+                                                  checkout, stock):
+        """Test a retry sent while the first request runs gets its response"""
+        started = threading.Event()
+        calls = []
+
+        def slow_pay(amount, method, details, reference=None):
+            calls.append(amount)
+            started.set()
+            time.sleep(0.3)
+            return PaymentResult(success=True, payment_id='pi_slow', method=method)
+
+        monkeypatch.setattr(PaymentProcessor, 'process_payment', slow_pay)
+        responses = {}
+
+        def first():
+            responses['first'] = checkout(app.test_client(), key='order-1')
+
+        thread = threading.Thread(target=first)
+        thread.start()
+        assert started.wait(5)
+        responses['second'] = checkout(app.test_client(), key='order-1')
+        thread.join()
+
+        assert responses['second'].status_code == 201
+        assert responses['second'].data == responses['first'].data
+        assert responses['second'].headers['Idempotent-Replayed'] == 'true'
+        assert len(calls) == 1
+        assert stock() == 8
+
+    def test_in_flight_conflict_after_wait(self, app, client, sample_products, payments, checkout,
+                                           checkout_body):
+        """Test a duplicate gives up with 409 if the first request never finishes"""
+        app.config['IDEMPOTENCY_WAIT_SECONDS'] = 0.1
+        with app.app_context():
+            db.session.add(IdempotencyRecord(
+                scope='checkout:anonymous:127.0.0.1', key='order-1',
+                request_hash=body_hash(checkout_body()),
+                expires_at=datetime.utcnow() + timedelta(minutes=1)
+            ))
+            db.session.commit()
+
+        response = checkout(client, key='order-1')
+        assert response.status_code == 409
+        assert response.headers['Retry-After'] == '1'
+        assert payments == []
+
+    def test_abandoned_claim_expires(self, app, client, sample_products, payments, checkout,
+                                     checkout_body):
+        """Test a claim left by a crashed worker stops blocking once expired"""
+        with app.app_context():
+            db.session.add(IdempotencyRecord(
+                scope='checkout:anonymous:127.0.0.1', key='order-1',
+                request_hash=body_hash(checkout_body()),
+                expires_at=datetime.utcnow() - timedelta(seconds=1)
+            ))
+            db.session.commit()
+
+        assert checkout(client, key='order-1').status_code == 201
+        assert len(payments) == 1
+
+    def test_purge_expired_keys(self, app, client, sample_products, payments, checkout):
+        """Test only expired records are purged"""
+        checkout(client, key='order-1')
+        with app.app_context():
+            assert purge_expired_keys() == 0
+            record = IdempotencyRecord.query.one()
+            record.expires_at = datetime.utcnow() - timedelta(seconds=1)
+            db.session.commit()
+            assert purge_expired_keys() == 1
+
+    def test_invalid_key(self, client, sample_products, payments, checkout):
+        """Test an over-long key is rejected"""
+        assert checkout(client, key='k' * 256).status_code == 400
+        assert payments == []
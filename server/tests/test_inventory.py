@@ -0,0 +1,85 @@
+import pytest
+import json
+import sqlite3
+from models import Product, InventoryMovement
+from app import db, PaymentProcessor
+from inventory import adjust_stock, audit_stock
+
+def _set_stock_externally(app, product_id, stock):
+    """Change stock from another connection, as a second worker would."""
+    conn = sqlite3.connect(app.config['DATABASE'])
+    conn.execute('UPDATE products SET stock_quantity = ? WHERE id = ?', (stock, product_id))
+    conn.commit()
+    conn.close()
+
+class TestAtomicStock:
+    def test_decrement_refuses_to_oversell(self, app, sample_products):
+        """Test a decrement larger than the stock changes nothing"""
+        with app.app_context():
+            assert adjust_stock(1, -11, 'reservation') is False
+            assert adjust_stock(1, -10, 'reservation') is True
+            db.session.commit()
+            assert db.session.get(Product, 1).stock_quantity == 0
+
+    def test_decrement_checks_database_not_loaded_object(self, app, sample_products):
+        """Test a stale in-memory stock value cannot cause an oversell"""
+        with app.app_context():
+            product = db.session.get(Product, 1)
+            assert product.stock_quantity == 10
+
+            _set_stock_externally(app, 1, 2)
+
+            assert adjust_stock(1, -6, 'reservation') is False
+            db.session.rollback()
+            assert db.session.get(Product, 1).stock_quantity == 2
+
+class TestInventoryLedger:
+    def test_checkout_movements_are_recorded(self, app, client, sample_products, monkeypatch):
+        """Test reservations are written to the ledger and balance stock"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 3}]}),
+                               content_type='application/json')
+        assert response.status_code == 201
+
+        with app.app_context():
+            movements = InventoryMovement.query.filter_by(product_id=1).order_by(InventoryMovement.id).all()
+            assert [(m.delta, m.reason) for m in movements] == [(10, 'initial'), (-3, 'reservation')]
+            assert movements[1].order_id is not None
+            assert audit_stock() == []
+
+    def test_orm_edits_are_recorded(self, app, sample_products):
+        """Test stock edits through the ORM record their delta"""
+        with app.app_context():
+            product = db.session.get(Product, 2)
+            db.session.expire(product)
+            product.stock_quantity = 8
+            db.session.commit()
+
+            movement = InventoryMovement.query.order_by(InventoryMovement.id.desc()).first()
+            assert (movement.product_id, movement.delta, movement.reason) == (2, 3, 'adjustment')
+
+    def test_audit_and_rebuild_commands(self, app, runner, sample_products):
+        """Test drift is reported and stock is rebuilt from the ledger"""
+        _set_stock_externally(app, 2, 99)
+
+        result = runner.invoke(args=['inventory', 'audit'])
+        assert 'Product 2: stock 99, ledger 5' in result.output
+
+        result = runner.invoke(args=['inventory', 'rebuild'])
+        assert 'Rebuilt stock for 1 products' in result.output
+        with app.app_context():
+            assert db.session.get(Product, 2).stock_quantity == 5
+            assert audit_stock() == []
+
+    def test_baseline_for_products_without_history(self, app, runner):
+        """Test products inserted outside the ORM get opening balances"""
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.execute("INSERT INTO products (name, price, stock_quantity) VALUES ('Legacy', 1.0, 7)")
+        conn.commit()
+        conn.close()
+
+        result = runner.invoke(args=['inventory', 'baseline'])
+        assert 'Recorded 1 opening balances' in result.output
+        with app.app_context():
+            assert audit_stock() == []
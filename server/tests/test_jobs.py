@@ -0,0 +1,208 @@
+import json
+import logging
+import time
+import pytest
+from datetime import datetime, timedelta
+import jobs
+from jobs import JobWorker, enqueue, job, job_counts, purge_finished_jobs, retry_delay, schedule_recurring
+from models import db, Job, Order, OrderItem, Product
+from app import PaymentProcessor
+
+@pytest.fixture
+def registry(monkeypatch):
+    """Register test job types without leaking them into other tests."""
+    monkeypatch.setattr(jobs, '_job_types', dict(jobs._job_types))
+    return jobs._job_types
+
+@pytest.fixture
+def worker(app):
+    return JobWorker(app)
+
+def add_job(app, job_type, payload=None, **columns):
+    with app.app_context():
+        new_job = enqueue(job_type, payload)
+        for name, value in columns.items():
+            setattr(new_job, name, value)
+        db.session.commit()
+        return new_job.id
+
+def load(app, job_id):
+    with app.app_context():
+        return db.session.get(Job, job_id)
+
+class TestJobQueue:
+    def test_enqueued_job_runs_once(self, app, registry, worker):
+        """Test a committed job is run with its payload and marked done"""
+        seen = []
+        job('record')(seen.append)
+
+        job_id = add_job(app, 'record', {'n': 1})
+        assert worker.run_pending() == 1
+        assert worker.run_pending() == 0
+
+        assert seen == [{'n': 1}]
+        stored = load(app, job_id)
+        assert stored.status == 'done'
+        assert stored.attempts == 1
+
+    def test_job_only_exists_if_transaction_commits(self, app, registry, worker):
+        """Test a rolled back request leaves no job behind"""
+        job('noop')(lambda payload: None)
+        with app.app_context():
+            enqueue('noop')
+            db.session.rollback()
+        assert worker.run_pending() == 0
+
+    def test_unknown_job_type(self, app):
+        """Test enqueueing a job nobody handles fails immediately"""
+        with app.app_context():
+            with pytest.raises(ValueError):
+                enqueue('no-such-job')
+
+    def test_failures_retry_with_backoff_then_fail(self, app, registry, worker):
+        """Test a failing job is rescheduled later until its attempts run out"""
+        @job('flaky', max_attempts=2)
+        def flaky(payload):
+            raise RuntimeError('boom')
+
+        job_id = add_job(app, 'flaky')
+        assert worker.run_pending() == 1
+
+        stored = load(app, job_id)
+        assert stored.status == 'queued'
+        assert stored.last_error == 'RuntimeError: boom'
+        assert stored.run_at > datetime.utcnow()
+
+        # Due again: the second failure is final
+        with app.app_context():
+            db.session.get(Job, job_id).run_at = datetime.utcnow()
+            db.session.commit()
+        assert worker.run_pending() == 1
+        stored = load(app, job_id)
+        assert stored.status == 'failed'
+        assert stored.attempts == 2
+
+    def test_retry_delay_grows_and_is_capped(self):
+        """Test backoff doubles per attempt within the jitter and the cap"""
+        assert 5 <= retry_delay(2, 5, 3600) <= 10
+        assert 40 <= retry_delay(5, 5, 3600) <= 80
+        assert retry_delay(30, 5, 3600) <= 3600
+
+    def test_expired_lock_is_reclaimed(self, app, registry, worker):
+        """Test a job whose worker vanished runs again after the visibility timeout"""
+        seen = []
+        job('record')(seen.append)
+        past = datetime.utcnow() - timedelta(seconds=1)
+        job_id = add_job(app, 'record', status='running', attempts=1, locked_until=past,
+                         lock_token='lost-worker')
+
+        assert worker.run_pending() == 1
+        assert seen == [{}]
+        assert load(app, job_id).attempts == 2
+
+    def test_stale_worker_cannot_finish_reclaimed_job(self, app, registry, worker):
+        """Test completion is ignored once the lock passed to another worker"""
+        job('noop')(lambda payload: None)
+        job_id = add_job(app, 'noop', status='running', lock_token='new-owner',
+                         locked_until=datetime.utcnow() + timedelta(minutes=1))
+        with app.app_context():
+            worker._finish(job_id, 'old-owner', 'done')
+        assert load(app, job_id).status == 'running'
+
+    def test_concurrency_limit_per_type(self, app, registry, worker):
+        """Test a type at its limit is skipped while other types still run"""
+        seen = []
+        job('exclusive', concurrency=1)(lambda payload: seen.append('exclusive'))
+        job('other')(lambda payload: seen.append('other'))
+
+        add_job(app, 'exclusive', status='running', lock_token='busy',
+                locked_until=datetime.utcnow() + timedelta(minutes=1))
+        add_job(app, 'exclusive')
+        add_job(app, 'other')
+
+        assert worker.run_pending() == 1
+        assert seen == ['other']
+
+    def test_worker_threads(self, app, registry):
+        """Test started workers pick up jobs enqueued later"""
+        seen = []
+        job('record')(seen.append)
+        worker = JobWorker(app, threads=2, poll_interval=0.05)
+        worker.start()
+        try:
+            for n in range(5):
+                add_job(app, 'record', {'n': n})
+            deadline = time.monotonic() + 5
+            while len(seen) < 5 and time.monotonic() < deadline:
+                time.sleep(0.05)
+        finally:
+            worker.stop()
+        assert sorted(item['n'] for item in seen) == list(range(5))
+
+    def test_status_and_purge(self, app, registry, worker, runner):
+        """Test job counts and purging of old finished jobs"""
+        job('noop')(lambda payload: None)
+        add_job(app, 'noop')
+        worker.run_pending()
+        add_job(app, 'noop')
+
+        with app.app_context():
+            assert job_counts() == {'noop': {'done': 1, 'queued': 1}}
+            assert purge_finished_jobs(timedelta(days=1)) == 0
+            assert purge_finished_jobs(timedelta(seconds=-1)) == 1
+
+        result = runner.invoke(args=['jobs', 'status'])
+        assert 'noop: queued 1' in result.output
+
+    def test_recurring_job_is_queued_once(self, app, registry, worker):
+        """Test a recurring type is queued for its next run, never twice"""
+        job('tick', every=60)(lambda payload: None)
+        with app.app_context():
+            schedule_recurring()
+            assert schedule_recurring() == 0
+            queued = Job.query.filter_by(job_type='tick').one()
+            assert queued.run_at > datetime.utcnow() + timedelta(seconds=50)
+
+            # Due and run: the next run is scheduled again
+            queued.run_at = datetime.utcnow()
+            db.session.commit()
+        assert worker.run_pending() == 1
+        with app.app_context():
+            assert schedule_recurring() == 1
+
+    def test_stale_reservations_are_swept(self, app, sample_products):
+        """Test the recurring sweep releases abandoned checkouts"""
+        with app.app_context():
+            product = db.session.get(Product, 1)
+            product.stock_quantity -= 3
+            order = Order(total_amount=89.97, status='pending', payment_method='stripe',
+                          created_at=datetime.utcnow() - timedelta(hours=1))
+            order.items.append(OrderItem(product_id=1, quantity=3, price=29.99))
+            db.session.add(order)
+            db.session.commit()
+
+            jobs._job_types['release_stale_reservations'].handler({})
+            assert db.session.get(Product, 1).stock_quantity == 10
+            assert job_counts() == {'void_payment': {'queued': 1}}
+
+class TestCheckoutJobs:
+    def test_checkout_defers_confirmation(self, app, client, sample_products, monkeypatch, caplog):
+        """Test checkout only queues its follow-up work, which runs later"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        monkeypatch.setattr('app.time.sleep', lambda seconds: None)
+        response = client.post('/api/checkout', data=json.dumps({
+            'items': [{'product_id': 2, 'quantity': 3}]
+        }), content_type='application/json')
+        assert response.status_code == 201
+
+        with app.app_context():
+            assert job_counts() == {'order_confirmation': {'queued': 1}}
+
+        with caplog.at_level(logging.INFO):
+            assert JobWorker(app).run_pending() == 2
+
+        order_number = json.loads(response.data)['order_number']
+        assert any(order_number in message for message in caplog.messages)
+        assert any('Low stock: product 2' in message for message in caplog.messages)
+        with app.app_context():
+            assert job_counts() == {'order_confirmation': {'done': 1}, 'low_stock_check': {'done': 1}}
@@ -0,0 +1,85 @@
+import pytest
+import json
+import os
+from app import PaymentProcessor
+from metrics import (MetricsRegistry, MetricsStore, RequestTimings, render_prometheus,
+                     retire_worker_metrics)
+
+class TestServerTiming:
+    def test_header_reports_sql_and_serialization(self, client, sample_products):
+        """Test responses carry per-phase timings"""
+        response = client.get('/api/products')
+        header = response.headers['Server-Timing']
+
+        assert header.startswith('db;dur=')
+        assert 'queries"' in header
+        assert 'serialize;dur=' in header
+        assert 'total;dur=' in header
+
+    def test_checkout_reports_payment_time(self, client, sample_products, monkeypatch):
+        """Test time in the payment processor is broken out"""
+        monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+        response = client.post('/api/checkout',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 1}]}),
+                               content_type='application/json')
+        assert response.status_code == 201
+        assert 'payment;dur=' in response.headers['Server-Timing']
+
+class TestMetricsEndpoint:
+    def test_prometheus_histogram_per_endpoint(self, client, sample_products):
+        """Test requests are aggregated into per-endpoint histograms"""
+        client.get('/api/products')
+        client.get('/api/products/1')
+        client.get('/api/products/999')
+
+        response = client.get('/api/metrics')
+        body = response.data.decode()
+
+        assert response.mimetype == 'text/plain'
+        assert 'quickcart_http_requests_total{method="GET",endpoint="get_product",status="404"} 1' in body
+        assert 'quickcart_http_request_duration_seconds_bucket{method="GET",endpoint="get_products",le="+Inf"} 1' in body
+        assert 'quickcart_http_request_duration_seconds_count{method="GET",endpoint="get_products"} 1' in body
+        assert 'quickcart_request_phase_seconds_total{endpoint="get_products",phase="db"}' in body
+
+    def test_workers_are_merged_through_metrics_dir(self, tmp_path):
+        """Test a scrape sees requests handled by other worker processes"""
+        other = MetricsStore(str(tmp_path), flush_interval=0)
+        other.registry.observe('GET', 'get_products', 200, 0.02, RequestTimings())
+        other.flush()
+
+        os.rename(tmp_path / f'metrics-{os.getpid()}.json', tmp_path / 'metrics-1.json')
+
+        store = MetricsStore(str(tmp_path), flush_interval=0)
+        store.registry.observe('GET', 'get_products', 200, 0.2, RequestTimings())
+
+        body = render_prometheus(store.collect())
+        assert 'quickcart_http_request_duration_seconds_count{method="GET",endpoint="get_products"} 2' in body
+        assert 'quickcart_http_request_duration_seconds_bucket{method="GET",endpoint="get_products",le="0.025"} 1' in body
+
+    def test_exited_workers_are_folded_into_one_file(self, tmp_path):
+        """Test retired workers' counts survive in a single cumulative snapshot"""
+        for pid in (1, 2):
+            worker = MetricsStore(str(tmp_path), flush_interval=0)
+            worker.registry.observe('GET', 'get_products', 200, 0.02, RequestTimings())
+            worker.flush()
+            os.rename(tmp_path / f'metrics-{os.getpid()}.json', tmp_path / f'metrics-{pid}.json')
+
+        store = MetricsStore(str(tmp_path), flush_interval=0)
+        read_before_exit = store.collect()
+        retire_worker_metrics(str(tmp_path), 1)
+        retire_worker_metrics(str(tmp_path), 2)
+
+        assert set(os.listdir(tmp_path)) == {'metrics-retired.json', f'metrics-{os.getpid()}.json'}
+        assert store.collect()['requests'] == read_before_exit['requests'] == [
+            ['GET', 'get_products', '200', 2]]
+
+    def test_histogram_buckets_are_cumulative(self):
+        """Test bucket counts include every faster request"""
+        registry = MetricsRegistry(buckets=(0.1, 1.0))
+        for duration in (0.05, 0.5, 5.0):
+            registry.observe('GET', 'health_check', 200, duration, RequestTimings())
+
+        body = render_prometheus(registry.snapshot())
+        assert 'le="0.1"} 1' in body
+        assert 'le="1.0"} 2' in body
+        assert 'le="+Inf"} 3' in body
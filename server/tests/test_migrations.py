@@ -0,0 +1,151 @@
+import pytest
+from datetime import datetime, timedelta
+from sqlalchemy import text
+from models import db, Product, User, Order, OrderItem
+from migrations import MIGRATIONS, upgrade, pending_migrations
+from query_inspection import QueryRecorder
+
+INDEXES = [
+    'ix_products_category_id',
+    'ix_orders_user_id_created_at',
+    'ix_orders_status_created_at',
+    'ix_order_items_order_id',
+    'ix_order_items_product_id',
+]
+
+def index_names():
+    return set(db.session.execute(
+        text("SELECT name FROM sqlite_master WHERE type = 'index'")
+    ).scalars())
+
+def query_plan(sql, **params):
+    rows = db.session.execute(text(f'EXPLAIN QUERY PLAN {sql}'), params)
+    return ' | '.join(row.detail for row in rows)
+
+@pytest.fixture
+def populated(app):
+    """Enough rows that the planner prefers indexes to scans."""
+    with app.app_context():
+        db.session.add_all(
+            Product(name=f'P{i}', price=1, category=f'C{i % 20}', stock_quantity=5)
+            for i in range(200)
+        )
+        users = [User(email=f'u{i}@example.com') for i in range(20)]
+        db.session.add_all(users)
+        db.session.flush()
+
+        start = datetime(2024, 1, 1)
+        for i in range(400):
+            order = Order(user_id=users[i % 20].id, total_amount=1,
+                          status='confirmed', created_at=start + timedelta(hours=i))
+            order.items.append(OrderItem(product_id=i % 200 + 1, quantity=1, price=1))
+            db.session.add(order)
+        db.session.commit()
+        db.session.execute(text('ANALYZE'))
+    return app
+
+class TestMigrations:
+    def test_fresh_database_needs_no_migration_work(self, app):
+        """Test create_all builds the indexes and upgrade only records versions"""
+        with app.app_context():
+            assert set(INDEXES) <= index_names()
+            applied = upgrade(db.engine)
+            assert [m.version for m in applied] == [m.version for m in MIGRATIONS]
+            assert pending_migrations(db.engine) == []
+            assert upgrade(db.engine) == []
+
+    def test_upgrade_adds_indexes_to_existing_database(self, app):
+        """Test a database created before the indexes gets them from the migration"""
+        with app.app_context():
+            for name in INDEXES:
+                db.session.execute(text(f'DROP INDEX {name}'))
+            db.session.commit()
+            assert not set(INDEXES) & index_names()
+
+            upgrade(db.engine)
+            assert set(INDEXES) <= index_names()
+
+    def test_schema_cli(self, runner):
+        """Test schema status and upgrade commands"""
+        result = runner.invoke(args=['schema', 'status'])
+        assert f'{len(MIGRATIONS)} migrations pending' in result.output
+
+        result = runner.invoke(args=['schema', 'upgrade'])
+        assert f'Applied {MIGRATIONS[0].version}' in result.output
+
+        result = runner.invoke(args=['schema', 'status'])
+        assert '0 migrations pending' in result.output
+
+class TestQueryPlans:
+    def test_category_filter_uses_index(self, populated):
+        """Test category pages seek the index in id order without sorting"""
+        with populated.app_context():
+            plan = query_plan(
+                'SELECT * FROM products WHERE category = :c AND id > :after ORDER BY id LIMIT 20',
+                c='C3', after=0
+            )
+            assert 'ix_products_category_id' in plan
+            assert 'TEMP B-TREE' not in plan
+
+    def test_distinct_categories_use_covering_index(self, populated):
+        """Test listing categories reads only the index"""
+        with populated.app_context():
+            plan = query_plan('SELECT DISTINCT category FROM products')
+            assert 'COVERING INDEX ix_products_category_id' in plan
+            assert 'TEMP B-TREE' not in plan
+
+    def test_order_history_uses_index(self, populated):
+        """Test a user's newest-first order page avoids a scan and a sort"""
+        with populated.app_context():
+            plan = query_plan(
+                'SELECT * FROM orders WHERE user_id = :u AND (created_at, id) < (:created, :id) '
+                'ORDER BY created_at DESC, id DESC LIMIT 21',
+                u=1, created='2024-02-01 00:00:00', id=1000
+            )
+            assert 'ix_orders_user_id_created_at' in plan
+            assert 'TEMP B-TREE' not in plan
+
+    def test_order_items_lookups_use_indexes(self, populated):
+        """Test items are found by order and by product without scanning"""
+        with populated.app_context():
+            plan = query_plan('SELECT * FROM order_items WHERE order_id IN (1, 2, 3)')
+            assert 'ix_order_items_order_id' in plan
+
+            plan = query_plan('SELECT * FROM order_items WHERE product_id = :p', p=7)
+            assert 'ix_order_items_product_id' in plan
+
+    def test_stale_reservation_sweep_uses_index(self, populated):
+        """Test the pending-order sweep seeks by status"""
+        with populated.app_context():
+            plan = query_plan(
+                'SELECT id FROM orders WHERE status = :s AND created_at < :cutoff',
+                s='pending', cutoff='2024-01-02 00:00:00'
+            )
+            assert 'ix_orders_status_created_at' in plan
+
+    def test_endpoint_queries_avoid_table_scans(self, populated, client, auth_headers):
+        """Test the statements behind the hot endpoints never scan a whole table"""
+        with populated.app_context():
+            user = User.query.filter_by(email='test@example.com').one()
+            for i in range(5):
+                order = Order(user_id=user.id, total_amount=1, status='confirmed')
+                order.items.append(OrderItem(product_id=i + 1, quantity=1, price=1))
+                db.session.add(order)
+            db.session.commit()
+            engine = db.engine
+
+        with QueryRecorder(engine) as recorder:
+            assert client.get('/api/products?category=C3&after=').status_code == 200
+            assert client.get('/api/orders?limit=2', headers=auth_headers).status_code == 200
+
+        with populated.app_context():
+            connection = db.session.connection()
+            for query in recorder.queries:
+                if not query.statement.lstrip().upper().startswith('SELECT'):
+                    continue
+                plan = ' | '.join(row.detail for row in connection.exec_driver_sql(
+                    f'EXPLAIN QUERY PLAN {query.statement}', query.parameters
+                ))
+                for table in ('products', 'orders', 'order_items'):
+                    assert f'SCAN {table}' not in plan.replace(f'SCAN {table} USING', ''), \
+                        f'{query.statement}: {plan}'
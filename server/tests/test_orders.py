@@ -0,0 +1,87 @@
+import pytest
+import json
+from datetime import datetime, timedelta
+from models import Order, OrderItem
+from app import db
+from pagination import encode_cursor
+
+def _create_orders(app, user_id, count):
+    """Create ``count`` orders with two items each, one minute apart."""
+    with app.app_context():
+        start = datetime(2024, 1, 1)
+        for i in range(count):
+            order = Order(user_id=user_id, total_amount=79.98, status='confirmed',
+                          created_at=start + timedelta(minutes=i))
+            order.items.append(OrderItem(product_id=1, quantity=1, price=29.99))
+            order.items.append(OrderItem(product_id=2, quantity=1, price=49.99))
+            db.session.add(order)
+        db.session.commit()
+
+class TestOrderHistory:
+    def test_profile_query_count_is_constant(self, app, client, test_user, auth_headers,
+                                             sample_products, query_counter):
+        """Test profile cost does not grow with the number of orders"""
+        _create_orders(app, test_user['id'], 1)
+        client.get('/api/auth/me', headers=auth_headers)
+        query_counter.clear()
+        client.get('/api/user/profile', headers=auth_headers)
+        single = len(query_counter)
+
+        _create_orders(app, test_user['id'], 9)
+        query_counter.clear()
+        response = client.get('/api/user/profile', headers=auth_headers)
+
+        data = json.loads(response.data)
+        assert len(data['orders']) == 10
+        assert data['orders'][0]['items'][0]['product_name'] == 'Test Product 1'
+        assert len(query_counter) == single
+
+    def test_history_pages_newest_first(self, app, client, test_user, auth_headers, sample_products):
+        """Test cursor pages walk every order from newest to oldest"""
+        _create_orders(app, test_user['id'], 5)
+
+        data = json.loads(client.get('/api/orders?limit=2', headers=auth_headers).data)
+        seen = [order['id'] for order in data['orders']]
+        while data['has_more']:
+            data = json.loads(client.get(f"/api/orders?limit=2&after={data['next_cursor']}",
+                                         headers=auth_headers).data)
+            seen.extend(order['id'] for order in data['orders'])
+
+        assert seen == [5, 4, 3, 2, 1]
+
+    def test_profile_returns_first_page_and_cursor(self, app, client, test_user, auth_headers,
+                                                   sample_products):
+        """Test the profile embeds the first page of history"""
+        _create_orders(app, test_user['id'], 3)
+
+        data = json.loads(client.get('/api/user/profile?limit=2', headers=auth_headers).data)
+        assert [order['id'] for order in data['orders']] == [3, 2]
+        assert data['orders_next_cursor'] is not None
+
+    def test_history_only_shows_own_orders(self, app, client, auth_headers, sample_products):
+        """Test other users' orders are never listed"""
+        _create_orders(app, None, 2)
+        data = json.loads(client.get('/api/orders', headers=auth_headers).data)
+        assert data['orders'] == []
+
+    def test_history_rejects_malformed_cursor(self, client, auth_headers):
+        """Test cursors holding non-scalar or wrongly typed keys are a 400"""
+        for values in (['2024-01-01T00:00:00', [1]], ['2024-01-01T00:00:00', '1'],
+                       ['2024-01-01T00:00:00', 1.5]):
+            response = client.get(f'/api/orders?after={encode_cursor(values)}', headers=auth_headers)
+            assert response.status_code == 400
+
+    def test_history_requires_auth(self, client):
+        """Test the history endpoint is protected"""
+        assert client.get('/api/orders').status_code == 401
+
+    def test_order_detail_loads_items_in_one_query(self, app, client, sample_products, query_counter):
+        """Test order detail loads items and products together"""
+        _create_orders(app, None, 1)
+        with app.app_context():
+            order_number = Order.query.first().order_number
+
+        query_counter.clear()
+        data = json.loads(client.get(f'/api/orders/{order_number}').data)
+        assert [item['product_name'] for item in data['items']] == ['Test Product 1', 'Test Product 2']
+        assert len(query_counter) == 2
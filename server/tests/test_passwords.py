@@ -0,0 +1,66 @@
+import pytest
+import json
+from werkzeug.exceptions import ServiceUnavailable
+from models import User
+from app import db
+from passwords import PasswordHasher
+
+class TestPasswordHasher:
+    def test_pool_hashes_and_verifies(self):
+        """Test hashing in worker processes round-trips"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', workers=1)
+        try:
+            password_hash = hasher.hash('secret')
+            assert password_hash.startswith('pbkdf2:sha256:1000$')
+            assert hasher.verify(password_hash, 'secret')
+            assert not hasher.verify(password_hash, 'wrong')
+        finally:
+            hasher.shutdown()
+
+    def test_full_queue_is_rejected(self):
+        """Test callers beyond max_pending are turned away immediately"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000', max_pending=1)
+        hasher._slots.acquire()
+        with pytest.raises(ServiceUnavailable) as excinfo:
+            hasher.hash('secret')
+        assert excinfo.value.retry_after == 1
+
+    def test_needs_rehash_compares_method_and_cost(self):
+        """Test only hashes made with other settings are flagged"""
+        hasher = PasswordHasher(method='pbkdf2:sha256:1000')
+        assert not hasher.needs_rehash(hasher.hash('secret'))
+        assert hasher.needs_rehash(PasswordHasher(method='pbkdf2:sha256:2000').hash('secret'))
+
+    @pytest.mark.parametrize('method', ['pbkdf2', 'scrypt'])
+    def test_needs_rehash_accepts_short_method_names(self, method):
+        """Test a method stored under its expanded name is not flagged"""
+        hasher = PasswordHasher(method=method)
+        assert not hasher.needs_rehash(hasher.hash('secret'))
+
+class TestLoginHashing:
+    def _login(self, client):
+        return client.post('/api/auth/login',
+                           data=json.dumps({'email': 'test@example.com', 'password': 'password123'}),
+                           content_type='application/json')
+
+    def test_login_upgrades_hash_when_cost_changes(self, app, client, test_user):
+        """Test stored hashes move to the configured cost on login"""
+        app.extensions['password_hasher'].method = 'pbkdf2:sha256:2000'
+
+        assert self._login(client).status_code == 200
+
+        with app.app_context():
+            user = db.session.get(User, test_user['id'])
+            assert user.password_hash.startswith('pbkdf2:sha256:2000$')
+        assert self._login(client).status_code == 200
+
+    def test_login_sheds_load_with_retry_after(self, app, client, test_user):
+        """Test a saturated hasher answers 503 instead of queueing"""
+        app.extensions['password_hasher'] = PasswordHasher(method='pbkdf2:sha256:1000', max_pending=1)
+        app.extensions['password_hasher']._slots.acquire()
+
+        response = self._login(client)
+
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert 'retry' in json.loads(response.data)['error']
@@ -0,0 +1,173 @@
+import json
+import threading
+import time
+import pytest
+from datetime import datetime
+from werkzeug.exceptions import ServiceUnavailable
+from models import db, Order, Job
+from app import PaymentProcessor
+from payments import HTTPGatewayClient, init_payment_gateways
+from mock_gateway import start_mock_gateway
+from jobs import JobWorker
+
+@pytest.fixture
+def gateway():
+    server = start_mock_gateway(latency=0, failure_rate=0)
+    yield server
+    server.shutdown()
+    server.server_close()
+
+@pytest.fixture
+def gateway_app(app, gateway):
+    """The test app charging through the mock gateway."""
+    app.config['PAYMENT_GATEWAYS'] = {'default': {'url': gateway.url, 'timeout': 1}}
+    init_payment_gateways(app)
+    return app
+
+class TestGatewayCheckout:
+    def test_checkout_charges_through_gateway(self, gateway_app, client, gateway,
+                                              sample_products, checkout):
+        """Test the charge reaches the gateway in cents, keyed by order"""
+        response = checkout(client)
+        assert response.status_code == 201
+        data = json.loads(response.data)
+        assert data['payment_id'].startswith('ch_')
+
+        charge = gateway.charges[f"charge-{data['order_number']}"]
+        assert charge['amount'] == 5998
+
+    def test_connections_are_kept_alive(self, gateway_app, client, gateway, sample_products,
+                                        checkout):
+        """Test consecutive checkouts reuse one gateway connection"""
+        for _ in range(4):
+            assert checkout(client, quantity=1).status_code == 201
+        assert gateway.connections == 1
+
+    def test_declined_charge_releases_stock(self, gateway_app, client, gateway,
+                                            sample_products, checkout, stock):
+        """Test a decline fails checkout and returns the reserved stock"""
+        gateway.failure_rate = 1
+        response = checkout(client)
+        assert response.status_code == 400
+        assert 'declined' in json.loads(response.data)['error']
+        assert stock() == 10
+
+    def test_timeout_releases_stock_and_voids_charge(self, gateway_app, client, gateway,
+                                                     sample_products, checkout, stock):
+        """Test an unanswered charge is given up on and cancelled in the background"""
+        gateway_app.config['PAYMENT_GATEWAYS']['default']['timeout'] = 0.1
+        init_payment_gateways(gateway_app)
+        gateway.latency = 0.3
+
+        response = checkout(client)
+        assert response.status_code == 503
+        assert response.headers['Retry-After'] == '1'
+        assert stock() == 10
+        with gateway_app.app_context():
+            order = Order.query.one()
+            assert order.status == 'payment_failed'
+
+        # The gateway completes the charge after the client gave up on it
+        time.sleep(0.4)
+        gateway.latency = 0
+        assert JobWorker(gateway_app).run_pending() == 1
+        assert gateway.charges[f'charge-{order.order_number}']['status'] == 'voided'
+
+    def test_unreadable_reply_voids_charge(self, gateway_app, client, gateway, sample_products,
+                                           monkeypatch, checkout, stock):
+        """Test a charge whose reply could not be read is cancelled in the background"""
+        charge = HTTPGatewayClient.charge
+
+        def unreadable(self, *args, **kwargs):
+            charge(self, *args, **kwargs)
+            raise ValueError('Malformed gateway response')
+
+        monkeypatch.setattr(HTTPGatewayClient, 'charge', unreadable)
+        response = checkout(client)
+        assert response.status_code == 500
+        assert stock() == 10
+
+        with gateway_app.app_context():
+            order = Order.query.one()
+        assert JobWorker(gateway_app).run_pending() == 1
+        assert gateway.charges[f'charge-{order.order_number}']['status'] == 'voided'
+
+    def test_expired_reservation_is_refunded_in_background(self, gateway_app, client, gateway,
+                                                           sample_products, monkeypatch, checkout):
+        """Test a charge for an order that expired mid-payment is refunded until it succeeds"""
+        charge = PaymentProcessor.process_payment
+
+        def charge_then_expire(*args, **kwargs):
+            result = charge(*args, **kwargs)
+            with db.engine.begin() as connection:
+                connection.execute(db.update(Order).values(status='expired'))
+            return result
+
+        monkeypatch.setattr(PaymentProcessor, 'process_payment', charge_then_expire)
+        response = checkout(client)
+        assert response.status_code == 409
+
+        # The gateway is down: the refund job fails and is retried later
+        gateway.refund = lambda key, body: (503, {'error': 'Gateway unavailable'})
+        assert JobWorker(gateway_app).run_pending() == 1
+        with gateway_app.app_context():
+            refund = Job.query.filter_by(job_type='refund_payment').one()
+            assert refund.status == 'queued'
+            assert 'Gateway unavailable' in refund.last_error
+            refund.run_at = datetime.utcnow()
+            db.session.commit()
+
+        del gateway.refund
+        assert JobWorker(gateway_app).run_pending() == 1
+        assert [c['status'] for c in gateway.charges.values()] == ['refunded']
+
+class TestGatewayClient:
+    def test_retried_charge_is_not_duplicated(self, gateway):
+        """Test the same reference returns the original charge"""
+        client = HTTPGatewayClient('mock', gateway.url)
+        first = client.charge(10.0, 'stripe', {}, reference='order-1')
+        second = client.charge(10.0, 'stripe', {}, reference='order-1')
+        assert first.success and first.payment_id == second.payment_id
+        assert len(gateway.charges) == 1
+
+    def test_many_payments_in_flight(self, gateway):
+        """Test concurrent charges overlap instead of queueing behind each other"""
+        gateway.latency = 0.2
+        client = HTTPGatewayClient('mock', gateway.url, max_connections=16)
+        results = []
+
+        def charge(n):
+            results.append(client.charge(1.0, 'stripe', {}, reference=f'order-{n}'))
+
+        started = time.monotonic()
+        threads = [threading.Thread(target=charge, args=(n,)) for n in range(16)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert all(result.success for result in results) and len(results) == 16
+        assert gateway.max_in_flight > 4
+        assert time.monotonic() - started < 16 * 0.2 / 2
+
+    def test_in_flight_limit(self, gateway):
+        """Test callers beyond the connection limit wait, then get a 503"""
+        gateway.latency = 0.3
+        client = HTTPGatewayClient('mock', gateway.url, max_connections=2, acquire_timeout=0.05)
+        outcomes = []
+
+        def charge(n):
+            try:
+                outcomes.append(client.charge(1.0, 'stripe', {}, reference=f'order-{n}').success)
+            except ServiceUnavailable:
+                outcomes.append('busy')
+
+        threads = [threading.Thread(target=charge, args=(n,)) for n in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert gateway.max_in_flight == 2
+        assert outcomes.count(True) == 2
+        assert outcomes.count('busy') == 3
@@ -0,0 +1,63 @@
+import pytest
+import logging
+from sqlalchemy import text
+from models import db, Product
+from app import create_app
+from query_inspection import QueryRecorder, find_repeated
+
+class TestRepeatedStatements:
+    def test_only_repeated_selects_are_reported(self):
+        """Test N+1 detection ignores writes and one-off reads"""
+        statements = ['SELECT * FROM products WHERE id = ?'] * 3 + \
+                     ['UPDATE products SET stock_quantity = ?'] * 3 + \
+                     ['SELECT * FROM users WHERE id = ?']
+
+        assert find_repeated(statements, 3) == [('SELECT * FROM products WHERE id = ?', 3)]
+
+    def test_recorder_fails_on_n_plus_one(self, app, sample_products):
+        """Test a per-row query loop fails the budget even under the count"""
+        with app.app_context():
+            with pytest.raises(AssertionError, match='Possible N\\+1'):
+                with QueryRecorder(db.engine) as recorder:
+                    for product_id in (1, 2, 1):
+                        db.session.get(Product, product_id)
+                        db.session.expire_all()
+                recorder.assert_within(10)
+
+    def test_recorder_lists_statements_over_budget(self, app, sample_products):
+        """Test a failed budget shows what was executed"""
+        with app.app_context():
+            with QueryRecorder(db.engine) as recorder:
+                db.session.execute(text('SELECT 1'))
+                db.session.execute(text('SELECT 2'))
+            with pytest.raises(AssertionError, match='at most 1 queries, got 2') as excinfo:
+                recorder.assert_within(1)
+        assert 'SELECT 2' in str(excinfo.value)
+
+class TestRequestInspection:
+    def test_n_plus_one_in_route_is_logged(self, app, client, sample_products, caplog):
+        """Test a route loading rows one by one is flagged"""
+        @app.route('/test/n-plus-one')
+        def n_plus_one():
+            for _ in range(app.config['N_PLUS_ONE_THRESHOLD']):
+                db.session.execute(text('SELECT name FROM products WHERE id = :id'), {'id': 1})
+            return 'ok'
+
+        with caplog.at_level(logging.WARNING, logger='query_inspection'):
+            client.get('/test/n-plus-one')
+
+        assert 'Possible N+1 in GET n_plus_one' in caplog.text
+
+    def test_slow_queries_are_logged_with_parameters(self, app, client, sample_products, caplog):
+        """Test statements over the threshold are logged"""
+        slow_app = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+            'SLOW_QUERY_MS': 0,
+        })
+
+        with caplog.at_level(logging.WARNING, logger='query_inspection'):
+            slow_app.test_client().get('/api/products/2')
+
+        assert 'Slow query' in caplog.text
+        assert 'parameters=(2,' in caplog.text
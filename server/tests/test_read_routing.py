@@ -0,0 +1,168 @@
+import json
+import os
+import shutil
+import tempfile
+import threading
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.exc import OperationalError
+from app import create_app, PaymentProcessor
+from auth import generate_token
+from models import db, Product, User
+from read_routing import PRIMARY_UNTIL_COOKIE, get_read_engine
+
+def make_app(db_path, **config):
+    app = create_app({
+        'TESTING': True,
+        'SQLALCHEMY_DATABASE_URI': f'sqlite:///{db_path}',
+        'PASSWORD_HASH_METHOD': 'pbkdf2:sha256:1000',
+        'PASSWORD_HASH_WORKERS': 0,
+        'DATABASE_READ_ROUTING': True,
+        **config,
+    })
+    with app.app_context():
+        db.create_all()
+        db.session.add_all([
+            Product(name='Test Product 1', price=29.99, category='electronics', stock_quantity=10),
+            Product(name='Test Product 2', price=49.99, category='home', stock_quantity=5),
+        ])
+        db.session.commit()
+    return app
+
+@pytest.fixture
+def db_path():
+    directory = tempfile.mkdtemp()
+    yield os.path.join(directory, 'primary.db')
+    shutil.rmtree(directory)
+
+@pytest.fixture
+def routed_app(db_path):
+    """An app on a WAL database that serves reads from a mode=ro engine."""
+    return make_app(db_path, DATABASE_PROFILE='production')
+
+@pytest.fixture
+def replica_app(db_path):
+    """An app reading from a replica that is a stale copy of the primary."""
+    replica_path = db_path.replace('primary', 'replica')
+    app = make_app(db_path, DATABASE_READ_URL=f'sqlite:///{replica_path}',
+                   CATALOG_CACHE_ENABLED=False)
+    shutil.copy(db_path, replica_path)
+    return app
+
+@pytest.fixture
+def free_checkout(monkeypatch):
+    monkeypatch.setattr(PaymentProcessor, 'FAILURE_RATE', 0)
+    monkeypatch.setattr('app.time.sleep', lambda seconds: None)
+
+def engine_statements(app):
+    """Statements per engine, recorded until the end of the test."""
+    with app.app_context():
+        engines = {'primary': db.engine, 'read': get_read_engine()}
+    recorded = {name: [] for name in engines}
+    for name, engine in engines.items():
+        event.listen(engine, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args, name=name: recorded[name].append(statement))
+    return recorded
+
+def stock_seen(client, headers=None):
+    return json.loads(client.get('/api/products/1', headers=headers).data)['stock_quantity']
+
+class TestReadOnlyEngine:
+    def test_disabled_by_default_outside_production(self, app):
+        """Test the development profile keeps every query on the primary"""
+        with app.app_context():
+            assert get_read_engine() is None
+
+    def test_catalog_reads_use_read_engine(self, routed_app):
+        """Test catalog and order GETs, signed in or not, issue no statements on the primary"""
+        with routed_app.app_context():
+            signed_in = {'Authorization': f"Bearer {generate_token(1, 'reader@example.com')}"}
+        statements = engine_statements(routed_app)
+        client = routed_app.test_client()
+        for url in ('/api/products', '/api/products/1', '/api/categories?counts=1',
+                    '/api/orders/QC-missing'):
+            assert client.get(url).status_code in (200, 404)
+            assert client.get(url, headers=signed_in).status_code in (200, 404)
+        assert statements['read']
+        assert statements['primary'] == []
+
+    def test_read_engine_cannot_write(self, routed_app):
+        """Test the read engine's connections are opened read-only"""
+        with routed_app.app_context():
+            with get_read_engine().connect() as connection:
+                with pytest.raises(OperationalError, match='readonly'):
+                    connection.execute(text('UPDATE products SET stock_quantity = 0'))
+
+    def test_writes_go_to_primary_and_are_read_back(self, routed_app, free_checkout, checkout):
+        """Test checkout writes to the primary and the next read sees it"""
+        statements = engine_statements(routed_app)
+        client = routed_app.test_client()
+        assert stock_seen(client) == 10
+
+        response = checkout(client)
+        assert response.status_code == 201
+        assert any(s.startswith('UPDATE products') for s in statements['primary'])
+        assert not any(s.startswith(('INSERT', 'UPDATE')) for s in statements['read'])
+
+        assert stock_seen(client) == 8
+        order_number = json.loads(response.data)['order_number']
+        assert client.get(f'/api/orders/{order_number}').status_code == 200
+
+    def test_reads_do_not_wait_for_writer(self, routed_app):
+        """Test catalog reads complete while a write transaction holds the lock"""
+        with routed_app.app_context():
+            engine = db.engine
+        with engine.connect() as writer:
+            writer.exec_driver_sql('BEGIN IMMEDIATE')
+            writer.exec_driver_sql('UPDATE products SET stock_quantity = 0 WHERE id = 1')
+
+            results = []
+            reader = threading.Thread(target=lambda: results.append(
+                stock_seen(routed_app.test_client())))
+            reader.start()
+            reader.join(timeout=2)
+            assert results == [10]
+            writer.rollback()
+
+class TestReplicaReads:
+    def test_reads_come_from_replica(self, replica_app):
+        """Test a client that has not written reads the replica's copy"""
+        with replica_app.app_context():
+            db.session.get(Product, 1).stock_quantity = 3
+            db.session.commit()
+        assert stock_seen(replica_app.test_client()) == 10
+
+    def test_writer_reads_its_writes(self, replica_app, free_checkout, checkout):
+        """Test a client's reads after a write are served by the primary"""
+        client = replica_app.test_client()
+        response = checkout(client)
+        assert response.status_code == 201
+        assert PRIMARY_UNTIL_COOKIE in response.headers['Set-Cookie']
+        assert stock_seen(client) == 8
+
+        # Other clients keep reading the lagging replica
+        assert stock_seen(replica_app.test_client()) == 10
+
+    def test_missing_row_is_retried_on_primary(self, replica_app, free_checkout, checkout):
+        """Test an order not yet on the replica is found on the primary"""
+        response = checkout(replica_app.test_client())
+        order_number = json.loads(response.data)['order_number']
+
+        response = replica_app.test_client().get(f'/api/orders/{order_number}')
+        assert response.status_code == 200
+        assert json.loads(response.data)['order_number'] == order_number
+
+    def test_signed_in_user_reads_writes_without_cookie(self, replica_app, free_checkout, checkout):
+        """Test a user's window holds on clients that never send the cookie back"""
+        with replica_app.app_context():
+            user = User(email='reader@example.com', first_name='Read', last_name='Writes')
+            user.set_password('password123')
+            db.session.add(user)
+            db.session.commit()
+            headers = {'Authorization': f'Bearer {generate_token(user.id, user.email)}'}
+
+        assert checkout(replica_app.test_client(use_cookies=False), headers=headers).status_code == 201
+        assert stock_seen(replica_app.test_client(use_cookies=False), headers=headers) == 8
+
+        # Anonymous clients keep reading the lagging replica
+        assert stock_seen(replica_app.test_client(use_cookies=False)) == 10
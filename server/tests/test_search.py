@@ -0,0 +1,81 @@
+import pytest
+import json
+from models import Product
+from app import db
+from search import build_match_expression, search_available
+
+@pytest.fixture
+def search_products(app):
+    """Create products with overlapping names and descriptions."""
+    with app.app_context():
+        products = [
+            Product(name='Wireless Headphones', description='Over-ear noise cancelling',
+                    price=99.99, category='electronics', stock_quantity=5),
+            Product(name='Headphone Stand', description='Aluminium stand for wireless sets',
+                    price=19.99, category='home', stock_quantity=5),
+            Product(name='Coffee Mug', description='Ceramic mug',
+                    price=9.99, category='home', stock_quantity=5),
+        ]
+        db.session.add_all(products)
+        db.session.commit()
+
+class TestSearchIndex:
+    def test_index_created_with_schema(self, app):
+        """Test create_all builds the FTS index"""
+        with app.app_context():
+            assert search_available() is True
+
+    def test_match_expression_prefixes_each_word(self):
+        """Test free text becomes prefix terms without FTS syntax"""
+        assert build_match_expression('wire head') == '"wire"* "head"*'
+        assert build_match_expression('"OR NEAR(') == '"OR"* "NEAR"*'
+        assert build_match_expression('!!!') is None
+
+class TestProductSearchAPI:
+    def test_search_prefix_match(self, client, search_products):
+        """Test partial words match products"""
+        response = client.get('/api/products?search=headph')
+        data = json.loads(response.data)
+        names = [product['name'] for product in data['products']]
+        assert set(names) == {'Wireless Headphones', 'Headphone Stand'}
+        assert data['total'] == 2
+
+    def test_search_ranks_name_matches_first(self, client, search_products):
+        """Test name matches outrank description matches"""
+        response = client.get('/api/products?search=wireless')
+        data = json.loads(response.data)
+        names = [product['name'] for product in data['products']]
+        assert names == ['Wireless Headphones', 'Headphone Stand']
+
+    def test_search_with_category_and_pagination(self, client, search_products):
+        """Test search composes with the category filter and pagination"""
+        response = client.get('/api/products?search=headphone&category=home&per_page=1')
+        data = json.loads(response.data)
+        assert [product['name'] for product in data['products']] == ['Headphone Stand']
+        assert data['total'] == 1
+        assert data['pages'] == 1
+
+    def test_search_follows_product_updates(self, app, client, search_products):
+        """Test renamed products are re-indexed"""
+        with app.app_context():
+            product = Product.query.filter_by(name='Coffee Mug').first()
+            product.name = 'Espresso Cup'
+            db.session.commit()
+
+        assert json.loads(client.get('/api/products?search=mug').data)['total'] == 1
+        assert json.loads(client.get('/api/products?search=espresso').data)['total'] == 1
+        assert json.loads(client.get('/api/products?search=coffee').data)['total'] == 0
+
+    def test_search_without_words_returns_nothing(self, client, search_products):
+        """Test punctuation-only searches match nothing"""
+        response = client.get('/api/products?search=%25%25')
+        assert response.status_code == 200
+        assert json.loads(response.data)['products'] == []
+
+    def test_search_with_cursor_pages(self, client, search_products):
+        """Test search results can be paged by cursor"""
+        data = json.loads(client.get('/api/products?search=headphone&per_page=1&after=').data)
+        assert [product['name'] for product in data['products']] == ['Wireless Headphones']
+        data = json.loads(client.get(f"/api/products?search=headphone&per_page=1&after={data['next_cursor']}").data)
+        assert [product['name'] for product in data['products']] == ['Headphone Stand']
+        assert data['has_more'] is False
@@ -0,0 +1,80 @@
+import pytest
+import json
+import sqlite3
+from models import db, Product
+from app import create_app
+from cache import get_catalog_cache
+from serialization import encode_with_fragments, product_fragment
+
+class TestJSONProvider:
+    @pytest.mark.parametrize('backend', ['stdlib', 'orjson'])
+    def test_backends_produce_the_same_listing(self, app, backend, sample_products):
+        """Test both backends encode catalog responses identically"""
+        other = create_app({
+            'TESTING': True,
+            'SQLALCHEMY_DATABASE_URI': app.config['SQLALCHEMY_DATABASE_URI'],
+            'JSON_BACKEND': backend,
+        })
+        expected = json.loads(app.test_client().get('/api/products').data)
+
+        response = other.test_client().get('/api/products')
+
+        assert response.mimetype == 'application/json'
+        assert json.loads(response.data) == expected
+
+    def test_request_bodies_are_parsed(self, client, sample_products):
+        """Test incoming JSON still decodes through the provider"""
+        response = client.post('/api/cart/validate',
+                               data=json.dumps({'items': [{'product_id': 1, 'quantity': 1}]}),
+                               content_type='application/json')
+        assert json.loads(response.data)['valid'] is True
+
+    def test_invalid_json_is_rejected(self, client):
+        """Test malformed bodies fail as bad requests"""
+        response = client.post('/api/checkout', data='{not json',
+                               content_type='application/json')
+        assert response.status_code == 400
+
+class TestProductFragments:
+    def test_splices_fragments_into_envelope(self, app):
+        """Test pre-encoded items land inside the list"""
+        with app.app_context():
+            body = encode_with_fragments({'total': 2, 'pages': 1}, 'products', [b'{"id":1}', b'{"id":2}'])
+        assert json.loads(body) == {'pages': 1, 'products': [{'id': 1}, {'id': 2}], 'total': 2}
+
+    def test_fragment_is_reused_until_row_changes(self, app, sample_products):
+        """Test encoding happens once per product version, even across workers"""
+        calls = []
+        with app.app_context():
+            cache = get_catalog_cache()
+            product = db.session.get(Product, 1)
+            encode = lambda: calls.append(1) or json.dumps(product.to_dict()).encode()
+
+            cache.product_fragment(product, encode)
+            cache.product_fragment(product, encode)
+            assert len(calls) == 1
+
+            conn = sqlite3.connect(app.config['DATABASE'])
+            conn.execute('UPDATE products SET stock_quantity = 0 WHERE id = 1')
+            conn.commit()
+            conn.close()
+
+            db.session.expire_all()
+            product = db.session.get(Product, 1)
+            fragment = product_fragment(product)
+            assert json.loads(fragment)['available'] is False
+
+    def test_listing_reflects_external_stock_change(self, app, client, sample_products):
+        """Test a rebuilt listing never serves a stale fragment"""
+        client.get('/api/products')
+
+        conn = sqlite3.connect(app.config['DATABASE'])
+        conn.execute('UPDATE products SET stock_quantity = 0 WHERE id = 2')
+        conn.execute('UPDATE catalog_state SET version = version + 1')
+        conn.commit()
+        conn.close()
+        with app.app_context():
+            get_catalog_cache().listings.clear()
+
+        data = json.loads(client.get('/api/products').data)
+        assert [p['stock_quantity'] for p in data['products']] == [10, 0]